@@ -0,0 +1,48 @@
+# Copyright (C) 2024 aherve4
+# Licensed under the GNU GPL v3.0
+
+"""Compares the distance backends on IGC files: time per call, and observed error
+against the geodesic next to each backend's error bound.
+
+    python benchmarks/distance_backends.py tests/Data/track1.igc [more files or folders]
+"""
+
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hfk import TrackCollection
+from hfk.domain.distance import benchmark
+
+parser = argparse.ArgumentParser(description="Benchmark of the distance backends")
+parser.add_argument("target", nargs='+', help='igc file(s) or folder(s)')
+parser.add_argument("-r", "--repeat", type=int, default=5, help="timed runs per backend (best is kept)")
+args = parser.parse_args()
+
+collection = TrackCollection(lazy=True)
+collection.load_files(args.target, lazy=True)
+
+totals = {}
+fixes = 0
+for path in collection.file_paths:
+    track = collection.get_track(path)
+    if track is None or len(track) < 2:
+        continue
+    fixes += len(track)
+    # One run per track, as the planar backend projects each track on its own
+    for name, result in benchmark(track.column("Lat"), track.column("Long"), repeat=args.repeat).items():
+        total = totals.setdefault(name, dict.fromkeys(result, 0.0))
+        total["seconds"] += result["seconds"]
+        for key in ("max_abs_error_m", "max_rel_error", "error_bound"):
+            total[key] = max(total[key], result[key])
+
+if not totals:
+    sys.exit("No fixes found")
+
+print(f"{len(collection.file_paths)} file(s), {fixes} fixes")
+print(f"{'backend':<10} {'time (ms)':>10} {'max abs err (m)':>16} {'max rel err':>12} {'bound':>12}")
+for name, result in totals.items():
+    print(f"{name:<10} {result['seconds'] * 1000:>10.2f} {result['max_abs_error_m']:>16.3e} "
+          f"{result['max_rel_error']:>12.3e} {result['error_bound']:>12.3e}")
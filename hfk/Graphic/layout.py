@@ -28,7 +28,8 @@ def create_stats_card(title, rate_stats, elev_stats, unit="m/h"):
             # Rate Column
             html.Div([
                 html.Strong(f"Rate ({unit}):"),
-                html.P(f"Min: {rate_stats['min']} | Avg: {rate_stats['avg']} | Max: {rate_stats['max']}", className="mb-1 small")
+                html.P(f"Min: {rate_stats['min']} | Avg: {rate_stats['avg']} | Max: {rate_stats['max']}", className="mb-0 small"),
+                html.P(f"P10: {rate_stats['p10']} | Median: {rate_stats['median']} | P90: {rate_stats['p90']}", className="mb-1 small text-muted")
             ], className="mb-2"),
             # Elevation Column
             html.Div([
@@ -232,56 +233,127 @@ def create_summary_content(stats):
         ])
     ])
 
-def get_global_page_layout(service, visualizer):
-    files_list = list(service.tracks.keys())
-    # Initially all checked
-    
-    file_list_group = dbc.ListGroup(
-        [
-            dbc.ListGroupItem(
-                dbc.Row([
-                    dbc.Col([
-                        html.Div(style={
-                            "backgroundColor": service.get_file_color(f), 
-                            "width": "15px", 
-                            "height": "15px", 
-                            "marginRight": "10px", 
-                            "borderRadius": "3px",
-                            "flexShrink": 0
-                        }),
-                        dbc.Checkbox(
-                            id={'type': 'file-check', 'index': f},
-                            label=f" {os.path.basename(f)}",
-                            value=True,
-                            style={"display": "flex", "alignItems": "center", "flexGrow": 1}
+def format_header_date(header):
+    if header is None or header.date is None:
+        return ""
+    return header.date.strftime("%Y-%m-%d")
+
+# Files shown per page of the file list
+FILES_PER_PAGE = 20
+# Selection of the file list: every file ("all") except the ids in "toggled", or only them
+DEFAULT_SELECTION = {"all": True, "toggled": []}
+
+def compact_selection(service, bAll, toggled):
+    """Selection state for `bAll` and the toggled file ids, flipped to the complement when
+    more than half of the files are toggled so "toggled" stays under half the collection."""
+    toggled = set(toggled)
+    if 2 * len(toggled) > len(service.file_ids):
+        bAll = not bAll
+        toggled = set(service.file_ids.values()) - toggled
+    return {"all": bool(bAll), "toggled": sorted(toggled)}
+
+def is_file_selected(service, selection, file_path):
+    return bool(selection["all"]) != (service.file_ids[file_path] in selection["toggled"])
+
+def get_selected_files(service, selection):
+    """Paths of the selected files, decoded from the compact selection state."""
+    selection = selection or DEFAULT_SELECTION
+    toggled = set(selection["toggled"])
+    return [path for path, file_id in service.file_ids.items() if bool(selection["all"]) != (file_id in toggled)]
+
+def create_file_list_items(service, paths, selection):
+    """One page of the file list."""
+    selection = selection or DEFAULT_SELECTION
+    return [
+        dbc.ListGroupItem(
+            dbc.Row([
+                dbc.Col([
+                    html.Div(style={
+                        "backgroundColor": service.get_file_color(f), 
+                        "width": "15px", 
+                        "height": "15px", 
+                        "marginRight": "10px", 
+                        "borderRadius": "3px",
+                        "flexShrink": 0
+                    }),
+                    dbc.Checkbox(
+                        id={'type': 'file-check', 'index': f},
+                        label=f" {os.path.basename(f)}",
+                        value=is_file_selected(service, selection, f),
+                        style={"display": "flex", "alignItems": "center", "flexGrow": 1}
+                    ),
+                    html.Small(format_header_date(service.get_header(f)), className="text-muted ms-2")
+                ], width=9, className="d-flex align-items-center"),
+                dbc.Col(
+                    dbc.ButtonGroup([
+                        dbc.Button(
+                            html.I(className="fas fa-crosshairs"),
+                            id={'type': 'file-focus-btn', 'index': f},
+                            color="secondary",
+                            size="sm",
+                            title="Focus Map"
+                        ),
+                        dbc.Button(
+                            html.I(className="fas fa-chart-line"),
+                            id={'type': 'file-view-btn', 'index': f},
+                            color="primary",
+                            size="sm",
+                            title="Analyze File"
                         )
-                    ], width=9, className="d-flex align-items-center"),
-                    dbc.Col(
-                        dbc.ButtonGroup([
-                            dbc.Button(
-                                html.I(className="fas fa-crosshairs"),
-                                id={'type': 'file-focus-btn', 'index': f},
-                                color="secondary",
-                                size="sm",
-                                title="Focus Map"
-                            ),
-                            dbc.Button(
-                                html.I(className="fas fa-chart-line"),
-                                id={'type': 'file-view-btn', 'index': f},
-                                color="primary",
-                                size="sm",
-                                title="Analyze File"
-                            )
-                        ], className="float-end"),
-                        width=3
-                    )
-                ], className="align-items-center"),
-                key=f
-            ) for f in files_list
-        ],
-        flush=True,
-        className="mb-4"
-    )
+                    ], className="float-end"),
+                    width=3
+                )
+            ], className="align-items-center"),
+            key=f
+        ) for f in paths
+    ]
+
+def page_count(n_files):
+    return max(1, -(-n_files // FILES_PER_PAGE))
+
+def create_file_browser(service):
+    """Search, filters and the first page of the file list; other pages are rendered
+    by the server on demand."""
+    paths = service.find_files()
+    return html.Div([
+        dbc.Input(id="file-search", type="search", placeholder="Search files...", debounce=True, size="sm", className="mb-2"),
+        dbc.Row([
+            dbc.Col(dcc.Dropdown(
+                id="file-type-filter", placeholder="All types", clearable=True,
+                options=[{"label": "Hike & Fly", "value": "hike_and_fly"}, {"label": "Fly Only", "value": "fly_only"},
+                         {"label": "Walk Only", "value": "walk_only"}]
+            ), width=6),
+            dbc.Col(dcc.Dropdown(
+                id="file-sort", clearable=False, value="date",
+                options=[{"label": "Date", "value": "date"}, {"label": "Latest first", "value": "-date"},
+                         {"label": "Name", "value": "name"}, {"label": "Most D+", "value": "-d_plus"}]
+            ), width=6),
+        ], className="g-2 mb-2"),
+        dbc.Row([
+            dbc.Col(dcc.DatePickerRange(id="file-date-filter", clearable=True, display_format="YYYY-MM-DD"), width=8),
+            dbc.Col(dbc.Input(id="file-min-dplus", type="number", min=0, placeholder="Min D+", debounce=True, size="sm"), width=4),
+        ], className="g-2 mb-2"),
+        dbc.ButtonGroup([
+            dbc.Button("All", id="file-select-all", color="light", size="sm"),
+            dbc.Button("None", id="file-select-none", color="light", size="sm"),
+        ], className="mb-2"),
+        html.Small(f"{len(paths)} files", id="file-list-count", className="text-muted ms-2"),
+        dbc.ListGroup(create_file_list_items(service, paths[:FILES_PER_PAGE], DEFAULT_SELECTION), id="file-list", flush=True, className="mb-2"),
+        dbc.Pagination(id="file-list-page", active_page=1, max_value=page_count(len(paths)), fully_expanded=False, size="sm"),
+        # Selected files, as one compact state (see get_selected_files)
+        dcc.Store(id="file-selection-store", data=DEFAULT_SELECTION),
+    ])
+
+def get_global_page_layout(service, visualizer):
+    # Only header facts are needed for the file list, so lazily indexed files are not parsed
+    file_browser = create_file_browser(service)
+
+    # Sent with the files already loaded; the map is completed by a callback once the page
+    # shows (see complete_global_map), and checking files only updates it in the browser
+    global_map = visualizer.get_global_map_figure(loaded_only=True)
+    mapbox = global_map["layout"]["mapbox"]
+    map_view = {"zoom": mapbox["zoom"], "center": mapbox["center"], "focus": None, "focus_trace": len(global_map["data"]) - 1,
+                "complete": all(service.is_loaded(file_path) for file_path in service.file_paths)}
 
     return dbc.Container([
         html.H3([html.I(className="fas fa-globe me-2"), "Global Analysis"], className="mb-3"),
@@ -291,7 +363,7 @@ def get_global_page_layout(service, visualizer):
             dbc.Col([
                 dbc.Card([
                     dbc.CardHeader([html.I(className="fas fa-folder-open me-2"), "Loaded Files"], className="bg-light"),
-                    dbc.CardBody(file_list_group, style={"maxHeight": "600px", "overflowY": "auto"})
+                    dbc.CardBody(file_browser)
                 ], className="shadow-sm")
             ], width=12, lg=3),
             
@@ -301,8 +373,10 @@ def get_global_page_layout(service, visualizer):
                 dbc.Card([
                     dbc.CardHeader([html.I(className="fas fa-map-marked-alt me-2"), "Global Map (Selected Files)"]),
                     dbc.CardBody(
-                        dcc.Graph(id='global-map-graph', style={"height": "400px"}, config={'scrollZoom': True})
-                    )
+                        dcc.Graph(id='global-map-graph', figure=global_map, style={"height": "400px"}, config={'scrollZoom': True})
+                    ),
+                    # Zoom, centre and focus of the map, to redraw it at another level of detail
+                    dcc.Store(id='map-view-store', data=map_view)
                 ], className="mb-4 shadow-sm"),
                 
                 # Mode Tabs
@@ -312,14 +386,43 @@ def get_global_page_layout(service, visualizer):
                 ], id="global-view-tabs", active_tab="summary", className="mb-3"),
 
                 # Global Stats Cards Placeholder (Content populated by callback)
+                create_job_progress("global-stats"),
+                # Set when the dashboard bundle of the selection is built by a background job
+                dcc.Store(id='dashboard-job'),
                 html.Div(id='global-stats-container')
                 
             ], width=12, lg=9)
         ])
     ], fluid=True)
 
-def get_file_page_layout(service, visualizer, file_path):
+def create_job_progress(prefix):
+    """Progress bar and cancel button of a background view, shown while its job runs."""
+    return html.Div([
+        dbc.Progress(id=f"{prefix}-progress", value=0, striped=True, animated=True, className="flex-grow-1 me-2"),
+        dbc.Button([html.I(className="fas fa-times me-1"), "Cancel"], id=f"{prefix}-cancel", color="outline-danger", size="sm"),
+    ], id=f"{prefix}-job", className="align-items-center mb-3", style={"display": "none"})
+
+def get_file_page_shell(service, file_path):
+    """File page placeholder, filled in by a (background) callback from `file-page-request`."""
+    return dbc.Container([
+        create_job_progress("file-page"),
+        dcc.Store(id="file-page-request", data=list(service.view_key(file_path))),
+        # Set when the page is not cached and is built by a background job
+        dcc.Store(id="file-page-job"),
+        html.Div(dbc.Spinner(color="primary"), id="file-page-content", className="text-center"),
+    ], fluid=True)
+
+def get_file_page_layout(service, visualizer, file_path, progress=None):
+    """Content of the file page; `progress(done, total)` is called as its parts are built."""
+    report = progress or (lambda done, total: None)
     stats = service.get_global_stats(file_path)
+    report(1, 4)
+    map_figure = visualizer.get_map_figure(focus_gps=file_path, files_filter=[file_path], color_phases=True)
+    report(2, 4)
+    profile_figure = visualizer.get_altitude_profile_figure(file_path)
+    report(3, 4)
+    phase_details = visualizer.get_file_phases_details(file_path)
+    report(4, 4)
     file_name = os.path.basename(file_path)
     
     # Elevation content
@@ -371,7 +474,7 @@ def get_file_page_layout(service, visualizer, file_path):
                     dbc.CardBody(
                         dcc.Graph(
                             id={'type': 'file-map', 'index': file_path},
-                            figure=visualizer.get_map_figure(focus_gps=file_path, files_filter=[file_path], color_phases=True),
+                            figure=map_figure,
                             style={"height": "400px"}
                         )
                     )
@@ -387,7 +490,7 @@ def get_file_page_layout(service, visualizer, file_path):
                     dbc.CardBody(
                         dcc.Graph(
                             id={'type': 'file-alt-profile', 'index': file_path},
-                            figure=visualizer.get_altitude_profile_figure(file_path),
+                            figure=profile_figure,
                             style={"height": "300px"}
                         )
                     )
@@ -399,7 +502,7 @@ def get_file_page_layout(service, visualizer, file_path):
         html.H4([html.I(className="fas fa-list-ul me-2"), "Phase-by-Phase Details"], className="mt-4 mb-3 border-bottom pb-2"),
         dbc.Row([
             dbc.Col(create_phase_section(phase), width=12, md=6, lg=4)
-            for phase in visualizer.get_file_phases_details(file_path)
+            for phase in phase_details
         ])
 
     ], fluid=True)
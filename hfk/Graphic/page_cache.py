@@ -0,0 +1,113 @@
+# Copyright (C) 2024 aherve4
+# Licensed under the GNU GPL v3.0
+
+import json
+import logging
+import threading
+import plotly.utils
+from hfk.Graphic.layout import get_file_page_layout
+from hfk.application.collection_service import reset_locks_after_fork
+
+class FilePageCache:
+    """Bounded LRU of rendered file pages, keyed by the file's `view_key` (path, mtime and
+    analysis parameters), so a page is rebuilt only when one of them changes.
+
+    Pages are kept serialized (plain JSON data, as sent to the browser) and shared
+    between requests: do not modify them. `hits` and `misses` count the lookups, and
+    `warmed` the pages rendered by `warm_up`, which are not lookups.
+
+    Pages rendered in other processes (background jobs) reach the LRU through `shared`, a
+    `diskcache.Cache` they are also stored in: `lookup` falls back to it before counting
+    a miss.
+    """
+
+    def __init__(self, service, visualizer, capacity: int = 32, shared=None, expire=7 * 24 * 3600):
+        self.service = service
+        self.visualizer = visualizer
+        self.capacity = capacity
+        self.shared = shared
+        self.expire = expire
+        self.hits = 0
+        self.misses = 0
+        self.warmed = 0
+        # Pages by view key, least recently used first
+        self._pages = {}
+        self._lock = threading.Lock()
+        reset_locks_after_fork(self)
+
+    def _reset_locks(self):
+        self._lock = threading.Lock()
+
+    def lookup(self, file_path):
+        """Page of a file if it is cached, here or in `shared`, else None (a miss)."""
+        key = self.service.view_key(file_path)
+        with self._lock:
+            page = self._pages.pop(key, None)
+        if page is None and self.shared is not None:
+            page = self.shared.get(("file-page",) + key)
+        with self._lock:
+            if page is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._store(key, page)
+        return page
+
+    def render(self, file_path, progress=None):
+        """Builds and caches the page of a file, without looking it up first;
+        `progress(done, total)` is called while it is built (see `get_file_page_layout`)."""
+        key = self.service.view_key(file_path)
+        # Page builds fill the visualizer's and the tracks' caches
+        with self.visualizer.lock:
+            page = json.loads(json.dumps(get_file_page_layout(self.service, self.visualizer, file_path, progress=progress),
+                                         cls=plotly.utils.PlotlyJSONEncoder))
+        if self.shared is not None:
+            self.shared.set(("file-page",) + key, page, expire=self.expire)
+        with self._lock:
+            self._store(key, page)
+        return page
+
+    def get(self, file_path, progress=None):
+        """Serialized file page, rendered on a miss."""
+        page = self.lookup(file_path)
+        return page if page is not None else self.render(file_path, progress=progress)
+
+    def _store(self, key, page):
+        self._pages[key] = page
+        while len(self._pages) > self.capacity:
+            del self._pages[next(iter(self._pages))]
+
+    def warm_up(self, count: int = None) -> threading.Thread:
+        """Renders the pages of the `count` (default `capacity`) most recently registered
+        files in a background thread, which is returned. Lazily indexed files are loaded."""
+        paths = self.service.file_paths
+        count = min(self.capacity, len(paths) if count is None else count)
+        paths = paths[len(paths) - count:] if count > 0 else []
+
+        def run():
+            for path in paths:
+                try:
+                    key = self.service.view_key(path)
+                    with self._lock:
+                        cached = key in self._pages
+                    if cached or (self.shared is not None and ("file-page",) + key in self.shared):
+                        continue
+                    self.render(path)
+                    with self._lock:
+                        self.warmed += 1
+                except Exception as e:
+                    logging.error(f"Error processing {path} page: {e}")
+            logging.debug(f"File pages warmed up: {self.stats()}")
+
+        thread = threading.Thread(target=run, name="file-page-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "pages": len(self._pages), "capacity": self.capacity,
+                "hits": self.hits, "misses": self.misses, "warmed": self.warmed,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0,
+            }
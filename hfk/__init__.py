@@ -4,6 +4,7 @@
 # HikeFlyKit (hfk) - Simplified API Entry Point
 
 from .adapters.readers.igc_reader import IgcReader
+from .adapters.caches.npz_cache import NpzTrackCache
 from .application.collection_service import TrackCollectionService
 
 class TrackCollection(TrackCollectionService):
@@ -11,15 +12,22 @@ class TrackCollection(TrackCollectionService):
     Simplified entry point for HikeFlyKit.
     
     Automatically initializes with default readers and supports loading
-    files directly during instantiation.
+    files directly during instantiation. Set `workers` to parse and segment
+    the files in a process pool, and `cache_dir` to keep parsed tracks and
+    phases on disk between runs. With `lazy`, only file headers are read up
+    front and each track is parsed the first time it is needed.
+    `distance_backend` selects how distances are computed ("geodesic",
+    "haversine" or "planar").
     """
-    def __init__(self, targets=None):
+    def __init__(self, targets=None, workers=None, cache_dir=None, lazy=False, distance_backend=None):
         # Default readers (currently only IGC, but easy to add more)
         default_readers = [IgcReader()]
-        super().__init__(default_readers)
+        cache = NpzTrackCache(cache_dir) if cache_dir else None
+        analysis_params = {"distance_backend": distance_backend} if distance_backend else None
+        super().__init__(default_readers, cache=cache, analysis_params=analysis_params)
         
         if targets:
-            self.load_files(targets)
+            self.load_files(targets, workers=workers, lazy=lazy)
 
 # Public API
 __all__ = ['TrackCollection']
@@ -0,0 +1,155 @@
+# Copyright (C) 2024 aherve4
+# Licensed under the GNU GPL v3.0
+
+import os
+import glob
+import json
+import hashlib
+import logging
+import tempfile
+import numpy as np
+from typing import List, Optional, Tuple
+from ...ports.cache import TrackCache
+from ...domain.models import Track, Phase
+
+class NpzTrackCache(TrackCache):
+    """Adapter storing tracks and phases as uncompressed NumPy archives in a directory.
+
+    An entry is keyed by the file path, size and modification time (plus a hash of the
+    content when `use_content_hash` is set) and by the analysis parameters. Entries are
+    evicted least recently used first once the directory exceeds `max_bytes`; the size of
+    the directory is scanned once, then kept up to date as entries are written (entries
+    written by other processes are only counted at the next eviction).
+    """
+
+    FORMAT_VERSION = 2
+    PHASE_FIELDS = ["start", "stop", "direction", "distance", "speed_kmh", "is_flight"]
+
+    def __init__(self, directory: str, max_bytes: int = 512 * 1024 * 1024, use_content_hash: bool = False):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self.use_content_hash = use_content_hash
+        os.makedirs(self.directory, exist_ok=True)
+        # Running total of the entry sizes, None until scanned
+        self._total_bytes = None
+
+    def load(self, file_path: str, params: dict) -> Optional[Tuple[Track, List[Phase]]]:
+        entry = self._entry_path(file_path, params)
+        if entry is None or not os.path.exists(entry):
+            return None
+
+        try:
+            with np.load(entry, allow_pickle=False) as archive:
+                meta = json.loads(str(archive["meta"]))
+                columns = {"buffer": archive["buffer"], "layout": meta["layout"]}
+                summaries = [
+                    dict(zip(self.PHASE_FIELDS, values))
+                    for values in zip(*(archive[f"phase_{field}"].tolist() for field in self.PHASE_FIELDS))
+                ]
+        except Exception as e:
+            logging.warning(f"Dropping unreadable cache entry {entry}: {e}")
+            self._remove(entry)
+            self._total_bytes = None
+            return None
+
+        # Mark the entry as recently used for eviction
+        os.utime(entry)
+        track = Track.from_columns(columns, file_path=file_path)
+        return track, [Phase.from_summary(track, summary) for summary in summaries]
+
+    def store(self, file_path: str, params: dict, track: Track, phases: List[Phase]):
+        entry = self._entry_path(file_path, params)
+        if entry is None:
+            return
+
+        columns = track.to_columns()
+        summaries = [p.to_summary() for p in phases]
+        arrays = {
+            "meta": np.array(json.dumps({"file_path": file_path, "layout": columns["layout"]})),
+            "buffer": columns["buffer"],
+        }
+        for field in self.PHASE_FIELDS:
+            arrays[f"phase_{field}"] = np.array([s[field] for s in summaries])
+
+        if self._total_bytes is None:
+            self._total_bytes = self.size()
+        # Write to a temporary file first so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fFile:
+                np.savez(fFile, **arrays)
+            written = os.path.getsize(tmp_path)
+            replaced = os.path.getsize(entry) if os.path.exists(entry) else 0
+            os.replace(tmp_path, entry)
+        except Exception as e:
+            logging.warning(f"Could not write cache entry for {file_path}: {e}")
+            self._remove(tmp_path)
+            return
+
+        self._total_bytes += written - replaced
+        if self._total_bytes > self.max_bytes:
+            self._evict()
+
+    def invalidate(self, file_path: str = None):
+        pattern = f"{self._path_digest(file_path)}-*.npz" if file_path else "*.npz"
+        for entry in glob.glob(os.path.join(self.directory, pattern)):
+            self._remove(entry)
+        self._total_bytes = None
+
+    def size(self) -> int:
+        """Total size of the cache entries in bytes."""
+        return sum(os.path.getsize(p) for p in glob.glob(os.path.join(self.directory, "*.npz")))
+
+    def _entry_path(self, file_path: str, params: dict) -> Optional[str]:
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+
+        key = {
+            "version": self.FORMAT_VERSION,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "params": params,
+        }
+        if self.use_content_hash:
+            key["content"] = self._content_digest(file_path)
+
+        key_digest = hashlib.sha1(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()[:16]
+        return os.path.join(self.directory, f"{self._path_digest(file_path)}-{key_digest}.npz")
+
+    def _evict(self):
+        entries = []
+        for entry in glob.glob(os.path.join(self.directory, "*.npz")):
+            try:
+                stat = os.stat(entry)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, entry))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(entry)
+            total -= size
+        self._total_bytes = total
+
+    @staticmethod
+    def _path_digest(file_path: str) -> str:
+        return hashlib.sha1(os.path.abspath(file_path).encode()).hexdigest()[:16]
+
+    @staticmethod
+    def _content_digest(file_path: str) -> str:
+        digest = hashlib.sha1()
+        with open(file_path, "rb") as fFile:
+            for chunk in iter(lambda: fFile.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -2,28 +2,131 @@
 # Licensed under the GNU GPL v3.0
 
 import os
+import mmap
 import datetime
+import numpy as np
 import pandas as pd
 from ...ports.reader import TrackReader
-from ...domain.models import Track
+from ...domain.models import Track, TrackHeader
+
+# Resolution pandas infers for a column of datetime.datetime objects (depends on the pandas version)
+_TIME_UNIT = np.datetime_data(pd.Series([datetime.datetime(1970, 1, 1)]).dtype)[0]
+
+# Fixed-width layout of a B record: BHHMMSSDDMMmmmNDDDMMmmmEVPPPPPGGGGG
+_B_RECORD_LENGTH = 35
+_B_DIGIT_COLUMNS = np.r_[1:14, 15:23, 25:35]
+_EPOCH_DATE = datetime.date(1970, 1, 1)
+# Block size used when scanning backwards for the last B record
+_TAIL_BLOCK_SIZE = 4096
 
 class IgcReader(TrackReader):
-    """Adapter for reading IGC files."""
-    
+    """Adapter for reading IGC files.
+
+    By default B records are decoded in bulk from a memory-mapped file (fast mode).
+    Records that do not follow the fixed-width layout, and files whose layout cannot
+    be handled in bulk, go through the line-by-line parser so both modes produce the
+    same DataFrame.
+    """
+
+    def __init__(self, fast: bool = True):
+        self.fast = fast
+
     def can_handle(self, file_path: str) -> bool:
         return file_path.lower().endswith(".igc")
 
     def read(self, file_path: str) -> Track:
         if not os.access(file_path, os.R_OK):
             raise Exception(f"File {file_path} cannot be read")
-            
+
+        if self.fast:
+            track = self._read_fast(file_path)
+            if track is not None:
+                return track
+        return self._read_lines(file_path)
+
+    def read_header(self, file_path: str) -> TrackHeader:
+        """Reads the H records and the first and last B records only.
+
+        The bounding box is derived from these two fixes, so it is only indicative.
+        """
+        if not os.access(file_path, os.R_OK):
+            raise Exception(f"File {file_path} cannot be read")
+
+        flight_date = datetime.date.today()
+        has_date = False
+        pilot = None
+        glider = None
+        first_record = None
+
+        with open(file_path, "r") as fFile:
+            for line in fFile:
+                if line.startswith("HFDTE"):
+                    flight_date = self._parse_date_header(line, flight_date)
+                    has_date = True
+                elif line.startswith("HFPLT"):
+                    pilot = line.split(":", 1)[-1].strip() or None
+                elif line.startswith("HFGTY"):
+                    glider = line.split(":", 1)[-1].strip() or None
+                elif line.startswith("B"):
+                    first_record = self._parse_b_record(line, flight_date)
+                    if first_record is not None:
+                        break
+
+        if first_record is None:
+            return TrackHeader(file_path, date=flight_date if has_date else None, pilot=pilot, glider=glider)
+
+        last_record = self._read_last_b_record(file_path, flight_date) or first_record
+        lats = (first_record[3], last_record[3])
+        lons = (first_record[4], last_record[4])
+        return TrackHeader(
+            file_path, date=flight_date, pilot=pilot, glider=glider,
+            start_time=first_record[0], end_time=last_record[0],
+            bbox=(min(lats), max(lats), min(lons), max(lons))
+        )
+
+    def iter_fixes(self, lines):
+        """Yields (time, lat, lon, alt_gps, alt_pressure) for each B record of an iterable of
+        lines, e.g. a file being written by a live tracker. The flight date is taken from the
+        HFDTE header seen so far."""
+        flight_date = datetime.date.today()
+        for line in lines:
+            if isinstance(line, bytes):
+                line = line.decode("ascii", errors="replace")
+            if line.startswith("HFDTE"):
+                flight_date = self._parse_date_header(line, flight_date)
+            elif line.startswith("B"):
+                record = self._parse_b_record(line, flight_date)
+                if record is not None:
+                    oNewTime, iAltGps, iAltPressure, fLat, fLong = record
+                    yield oNewTime, fLat, fLong, iAltGps, iAltPressure
+
+    def _read_last_b_record(self, file_path: str, flight_date: datetime.date):
+        with open(file_path, "rb") as fFile:
+            position = fFile.seek(0, os.SEEK_END)
+            tail = b""
+            while position > 0:
+                step = min(_TAIL_BLOCK_SIZE, position)
+                position -= step
+                fFile.seek(position)
+                tail = fFile.read(step) + tail
+                lines = tail.splitlines()
+                # The first line of the block may be truncated unless we reached the start
+                candidates = lines if position == 0 else lines[1:]
+                for raw in reversed(candidates):
+                    if raw.startswith(b"B"):
+                        record = self._parse_b_record(raw.decode("ascii", errors="replace"), flight_date)
+                        if record is not None:
+                            return record
+                tail = lines[0] if lines and position > 0 else b""
+        return None
+
+    def _read_lines(self, file_path: str) -> Track:
+        """Reference parser: one Python conversion per B record."""
         lTime = []
         lAltPressure = []
         lAltGps = []
         lLat = []
-        fLat = ""
         lLong = []
-        fLong = ""
 
         flight_date = datetime.date.today()
 
@@ -32,56 +135,208 @@ class IgcReader(TrackReader):
             # First pass for date
             for line in lLines:
                 if line.startswith("HFDTE"):
-                    try:
-                        date_str = line[5:].strip()
-                        if ":" in date_str:
-                            date_str = date_str.split(":")[-1].strip()
-                        
-                        if len(date_str) >= 6:
-                            day = int(date_str[0:2])
-                            month = int(date_str[2:4])
-                            year_short = int(date_str[4:6])
-                            year = 2000 + year_short
-                            flight_date = datetime.date(year, month, day)
-                    except ValueError:
-                        pass
+                    flight_date = self._parse_date_header(line, flight_date)
 
                 if line.startswith("B"):
-                    try:
-                        oNewTime = datetime.datetime(
-                            flight_date.year, 
-                            flight_date.month, 
-                            flight_date.day, 
-                            int(line[1:3]), 
-                            int(line[3:5]), 
-                            int(line[5:7])
-                        )
-                        lTime.append(oNewTime)
-                        lAltGps.append(int(line[30:35]))
-                        lAltPressure.append(int(line[25:30]))
-                        
-                        fLat = float(line[7:9]) + float(line[9:11]+"."+line[11:14])/60.
-                        if line[14:15] == "S":
-                            fLat = -fLat
-                        
-                        fLong = float(line[15:18]) + float(line[18:20]+"."+line[20:23])/60.
-                        if line[23:24] == "W":
-                            fLong = -fLong
-                            
-                        lLat.append(fLat)
-                        lLong.append(fLong)
-                    except (ValueError, IndexError):
+                    record = self._parse_b_record(line, flight_date)
+                    if record is None:
                         continue
+                    oNewTime, iAltGps, iAltPressure, fLat, fLong = record
+                    lTime.append(oNewTime)
+                    lAltGps.append(iAltGps)
+                    lAltPressure.append(iAltPressure)
+                    lLat.append(fLat)
+                    lLong.append(fLong)
+
+        return self._build_track(lTime, lAltGps, lAltPressure, lLat, lLong, file_path)
+
+    def _read_fast(self, file_path: str):
+        """Bulk parser working on the raw bytes of the file.
+
+        Returns None when the file needs the line-by-line parser (non ASCII content,
+        bare carriage returns, or a date header appearing after the first B record).
+        """
+        with open(file_path, "rb") as fFile:
+            if os.fstat(fFile.fileno()).st_size == 0:
+                return self._build_track([], [], [], [], [], file_path)
+            with mmap.mmap(fFile.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                buf = np.frombuffer(mm, dtype=np.uint8)
+                try:
+                    parsed = self._decode_buffer(buf)
+                finally:
+                    # Release the exported buffer before the map is closed
+                    del buf
+
+        if parsed is None:
+            return None
+
+        flight_date, times, alt_gps, alt_pressure, lat, lon, valid, fallback = parsed
+        for row, line in fallback:
+            record = self._parse_b_record(line, flight_date)
+            if record is None:
+                valid[row] = False
+                continue
+            oNewTime, iAltGps, iAltPressure, fLat, fLong = record
+            times[row] = self._epoch_seconds(oNewTime)
+            alt_gps[row] = iAltGps
+            alt_pressure[row] = iAltPressure
+            lat[row] = fLat
+            lon[row] = fLong
 
+        if not valid.all():
+            times, alt_gps, alt_pressure = times[valid], alt_gps[valid], alt_pressure[valid]
+            lat, lon = lat[valid], lon[valid]
+
+        if len(times) == 0:
+            return self._build_track([], [], [], [], [], file_path)
+
+        time_values = times.astype("datetime64[s]").astype(f"datetime64[{_TIME_UNIT}]")
+        return self._build_track(time_values, alt_gps, alt_pressure, lat, lon, file_path)
+
+    def _decode_buffer(self, buf: np.ndarray):
+        size = len(buf)
+        if (buf >= 0x80).any():
+            return None
+
+        newlines = np.flatnonzero(buf == 10)
+        carriage_returns = np.flatnonzero(buf == 13)
+        if len(carriage_returns) and (carriage_returns[-1] + 1 >= size or (buf[carriage_returns + 1] != 10).any()):
+            return None
+
+        starts = np.concatenate(([0], newlines + 1))
+        ends = np.concatenate((newlines, [size]))
+        has_newline = np.ones(len(starts), dtype=bool)
+        has_newline[-1] = False
+        keep = starts < ends
+        starts, ends, has_newline = starts[keep], ends[keep], has_newline[keep]
+        # Text mode turns "\r\n" into "\n": drop the carriage return from the content
+        ends = ends - (buf[np.maximum(ends - 1, 0)] == 13)
+        lengths = ends - starts
+
+        first_bytes = buf[starts]
+        b_lines = np.flatnonzero(first_bytes == ord("B"))
+
+        flight_date = datetime.date.today()
+        header_lines = np.flatnonzero((first_bytes == ord("H")) & (lengths >= 5))
+        for line_no in header_lines:
+            start = starts[line_no]
+            if bytes(buf[start:start + 5]) != b"HFDTE":
+                continue
+            if len(b_lines) and line_no > b_lines[0]:
+                # The date changes between B records: keep the sequential semantics
+                return None
+            line = self._line_text(buf, starts[line_no], ends[line_no], has_newline[line_no])
+            flight_date = self._parse_date_header(line, flight_date)
+
+        n_records = len(b_lines)
+        times = np.zeros(n_records, dtype=np.int64)
+        alt_gps = np.zeros(n_records, dtype=np.int64)
+        alt_pressure = np.zeros(n_records, dtype=np.int64)
+        lat = np.zeros(n_records, dtype=np.float64)
+        lon = np.zeros(n_records, dtype=np.float64)
+        valid = np.ones(n_records, dtype=bool)
+        if n_records == 0:
+            return flight_date, times, alt_gps, alt_pressure, lat, lon, valid, []
+
+        b_starts = starts[b_lines]
+        regular = lengths[b_lines] >= _B_RECORD_LENGTH
+        rows = np.flatnonzero(regular)
+        records = buf[b_starts[rows, None] + np.arange(_B_RECORD_LENGTH)].astype(np.int64)
+        digits = records - ord("0")
+        is_regular = ((digits[:, _B_DIGIT_COLUMNS] >= 0) & (digits[:, _B_DIGIT_COLUMNS] <= 9)).all(axis=1)
+        regular[rows[~is_regular]] = False
+        rows, records, digits = rows[is_regular], records[is_regular], digits[is_regular]
+
+        def number(first, last):
+            value = np.zeros(len(digits), dtype=np.int64)
+            for col in range(first, last):
+                value = value * 10 + digits[:, col]
+            return value
+
+        hours, minutes, seconds = number(1, 3), number(3, 5), number(5, 7)
+        # Out of range times are skipped, as datetime() rejects them in the line parser
+        valid[rows] = (hours < 24) & (minutes < 60) & (seconds < 60)
+
+        day_seconds = (flight_date - _EPOCH_DATE).days * 86400
+        times[rows] = day_seconds + hours * 3600 + minutes * 60 + seconds
+
+        # Same operations as float("DD") + float("MM.mmm")/60. for bit-identical values
+        fLat = number(7, 9) + (number(9, 14) / 1000.0) / 60.
+        fLat[records[:, 14] == ord("S")] *= -1
+        fLong = number(15, 18) + (number(18, 23) / 1000.0) / 60.
+        fLong[records[:, 23] == ord("W")] *= -1
+        lat[rows] = fLat
+        lon[rows] = fLong
+        alt_pressure[rows] = number(25, 30)
+        alt_gps[rows] = number(30, 35)
+
+        fallback = [
+            (row, self._line_text(buf, starts[b_lines[row]], ends[b_lines[row]], has_newline[b_lines[row]]))
+            for row in np.flatnonzero(~regular)
+        ]
+        return flight_date, times, alt_gps, alt_pressure, lat, lon, valid, fallback
+
+    @staticmethod
+    def _line_text(buf: np.ndarray, start: int, end: int, has_newline: bool) -> str:
+        return bytes(buf[start:end]).decode("ascii") + ("\n" if has_newline else "")
+
+    @staticmethod
+    def _epoch_seconds(time: datetime.datetime) -> int:
+        return (time.date() - _EPOCH_DATE).days * 86400 + time.hour * 3600 + time.minute * 60 + time.second
+
+    @staticmethod
+    def _parse_date_header(line: str, flight_date: datetime.date) -> datetime.date:
+        try:
+            date_str = line[5:].strip()
+            if ":" in date_str:
+                date_str = date_str.split(":")[-1].strip()
+
+            if len(date_str) >= 6:
+                day = int(date_str[0:2])
+                month = int(date_str[2:4])
+                year_short = int(date_str[4:6])
+                year = 2000 + year_short
+                flight_date = datetime.date(year, month, day)
+        except ValueError:
+            pass
+        return flight_date
+
+    @staticmethod
+    def _parse_b_record(line: str, flight_date: datetime.date):
+        try:
+            oNewTime = datetime.datetime(
+                flight_date.year,
+                flight_date.month,
+                flight_date.day,
+                int(line[1:3]),
+                int(line[3:5]),
+                int(line[5:7])
+            )
+            iAltGps = int(line[30:35])
+            iAltPressure = int(line[25:30])
+
+            fLat = float(line[7:9]) + float(line[9:11]+"."+line[11:14])/60.
+            if line[14:15] == "S":
+                fLat = -fLat
+
+            fLong = float(line[15:18]) + float(line[18:20]+"."+line[20:23])/60.
+            if line[23:24] == "W":
+                fLong = -fLong
+        except (ValueError, IndexError):
+            return None
+        return oNewTime, iAltGps, iAltPressure, fLat, fLong
+
+    @staticmethod
+    def _build_track(lTime, lAltGps, lAltPressure, lLat, lLong, file_path: str) -> Track:
         oDf = pd.DataFrame({
-            "time": lTime, 
+            "time": lTime,
             "Alt_gps": lAltGps,
-            "Alt_pressure": lAltPressure, 
-            "Lat": lLat, 
+            "Alt_pressure": lAltPressure,
+            "Lat": lLat,
             "Long": lLong
         })
-        
+
         oDf.set_index("time", inplace=True)
         oDf.sort_index(inplace=True)
-        
+
         return Track(dataframe=oDf, file_path=file_path)
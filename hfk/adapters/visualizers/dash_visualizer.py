@@ -2,54 +2,161 @@
 # Licensed under the GNU GPL v3.0
 
 import os
+import math
+import itertools
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
 import plotly.graph_objects as go
 import plotly.colors
 from ...Graphic.igcgraph import IgcGraph
-from ...application.collection_service import TrackCollectionService
+from ...application.collection_service import TrackCollectionService, reset_locks_after_fork
+from ...domain.summary import FileSummary
 
 class DashVisualizer:
     """Adapter to generate Dash-compatible Plotly figures from the collection service."""
+
+    # Douglas-Peucker tolerances (m) of the map levels of detail
+    MAP_TOLERANCES = (5, 10, 25, 50, 100, 250)
+    # Points of the altitude profile (LTTB downsampled beyond that)
+    PROFILE_POINTS = 2000
+    # Selections of more files than this are drawn with merged map traces
+    MERGE_TRACES_ABOVE = 50
+    # Dashboard bundles kept, one per recent selection
+    DASHBOARD_CACHE_SIZE = 8
+    # Seconds a dashboard bundle is kept in the shared cache
+    SHARED_EXPIRE = 7 * 24 * 3600
     
-    def __init__(self, service: TrackCollectionService):
+    def __init__(self, service: TrackCollectionService, merge_traces_above: int = None, shared=None):
         self.service = service
+        # diskcache.Cache shared with background jobs, for the dashboard bundles they build
+        self.shared = shared
+        self.merge_traces_above = self.MERGE_TRACES_ABOVE if merge_traces_above is None else merge_traces_above
+        # Serialized map traces per (file, render mode, tolerance), with the track or
+        # logical phases they were built from
+        self._trace_cache = {}
+        self._map_layout = None
+        self._map_revisions = itertools.count()
+        # Held while the caches above, and the derived data of the tracks, are filled
+        self.lock = threading.RLock()
+        reset_locks_after_fork(self)
+        # Dashboard bundles by selection hash and collection state, least recently used first
+        self._bundle_cache = {}
+
+    def _reset_locks(self):
+        self.lock = threading.RLock()
 
     def get_performance_landscape_figure(self, files_filter=None, phase_type='flight', metric_type="climb"):
-        fig = IgcGraph.new_figure()
-        
-        for file_path in self.service.tracks:
-            if files_filter is not None and file_path not in files_filter:
-                continue
-            
+        selected = [file_path for file_path in self.service.file_paths
+                    if files_filter is None or file_path in files_filter]
+        series = self._landscape_series(selected, [self.service.get_logical_phases(file_path) for file_path in selected])
+        return self._landscape_figure(series[(phase_type, metric_type)], phase_type, metric_type)
+
+    def get_dashboard_bundle(self, files_filter=None, progress=None) -> dict:
+        """Everything the global dashboard shows for a selection, built in one pass over
+        its files: the summary counts and averages ("summary"), the detailed stats
+        ("collection") and the four performance landscapes ("landscapes", serialized
+        figures keyed by (phase type, metric)).
+
+        Bundles are cached by selection and `state_token` of the collection (see
+        `lookup_dashboard_bundle`), so they are rebuilt when a file is re-analysed with
+        other parameters. The returned dict is shared: do not modify it.
+        `progress(done, total)` is called as the files are read, about every 5%.
+        """
+        candidates = self._selection(files_filter)
+        bundle = self.lookup_dashboard_bundle(candidates)
+        if bundle is not None:
+            return bundle
+
+        step = max(1, len(candidates) // 20)
+        selected, sources = [], []
+        for i, file_path in enumerate(candidates):
             logical_phases = self.service.get_logical_phases(file_path)
-            target_is_f = (phase_type == 'flight')
-            
-            x_vals, y_vals, hover_text = [], [], []
-            
+            if self.service.is_loaded(file_path):
+                selected.append(file_path)
+                sources.append(logical_phases)
+            if progress is not None and ((i + 1) % step == 0 or i + 1 == len(candidates)):
+                progress(i + 1, len(candidates))
+
+        summary = FileSummary.merge(self.service.file_summaries[file_path] for file_path in selected)
+        series = self._landscape_series(selected, sources)
+        bundle = {
+            "summary": summary.summary_stats(),
+            "collection": summary.collection_stats(),
+            "landscapes": {landscape: self._landscape_figure(s, *landscape).to_dict() for landscape, s in series.items()},
+        }
+        key = self._bundle_key(candidates)
+        if self.shared is not None:
+            self.shared.set(key, bundle, expire=self.SHARED_EXPIRE)
+        with self.lock:
+            self._store_bundle(key, bundle)
+        return bundle
+
+    def lookup_dashboard_bundle(self, files_filter=None) -> dict:
+        """Cached dashboard bundle of a selection, the last `DASHBOARD_CACHE_SIZE` of them
+        here and the others in `shared` (e.g. built by background jobs), else None.
+        Files are not loaded to find it."""
+        key = self._bundle_key(self._selection(files_filter))
+        with self.lock:
+            bundle = self._bundle_cache.pop(key, None)
+        if bundle is None and self.shared is not None:
+            bundle = self.shared.get(key)
+        if bundle is not None:
+            with self.lock:
+                self._store_bundle(key, bundle)
+        return bundle
+
+    def _selection(self, files_filter) -> list:
+        if files_filter is not None:
+            files_filter = set(files_filter)
+        return [file_path for file_path in self.service.file_paths if files_filter is None or file_path in files_filter]
+
+    def _bundle_key(self, file_paths) -> tuple:
+        ids = hashlib.sha1(repr([self.service.file_ids[file_path] for file_path in file_paths]).encode()).hexdigest()
+        return ("dashboard-bundle", ids, self.service.state_token())
+
+    def _store_bundle(self, key, bundle):
+        self._bundle_cache[key] = bundle
+        while len(self._bundle_cache) > self.DASHBOARD_CACHE_SIZE:
+            del self._bundle_cache[next(iter(self._bundle_cache))]
+
+    def _landscape_series(self, file_paths, sources) -> dict:
+        """Points of the four performance landscapes, per file, from the logical phases
+        of each file (`sources`), walked once."""
+        series = {(phase_type, metric_type): [] for phase_type in ('flight', 'walk') for metric_type in ("climb", "descent")}
+        for file_path, logical_phases in zip(file_paths, sources):
+            points = {key: ([], [], []) for key in series}
             for i, lp in enumerate(logical_phases):
-                if lp.is_flight != target_is_f: continue
-                
-                rate = lp.climb_rate_val if metric_type == "climb" else lp.descent_rate_val
-                elev = lp.d_plus if metric_type == "climb" else lp.d_minus
-                
-                if rate == 0 and elev == 0: continue
-                
-                x_vals.append(rate)
-                y_vals.append(elev)
-                hover_text.append(
-                    f"File: {os.path.basename(file_path)}<br>"
-                    f"Activity: {lp.type_label} {i+1}<br>"
-                    f"Avg Rate: {rate} {'m/s' if target_is_f else 'm/h'}<br>"
-                    f"Elevation: {elev} m"
-                )
-            
-            if x_vals:
-                color = self.service.get_file_color(file_path)
-                fig.add_trace(go.Scatter(
-                    x=x_vals, y=y_vals, mode='markers',
-                    marker=dict(size=10, color=color, opacity=0.8, line=dict(width=1, color='white')),
-                    name=os.path.basename(file_path),
-                    text=hover_text, hoverinfo='text'
-                ))
+                phase_type = 'flight' if lp.is_flight else 'walk'
+                for metric_type, rate, elev in (("climb", lp.climb_rate_val, lp.d_plus),
+                                                ("descent", lp.descent_rate_val, lp.d_minus)):
+                    if rate == 0 and elev == 0: continue
+
+                    x_vals, y_vals, hover_text = points[(phase_type, metric_type)]
+                    x_vals.append(rate)
+                    y_vals.append(elev)
+                    hover_text.append(
+                        f"File: {os.path.basename(file_path)}<br>"
+                        f"Activity: {lp.type_label} {i+1}<br>"
+                        f"Avg Rate: {rate} {'m/s' if lp.is_flight else 'm/h'}<br>"
+                        f"Elevation: {elev} m"
+                    )
+            for key, (x_vals, y_vals, hover_text) in points.items():
+                if x_vals:
+                    series[key].append((file_path, x_vals, y_vals, hover_text))
+        return series
+
+    def _landscape_figure(self, series, phase_type, metric_type):
+        fig = IgcGraph.new_figure()
+        for file_path, x_vals, y_vals, hover_text in series:
+            color = self.service.get_file_color(file_path)
+            fig.add_trace(go.Scatter(
+                x=x_vals, y=y_vals, mode='markers',
+                marker=dict(size=10, color=color, opacity=0.8, line=dict(width=1, color='white')),
+                name=os.path.basename(file_path),
+                text=hover_text, hoverinfo='text'
+            ))
         
         unit = "m/s" if phase_type == 'flight' else "m/h"
         y_label = "D+ (m)" if metric_type == "climb" else "D- (m)"
@@ -61,65 +168,198 @@ class DashVisualizer:
         )
         return fig
 
-    def get_map_figure(self, focus_gps=None, files_filter=None, color_phases=False):
-        fig = IgcGraph.new_figure()
-        all_lats, all_lons = [], []
-        focus_center = None
-        
-        for file_path, track in self.service.tracks.items():
-            if files_filter is not None and file_path not in files_filter: continue
-            
-            df = track.dataframe
-            if not df.empty:
-                all_lats.extend([df['Lat'].min(), df['Lat'].max()])
-                all_lons.extend([df['Long'].min(), df['Long'].max()])
-                if file_path == focus_gps:
-                    focus_center = dict(lat=df['Lat'].iloc[0], lon=df['Long'].iloc[0])
+    @classmethod
+    def map_tolerance(cls, zoom: float, lat: float) -> float:
+        """Coarsest level of detail whose tolerance fits in one pixel at this zoom (0 for full detail)."""
+        metres_per_pixel = 156543.03 * math.cos(math.radians(lat)) / 2 ** zoom
+        return max((t for t in cls.MAP_TOLERANCES if t <= metres_per_pixel), default=0)
+
+    def get_map_figure(self, focus_gps=None, files_filter=None, color_phases=False, zoom=None, center=None,
+                       merged=None) -> dict:
+        """Map of the selected tracks, simplified for the zoom level (given, e.g. from the
+        map's relayout data, or the default one). A focused track is drawn in full detail.
+
+        The figure is a plain dict assembled from cached, already serialized traces
+        (see `get_map_traces`). With `merged`, by default when more than
+        `merge_traces_above` files are selected, the tracks of each colour are packed in
+        a single trace (see `_merge_map_traces`). The `meta` of each track trace lists its
+        files (by `file_ids`) with their range of points.
+        """
+        selected = [file_path for file_path in self.service.file_paths
+                    if (files_filter is None or file_path in files_filter) and self.service.get_track(file_path) is not None]
+        bboxes = [self.service.get_header(file_path).bbox for file_path in selected]
+        all_lats = [lat for bbox in bboxes if bbox is not None for lat in bbox[:2]]
+        all_lons = [lon for bbox in bboxes if bbox is not None for lon in bbox[2:]]
+        focus_center = self.get_focus_center(focus_gps) if focus_gps in selected else None
 
-            if color_phases and file_path == focus_gps:
-                logical_phases = self.service.get_logical_phases(file_path)
-                colors = plotly.colors.qualitative.Plotly * (len(logical_phases) // 10 + 1)
-                for i, lp in enumerate(logical_phases):
-                    plot = IgcGraph.generate_map_plot(lp.dataframe, name=f"{lp.type_label} {i+1}", color=colors[i])
-                    plot.showlegend = True
-                    fig.add_trace(plot)
-            else:
-                color = self.service.get_file_color(file_path)
-                plot = IgcGraph.generate_map_plot(df, name=os.path.basename(file_path), color=color)
-                plot.showlegend = False
-                fig.add_trace(plot)
-        
         # Center/Zoom logic
         layout_center = dict(lat=42.7952, lon=0.3272)
-        zoom = 6
+        default_zoom = 6
         if focus_center:
-            layout_center, zoom = focus_center, 13
+            layout_center, default_zoom = focus_center, 13
         elif all_lats and all_lons:
             layout_center = dict(lat=(min(all_lats)+max(all_lats))/2, lon=(min(all_lons)+max(all_lons))/2)
-            zoom = 10
+            default_zoom = 10
+        if zoom is None:
+            zoom = default_zoom
+        elif center:
+            layout_center = center
+        tolerance = self.map_tolerance(zoom, layout_center['lat'])
 
-        fig.update_layout(
-            mapbox_style="open-street-map",
-            mapbox=dict(center=go.layout.mapbox.Center(lat=layout_center['lat'], lon=layout_center['lon']), zoom=zoom),
+        if merged is None:
+            merged = len(selected) > self.merge_traces_above
+
+        data, phase_data = [], []
+        for file_path in selected:
+            if color_phases and file_path == focus_gps:
+                phase_data += self.get_map_traces(file_path, "phases")
+            else:
+                trace = self.get_map_traces(file_path, "file", 0 if file_path == focus_gps else tolerance)[0]
+                data.append(dict(trace, meta={"files": [[self.service.file_ids[file_path], 0, len(trace["lat"])]]}))
+        if merged:
+            data = self._merge_map_traces(data)
+        data += phase_data
+
+        if self._map_layout is None:
+            self._map_layout = IgcGraph.new_figure().to_dict()["layout"]
+        layout = dict(self._map_layout,
+            mapbox=dict(style="open-street-map", center=dict(lat=layout_center['lat'], lon=layout_center['lon']), zoom=zoom),
             margin={"r":0,"t":0,"l":0,"b":0}
         )
+        return {"data": data, "layout": layout}
+
+    def get_global_map_figure(self, focus_gps=None, zoom=None, center=None, loaded_only=False) -> dict:
+        """Map of every file for the global page, sent to the browser once; with
+        `loaded_only`, of the files already loaded, so lazily indexed files are not parsed.
+
+        Selecting files only changes the visibility of their points, in the browser:
+        `layout.meta` holds the extents of the files by id, and trace uids change with every
+        figure so the browser can tell its copies of the points apart. The last trace is
+        the focused file in full detail (see `get_focus_trace`), empty without focus.
+        """
+        if focus_gps is not None and zoom is None:
+            zoom, center = 13, self.get_focus_center(focus_gps)
+        files_filter = [file_path for file_path in self.service.file_paths if self.service.is_loaded(file_path)] if loaded_only else None
+        fig = self.get_map_figure(files_filter=files_filter, zoom=zoom, center=center)
+
+        focus = self.get_focus_trace(focus_gps) if focus_gps is not None else None
+        if focus is None:
+            focus = {"type": "scattermapbox", "lat": [], "lon": [], "showlegend": False, "meta": {"focus": None}}
+        revision = next(self._map_revisions)
+        fig["data"] = [dict(trace, uid=f"{revision}-{i}") for i, trace in enumerate(fig["data"] + [focus])]
+        fig["layout"]["meta"] = {
+            "extents": [[self.service.file_ids[file_path], self.service.get_header(file_path).bbox]
+                        for file_path in self.service.file_paths if self.service.is_loaded(file_path)]
+        }
+        fig["layout"]["uirevision"] = "global-map"
         return fig
 
-    def get_altitude_profile_figure(self, file_path):
+    def get_focus_center(self, file_path) -> dict:
+        """First fix of a track, where the map centres when the track is focused."""
+        track = self.service.get_track(file_path)
+        if track is None or track.empty:
+            return None
+        return dict(lat=float(track.column('Lat')[0]), lon=float(track.column('Long')[0]))
+
+    def get_focus_trace(self, file_path) -> dict:
+        """Full detail trace of a focused file, drawn over the global map."""
+        traces = self.get_map_traces(file_path, "file", 0) if self.service.get_track(file_path) is not None else []
+        if not traces:
+            return None
+        return dict(traces[0], meta={"focus": self.service.file_ids[file_path]})
+
+    def get_map_traces(self, file_path, mode="file", tolerance=0) -> list:
+        """Serialized map traces of one file: the whole track in its colour ("file"), or
+        one trace per logical phase ("phases"). Built once per tolerance, and again only
+        when the file is re-analysed. The returned dicts are shared: do not modify them."""
+        source = self.service.get_logical_phases(file_path) if mode == "phases" else self.service.get_track(file_path)
+        with self.lock:
+            key = (file_path, mode, tolerance)
+            cached = self._trace_cache.get(key)
+            if cached is None or cached[0] is not source:
+                cached = (source, [plot.to_plotly_json() for plot in self._build_map_traces(file_path, source, mode, tolerance)])
+                self._trace_cache[key] = cached
+            return cached[1]
+
+    @staticmethod
+    def _merge_map_traces(traces: list) -> list:
+        """Packs the traces of each colour into one, the tracks separated by NaN (drawn as
+        gaps). Each point carries its track's name in `customdata` for the hover label."""
+        groups = {}
+        for trace in traces:
+            groups.setdefault(trace["line"]["color"], []).append(trace)
+
+        merged = []
+        for color, group in groups.items():
+            lat = np.concatenate([np.append(np.asarray(t["lat"], dtype=float), np.nan) for t in group])
+            lon = np.concatenate([np.append(np.asarray(t["lon"], dtype=float), np.nan) for t in group])
+            names = np.concatenate([np.repeat(t["name"], len(t["lat"]) + 1) for t in group])
+            files, offset = [], 0
+            for t in group:
+                for file_id, start, stop in t.get("meta", {}).get("files", []):
+                    files.append([file_id, offset + start, offset + stop])
+                offset += len(t["lat"]) + 1
+            merged.append(dict(group[0], lat=lat, lon=lon, customdata=names, name=f"{len(group)} tracks",
+                               hovertemplate="<b>%{customdata}</b><extra></extra>", meta={"files": files}))
+        return merged
+
+    def _build_map_traces(self, file_path, source, mode, tolerance) -> list:
+        if mode == "phases":
+            colors = plotly.colors.qualitative.Plotly * (len(source) // 10 + 1)
+            plots = []
+            for i, lp in enumerate(source):
+                plot = IgcGraph.generate_map_plot(lp.dataframe, name=f"{lp.type_label} {i+1}", color=colors[i])
+                plot.showlegend = True
+                plots.append(plot)
+            return plots
+
+        color = self.service.get_file_color(file_path)
+        plot = IgcGraph.generate_map_plot(source.to_dataframe(source.simplified_rows(tolerance)), name=os.path.basename(file_path), color=color)
+        plot.showlegend = False
+        return [plot]
+
+    def get_altitude_profile_figure(self, file_path, window=None):
+        """Altitude of each logical phase, downsampled to about `PROFILE_POINTS` points.
+
+        With a time `window` (start, end), e.g. the x range of a zoom, only that part of
+        the track is drawn, at full resolution when it fits in `PROFILE_POINTS`.
+        """
         fig = IgcGraph.new_figure()
-        if file_path in self.service.tracks:
+        track = self.service.get_track(file_path)
+        if track is not None:
+            if window is None:
+                with self.lock:
+                    rows = track.downsampled_rows(self.PROFILE_POINTS)
+            else:
+                start, end = (pd.Timestamp(t) for t in window)
+                if not track.empty and track.timestamp(0).tz is not None:
+                    start, end = start.tz_localize(track.timestamp(0).tz), end.tz_localize(track.timestamp(0).tz)
+                rows = track.downsampled_rows(self.PROFILE_POINTS, rows=slice(track.searchsorted(start), track.searchsorted(end, "right")))
+
             logical_phases = self.service.get_logical_phases(file_path)
             colors = plotly.colors.qualitative.Plotly * (len(logical_phases) // 10 + 1)
             for i, lp in enumerate(logical_phases):
-                plot = IgcGraph.generate_line_plot(xVal=lp.dataframe.index, yVal=lp.dataframe['Alt_gps'], series_name=f"{lp.type_label} {i+1}", color=colors[i])
+                lp_rows = lp.track_rows(rows)
+                if lp_rows is None:
+                    df = lp.dataframe
+                else:
+                    if window is None:
+                        # Keep the ends of each phase so consecutive traces meet
+                        ends = [row for p in lp.phases if len(p) for row in (p.start, p.stop - 1)]
+                        lp_rows = np.union1d(lp_rows, ends)
+                    df = lp.phases[0].track.to_dataframe(lp_rows)
+                plot = IgcGraph.generate_line_plot(xVal=df.index, yVal=df['Alt_gps'], series_name=f"{lp.type_label} {i+1}", color=colors[i])
                 plot.showlegend = True
                 fig.add_trace(plot)
-            fig.update_layout(xaxis=dict(title=dict(text="Time")), yaxis=dict(title=dict(text="Altitude (m)")), hovermode="x unified")
+            xaxis = dict(title=dict(text="Time"))
+            if window is not None:
+                xaxis["range"] = list(window)
+            fig.update_layout(xaxis=xaxis, yaxis=dict(title=dict(text="Altitude (m)")), hovermode="x unified")
         return fig
 
     def get_file_phases_details(self, file_path):
         details = []
-        if file_path in self.service.tracks:
+        if self.service.get_track(file_path) is not None:
             logical_phases = self.service.get_logical_phases(file_path)
             colors = plotly.colors.qualitative.Plotly * (len(logical_phases) // 10 + 1)
             for i, lp in enumerate(logical_phases):
@@ -4,32 +4,171 @@
 import os
 import logging
 import glob
-from typing import List, Dict, Union
+import hashlib
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Union, Optional, Tuple
+import numpy as np
+import pandas as pd
 import plotly.colors
 
 from ..ports.reader import TrackReader
-from ..domain.models import Track, Phase, LogicalPhase
+from ..ports.cache import TrackCache
+from ..domain.models import Track, TrackHeader, Phase, LogicalPhase
 from ..domain.analysis_engine import AnalysisEngine
+from ..domain.summary import FileSummary
+
+def reset_locks_after_fork(obj):
+    """Calls `obj._reset_locks()` in processes forked from this one (background jobs).
+
+    A lock held by another thread (e.g. page warm-up) when the process forks is inherited
+    locked by the child, where no thread will ever release it.
+    """
+    if hasattr(os, "register_at_fork"):
+        ref = weakref.ref(obj)
+        os.register_at_fork(after_in_child=lambda: ref() is not None and ref()._reset_locks())
+
+def _read_and_analyze(reader: TrackReader, file_path: str, analysis_params: dict) -> dict:
+    """Worker for parallel loading: parses and segments one file.
+
+    Only the track columns and the phase summaries travel back to the parent process.
+    """
+    track = reader.read(file_path)
+    phases = AnalysisEngine.split_into_phases(track, **analysis_params)
+    return {
+        "columns": track.to_columns(),
+        "phases": [p.to_summary() for p in phases],
+    }
 
 class TrackCollectionService:
-    """Application service to manage and analyze a collection of tracks."""
+    """Application service to manage and analyze a collection of tracks.
+
+    `analysis_params` overrides the segmentation parameters (see
+    `AnalysisEngine.parameters`), e.g. `{"distance_backend": "haversine"}` for batch jobs
+    that favour throughput.
+    """
     
-    def __init__(self, readers: List[TrackReader]):
+    def __init__(self, readers: List[TrackReader], cache: Optional[TrackCache] = None,
+                 analysis_params: Optional[dict] = None):
         self.readers = readers
+        self.cache = cache
+        self.analysis_params = AnalysisEngine.parameters(**(analysis_params or {}))
+        self.headers: Dict[str, TrackHeader] = {}
         self.tracks: Dict[str, Track] = {}
         self.phases: Dict[str, List[Phase]] = {}
+        self.logical_phases: Dict[str, List[LogicalPhase]] = {}
         self.file_colors: Dict[str, str] = {}
+        # Registration index of each file, how the UI refers to files
+        self.file_ids: Dict[str, int] = {}
+        # Modification time of each file when it was registered (None if unknown)
+        self.file_mtimes: Dict[str, Optional[float]] = {}
+        self._phase_rows: Dict[str, pd.DataFrame] = {}
+        self.file_summaries: Dict[str, FileSummary] = {}
         self.palette = plotly.colors.qualitative.Plotly + plotly.colors.qualitative.Dark24
+        self._failed = set()
+        # Files are materialized once, also from background threads (page warm-up)
+        self._materialize_lock = threading.RLock()
+        reset_locks_after_fork(self)
+
+    def _reset_locks(self):
+        self._materialize_lock = threading.RLock()
 
-    def load_files(self, targets: Union[str, List[str]]):
-        """Discovers and loads files into the collection."""
+    @property
+    def file_paths(self) -> List[str]:
+        """All registered files, materialized or not, in registration order."""
+        return list(self.headers)
+
+    def load_files(self, targets: Union[str, List[str]], workers: Optional[int] = None, lazy: bool = False):
+        """Discovers and loads files into the collection.
+
+        With `workers` > 1, files are parsed and segmented in a process pool. Files are
+        still registered in discovery order, so colours do not depend on scheduling.
+        With `lazy`, only file headers are read; tracks and phases are built on first access.
+        """
         if isinstance(targets, str):
             targets = [targets]
             
         all_paths = self._discover_files(targets)
+        if lazy:
+            for path in all_paths:
+                self.index_file(path)
+            return
+
+        if workers is not None and workers > 1:
+            self._load_parallel(all_paths, workers)
+            return
+
         for path in all_paths:
             self.add_file(path)
 
+    def _load_parallel(self, all_paths: List[str], workers: int):
+        # Cached and parsed files are registered afterwards, in discovery order
+        loaded = {}
+        jobs = []
+        for path in dict.fromkeys(all_paths):
+            if path in self.tracks:
+                continue
+            reader = self._find_reader(path)
+            if reader is None:
+                logging.warning(f"No suitable reader found for: {path}")
+                continue
+            loaded[path] = self._load_from_cache(path, reader)
+            if loaded[path] is None:
+                jobs.append((path, reader))
+
+        if jobs:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(_read_and_analyze, reader, path, self.analysis_params) for path, reader in jobs]
+                for (path, reader), future in zip(jobs, futures):
+                    try:
+                        result = future.result()
+                        track = Track.from_columns(result["columns"], file_path=path)
+                        phases = [Phase.from_summary(track, summary) for summary in result["phases"]]
+                    except Exception as e:
+                        logging.error(f"Error processing {path} with {reader.__class__.__name__}: {e}")
+                        continue
+                    loaded[path] = (track, phases)
+                    self._store_in_cache(path, reader, track, phases)
+                    logging.info(f"Successfully loaded and analyzed: {path}")
+
+        for path, result in loaded.items():
+            if result is not None:
+                self._register(path, *result)
+
+    def _find_reader(self, file_path: str) -> Optional[TrackReader]:
+        for reader in self.readers:
+            if reader.can_handle(file_path):
+                return reader
+        return None
+
+    def _register(self, file_path: str, track: Track, phases: List[Phase]):
+        self.phases[file_path] = phases
+        # Grouped once per analysis; replaced whenever the phases are
+        self.logical_phases[file_path] = AnalysisEngine.get_logical_phases(phases)
+        if file_path not in self.headers:
+            self._register_header(file_path, TrackHeader.from_track(track))
+        else:
+            # The bbox of a header read without the fixes is only indicative
+            self.headers[file_path].bbox = track.bbox
+        self._phase_rows[file_path] = AnalysisEngine.phase_table(phases)
+        # Filtered collection stats only merge the summaries of the selected files
+        self.file_summaries[file_path] = FileSummary.from_phase_table(self._phase_rows[file_path])
+        # Set last: `_materialize` reads it without the lock as "fully registered"
+        self.tracks[file_path] = track
+
+    def _register_header(self, file_path: str, header: TrackHeader):
+        self.headers[file_path] = header
+        self.file_ids[file_path] = len(self.file_ids)
+        try:
+            self.file_mtimes[file_path] = os.path.getmtime(file_path)
+        except OSError:
+            self.file_mtimes[file_path] = None
+
+        # Assign persistent color
+        idx = len(self.file_colors)
+        self.file_colors[file_path] = self.palette[idx % len(self.palette)]
+
     def _discover_files(self, list_paths: List[str]) -> List[str]:
         paths_to_return = []
         for element in list_paths:
@@ -49,41 +188,214 @@ class TrackCollectionService:
         if file_path in self.tracks:
             return
 
-        for reader in self.readers:
-            if reader.can_handle(file_path):
-                try:
-                    track = reader.read(file_path)
-                    self.tracks[file_path] = track
-                    
-                    # Run analysis immediately
-                    phases = AnalysisEngine.split_into_phases(track)
-                    self.phases[file_path] = phases
-                    
-                    # Assign persistent color
-                    idx = len(self.file_colors)
-                    self.file_colors[file_path] = self.palette[idx % len(self.palette)]
-                    
-                    logging.info(f"Successfully loaded and analyzed: {file_path}")
-                    return
-                except Exception as e:
-                    logging.error(f"Error processing {file_path} with {reader.__class__.__name__}: {e}")
-                    return
-        
-        logging.warning(f"No suitable reader found for: {file_path}")
+        reader = self._find_reader(file_path)
+        if reader is None:
+            logging.warning(f"No suitable reader found for: {file_path}")
+            return
+
+        loaded = self._load(file_path, reader)
+        if loaded is not None:
+            self._register(file_path, *loaded)
+
+    def index_file(self, file_path: str):
+        """Registers a file from its header only; parsing and analysis are deferred."""
+        if file_path in self.headers:
+            return
+
+        reader = self._find_reader(file_path)
+        if reader is None:
+            logging.warning(f"No suitable reader found for: {file_path}")
+            return
+
+        try:
+            header = reader.read_header(file_path)
+        except Exception as e:
+            logging.error(f"Error processing {file_path} with {reader.__class__.__name__}: {e}")
+            return
+
+        self._register_header(file_path, header)
+
+    def is_loaded(self, file_path: str) -> bool:
+        return file_path in self.tracks
+
+    def _materialize(self, file_path: str) -> bool:
+        """Builds the track and phases of an indexed file on first access (memoized)."""
+        if file_path in self.tracks:
+            return True
+        with self._materialize_lock:
+            if file_path in self.tracks:
+                return True
+            if file_path not in self.headers or file_path in self._failed:
+                return False
+
+            loaded = self._load(file_path, self._find_reader(file_path))
+            if loaded is None:
+                self._failed.add(file_path)
+                return False
+            self._register(file_path, *loaded)
+            return True
+
+    def _load(self, file_path: str, reader: TrackReader) -> Optional[Tuple[Track, List[Phase]]]:
+        cached = self._load_from_cache(file_path, reader)
+        if cached is not None:
+            return cached
+
+        try:
+            track = reader.read(file_path)
+            
+            # Run analysis immediately
+            phases = AnalysisEngine.split_into_phases(track, **self.analysis_params)
+        except Exception as e:
+            logging.error(f"Error processing {file_path} with {reader.__class__.__name__}: {e}")
+            return None
+
+        self._store_in_cache(file_path, reader, track, phases)
+        logging.info(f"Successfully loaded and analyzed: {file_path}")
+        return track, phases
+
+    def invalidate_cache(self, file_path: str = None):
+        """Drops cached analysis results for one file, or for the whole collection."""
+        if self.cache is not None:
+            self.cache.invalidate(file_path)
+
+    def _cache_params(self, reader: TrackReader) -> dict:
+        params = dict(self.analysis_params)
+        params["reader"] = reader.__class__.__name__
+        return params
+
+    def _load_from_cache(self, file_path: str, reader: TrackReader) -> Optional[Tuple[Track, List[Phase]]]:
+        if self.cache is None:
+            return None
+        try:
+            cached = self.cache.load(file_path, self._cache_params(reader))
+        except Exception as e:
+            logging.warning(f"Cache lookup failed for {file_path}: {e}")
+            return None
+        if cached is not None:
+            logging.info(f"Loaded from cache: {file_path}")
+        return cached
+
+    def _store_in_cache(self, file_path: str, reader: TrackReader, track: Track, phases: List[Phase]):
+        if self.cache is None:
+            return
+        try:
+            self.cache.store(file_path, self._cache_params(reader), track, phases)
+        except Exception as e:
+            logging.warning(f"Could not cache {file_path}: {e}")
+
+    def get_header(self, file_path: str) -> Optional[TrackHeader]:
+        return self.headers.get(file_path)
 
     def get_track(self, file_path: str) -> Track:
+        self._materialize(file_path)
         return self.tracks.get(file_path)
 
     def get_phases(self, file_path: str) -> List[Phase]:
+        self._materialize(file_path)
         return self.phases.get(file_path, [])
 
     def get_logical_phases(self, file_path: str) -> List[LogicalPhase]:
-        phases = self.get_phases(file_path)
-        return AnalysisEngine.get_logical_phases(phases)
+        self._materialize(file_path)
+        return self.logical_phases.get(file_path, [])
+
+    def reanalyze(self, file_path: str = None, **analysis_params):
+        """Segments loaded tracks again, e.g. after changing `analysis_params`.
+
+        Keyword arguments update `analysis_params` first. Only the given file is
+        re-analysed when one is given, otherwise every loaded track is.
+        """
+        if analysis_params:
+            self.analysis_params = AnalysisEngine.parameters(**dict(self.analysis_params, **analysis_params))
+        paths = [file_path] if file_path is not None else list(self.tracks)
+        for path in paths:
+            track = self.tracks.get(path)
+            if track is None:
+                continue
+            phases = AnalysisEngine.split_into_phases(track, **self.analysis_params)
+            self._register(path, track, phases)
+            reader = self._find_reader(path)
+            if reader is not None:
+                self._store_in_cache(path, reader, track, phases)
+
+    def sweep_parameters(self, grid: list, workers: Optional[int] = None) -> pd.DataFrame:
+        """Runs `AnalysisEngine.sweep` over every track of the collection (see there)."""
+        tracks = {path: self.get_track(path) for path in self.file_paths}
+        tracks = {path: track for path, track in tracks.items() if track is not None}
+        return AnalysisEngine.sweep(tracks, grid, workers=workers)
+
+    def memory_report(self) -> dict:
+        """Resident size of the materialized tracks, per track and for the whole collection."""
+        tracks = {path: track.memory_footprint() for path, track in self.tracks.items()}
+        compact = sum(f["compact_bytes"] for f in tracks.values())
+        source = sum(f["dataframe_bytes"] for f in tracks.values())
+        return {
+            "tracks": tracks,
+            "total": {
+                "tracks": len(tracks),
+                "rows": sum(f["rows"] for f in tracks.values()),
+                "compact_bytes": compact,
+                "dataframe_bytes": source,
+                "saved_bytes": source - compact,
+                "ratio": round(compact / source, 3) if source else 0,
+            }
+        }
+
+    def find_files(self, search: str = None, trace_type: str = None, date_from=None, date_to=None,
+                   min_d_plus: float = None, sort_by: str = "date", descending: bool = False) -> List[str]:
+        """Files matching a search on their name, a date range, a trace type
+        ("hike_and_fly", "fly_only", "walk_only") and a minimum D+, sorted by "date",
+        "name" or "d_plus".
+
+        Names and dates come from the headers; the trace type and D+ from the per-file
+        summaries, so filtering or sorting on them materializes lazily indexed files.
+        """
+        paths = self.file_paths
+        if search:
+            search = search.lower()
+            paths = [path for path in paths if search in self.headers[path].file_name.lower()]
+        if date_from is not None or date_to is not None:
+            date_from = pd.Timestamp(date_from).date() if date_from is not None else None
+            date_to = pd.Timestamp(date_to).date() if date_to is not None else None
+            paths = [path for path in paths if self.headers[path].date is not None
+                     and (date_from is None or self.headers[path].date >= date_from)
+                     and (date_to is None or self.headers[path].date <= date_to)]
+        if trace_type is not None or min_d_plus is not None or sort_by == "d_plus":
+            paths = [path for path in paths if self._materialize(path)]
+        if trace_type is not None:
+            paths = [path for path in paths if self.file_summaries[path].trace_type == trace_type]
+        if min_d_plus is not None:
+            paths = [path for path in paths if self.file_summaries[path].d_plus >= min_d_plus]
+
+        if sort_by == "name":
+            key = lambda path: self.headers[path].file_name.lower()
+        elif sort_by == "d_plus":
+            key = lambda path: self.file_summaries[path].d_plus
+        elif sort_by == "date":
+            # Files without a date come last
+            key = lambda path: (self.headers[path].start_time is None, self.headers[path].start_time or 0)
+        else:
+            raise ValueError(f"Unknown sort key: {sort_by}")
+        return sorted(paths, key=key, reverse=descending)
+
+    def view_key(self, file_path: str) -> tuple:
+        """What the views of a file depend on: its path, modification time and the
+        analysis parameters. Results memoized under this key stay valid as long as it
+        does not change."""
+        return (file_path, self.file_mtimes.get(file_path), tuple(sorted(self.analysis_params.items())))
+
+    def state_token(self) -> str:
+        """Digest of the `view_key` of every file, which changes whenever a file is added,
+        modified on disk or analysed with other parameters."""
+        return hashlib.sha1(repr([self.view_key(path) for path in self.file_paths]).encode()).hexdigest()
 
     def get_file_color(self, file_path: str) -> str:
         return self.file_colors.get(file_path, "#000000")
 
+    def get_phase_table(self, file_path: str) -> pd.DataFrame:
+        """Phases of one file as a table (`AnalysisEngine.phase_table`), built once per analysis."""
+        self._materialize(file_path)
+        return self._phase_rows.get(file_path, AnalysisEngine.phase_table([]))
+
     def get_global_stats(self, file_path: str) -> dict:
         """Calculates global stats for a specific track"""
         track = self.get_track(file_path)
@@ -91,35 +403,20 @@ class TrackCollectionService:
         if not track or not phases:
             return {}
 
-        df = track.dataframe
-        duration = df.index.max() - df.index.min()
-        max_alt = df['Alt_gps'].max()
-        min_alt = df['Alt_gps'].min()
-        
-        total_climb = sum(p.height for p in phases if p.height > 0)
-        total_descent = sum(abs(p.height) for p in phases if p.height < 0)
-        total_dist = sum(p.distance for p in phases)
-
-        flight_stats = self._init_group_stats()
-        walk_stats = self._init_group_stats()
-        
-        for phase in phases:
-            target = flight_stats if phase.is_flight else walk_stats
-            target["count"] += 1
-            if phase.height > 0:
-                target["up_count"] += 1
-                target["total_climb"] += phase.height
-                target["climb_rates"].append(phase.rate_metersperhour)
-            else:
-                target["down_count"] += 1
-                target["total_descent"] += abs(phase.height)
-                target["descent_rates"].append(phase.rate_metersperhour)
-                
-            p_min = phase.dataframe['Alt_gps'].min()
-            p_max = phase.dataframe['Alt_gps'].max()
-            target["alt_min"] = min(target["alt_min"], p_min)
-            target["alt_max"] = max(target["alt_max"], p_max)
+        ticks = track.time_ticks()
+        first, last = track.timestamp(int(ticks.argmin())), track.timestamp(int(ticks.argmax()))
+        duration = last - first
+        alt = track.column('Alt_gps')
+        max_alt = np.nanmax(alt)
+        min_alt = np.nanmin(alt)
 
+        rows = self.get_phase_table(file_path)
+        height = rows["height"].to_numpy()
+        total_climb = height[height > 0].sum()
+        total_descent = np.abs(height[height < 0]).sum()
+        total_dist = rows["distance"].sum()
+
+        bFlight = rows["is_flight"].to_numpy()
         return {
             "duration": str(duration).split('.')[0],
             "max_alt": round(max_alt, 1),
@@ -127,134 +424,44 @@ class TrackCollectionService:
             "total_dist": round(total_dist/1000, 2),
             "total_climb": round(total_climb, 0),
             "total_descent": round(total_descent, 0),
-            "date": df.index.min().strftime("%Y-%m-%d"),
-            "start_time": df.index.min().strftime("%H:%M:%S"),
-            "end_time": df.index.max().strftime("%H:%M:%S"),
-            "flight_phases": self._finalize_group_stats(flight_stats),
-            "walk_phases": self._finalize_group_stats(walk_stats)
+            "date": first.strftime("%Y-%m-%d"),
+            "start_time": first.strftime("%H:%M:%S"),
+            "end_time": last.strftime("%H:%M:%S"),
+            "flight_phases": self._group_stats(rows[bFlight]),
+            "walk_phases": self._group_stats(rows[~bFlight])
         }
 
-    def _init_group_stats(self):
-        return {
-            "count": 0, "up_count": 0, "down_count": 0, 
-            "total_climb": 0, "total_descent": 0, 
-            "climb_rates": [], "descent_rates": [], 
-            "alt_min": float('inf'), "alt_max": float('-inf')
-        }
-
-    def _finalize_group_stats(self, group):
-        if group["count"] == 0:
+    @staticmethod
+    def _group_stats(rows: pd.DataFrame) -> dict:
+        if rows.empty:
             return {"count": 0, "up_count": 0, "down_count": 0, "climb_range": [0, 0], "descent_range": [0, 0], "alt_range": [0, 0], "total_climb": 0, "total_descent": 0}
-        
-        get_range = lambda vals: [round(min(vals), 1), round(max(vals), 1)] if vals else [0, 0]
-        
+
+        height = rows["height"].to_numpy()
+        rate = rows["rate"].to_numpy()
+        bUp = height > 0
+        get_range = lambda vals: [round(vals.min().item(), 1), round(vals.max().item(), 1)] if len(vals) else [0, 0]
+
         return {
-            "count": group["count"],
-            "up_count": group["up_count"],
-            "down_count": group["down_count"],
-            "climb_range": get_range(group["climb_rates"]),
-            "descent_range": get_range(group["descent_rates"]),
-            "alt_range": [round(group["alt_min"], 1), round(group["alt_max"], 1)],
-            "total_climb": round(group["total_climb"], 0),
-            "total_descent": round(group["total_descent"], 0)
+            "count": len(rows),
+            "up_count": int(bUp.sum()),
+            "down_count": int((~bUp).sum()),
+            "climb_range": get_range(rate[bUp]),
+            "descent_range": get_range(rate[~bUp]),
+            "alt_range": [round(np.nanmin(rows["min_alt"].to_numpy()).item(), 1), round(np.nanmax(rows["max_alt"].to_numpy()).item(), 1)],
+            "total_climb": round(height[bUp].sum().item(), 0),
+            "total_descent": round(np.abs(height[~bUp]).sum().item(), 0)
         }
 
+    def _merged_summary(self, files_filter=None) -> FileSummary:
+        if files_filter is not None:
+            files_filter = set(files_filter)
+        return FileSummary.merge(self.file_summaries[path] for path in self.file_paths
+                                 if (files_filter is None or path in files_filter) and self._materialize(path))
+
     def get_collection_stats(self, files_filter=None):
         """Aggregates stats across the collection."""
-        data = {
-            "walk": {"climb": {"rate": [], "elevation": []}, "descent": {"rate": [], "elevation": []}, "file_distances": []},
-            "flight": {"climb": {"rate": [], "elevation": []}, "descent": {"rate": [], "elevation": []}, "file_distances": []}
-        }
-
-        selected_files = 0
-        for path, track in self.tracks.items():
-            if files_filter is not None and path not in files_filter:
-                continue
-            
-            selected_files += 1
-            f_dist, w_dist = 0, 0
-            
-            for phase in self.phases[path]:
-                is_f = phase.is_flight
-                cat = "flight" if is_f else "walk"
-                direction = "climb" if phase.rate_metersperhour > 0 else "descent"
-                
-                display_rate = abs(phase.rate_metersperhour / 3600.0 if is_f else phase.rate_metersperhour)
-                
-                data[cat][direction]["rate"].append(display_rate)
-                data[cat][direction]["elevation"].append(abs(phase.height))
-                
-                if is_f: f_dist += phase.distance
-                else: w_dist += phase.distance
-            
-            data["flight"]["file_distances"].append(f_dist / 1000.0)
-            data["walk"]["file_distances"].append(w_dist / 1000.0)
-
-        def compute(vals):
-            return {"min": round(min(vals), 2), "avg": round(sum(vals)/len(vals), 2), "max": round(max(vals), 2)} if vals else {"min": 0, "avg": 0, "max": 0}
-
-        return {
-            "total_files": selected_files,
-            "walk": {
-                "climb": {"rate": compute(data["walk"]["climb"]["rate"]), "elevation": compute(data["walk"]["climb"]["elevation"])},
-                "descent": {"rate": compute(data["walk"]["descent"]["rate"]), "elevation": compute(data["walk"]["descent"]["elevation"])},
-                "distance": compute(data["walk"]["file_distances"])
-            },
-            "flight": {
-                "climb": {"rate": compute(data["flight"]["climb"]["rate"]), "elevation": compute(data["flight"]["climb"]["elevation"])},
-                "descent": {"rate": compute(data["flight"]["descent"]["rate"]), "elevation": compute(data["flight"]["descent"]["elevation"])},
-                "distance": compute(data["flight"]["file_distances"])
-            }
-        }
+        return self._merged_summary(files_filter).collection_stats()
 
     def get_summary_stats(self, files_filter=None):
         """Calculates high-level summary metrics."""
-        counts = {"total": 0, "hike_and_fly": 0, "fly_only": 0, "walk_only": 0}
-        metrics = {k: [] for k in ["walk_dist", "walk_duration_min", "fly_dist", "walk_climb_rate", "walk_d_plus", "fly_duration_min", "fly_d_plus", "fly_d_minus"]}
-
-        for path, track in self.tracks.items():
-            if files_filter is not None and path not in files_filter:
-                continue
-            
-            counts["total"] += 1
-            phases = self.phases[path]
-            has_f = any(p.is_flight for p in phases)
-            has_w = any(not p.is_flight for p in phases)
-            
-            if has_f and has_w: counts["hike_and_fly"] += 1
-            elif has_f: counts["fly_only"] += 1
-            elif has_w: counts["walk_only"] += 1
-            
-            w_dist, w_dur, f_dist, f_dur, w_dp, f_dp, f_dm = 0, 0, 0, 0, 0, 0, 0
-            w_rates = []
-
-            for p in phases:
-                if p.is_flight:
-                    f_dist += p.distance
-                    if p.height > 0: f_dp += p.height
-                    else: f_dm += abs(p.height)
-                    f_dur += p.duration.total_seconds()
-                else:
-                    w_dist += p.distance
-                    w_dur += p.duration.total_seconds()
-                    if p.height > 0: 
-                        w_dp += p.height
-                        w_rates.append(p.rate_metersperhour)
-
-            if has_w:
-                metrics["walk_dist"].append(w_dist / 1000.0)
-                metrics["walk_duration_min"].append(w_dur / 60.0)
-                metrics["walk_d_plus"].append(w_dp)
-                if w_rates: metrics["walk_climb_rate"].append(sum(w_rates) / len(w_rates))
-            
-            if has_f:
-                metrics["fly_dist"].append(f_dist / 1000.0)
-                metrics["fly_duration_min"].append(f_dur / 60.0)
-                metrics["fly_d_plus"].append(f_dp)
-                metrics["fly_d_minus"].append(f_dm)
-
-        avg = lambda lst: round(sum(lst) / len(lst), 1) if lst else 0
-        return {
-            "counts": counts,
-            "averages": {k: avg(metrics[k]) for k in metrics}
-        }
+        return self._merged_summary(files_filter).summary_stats()
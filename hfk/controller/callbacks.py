@@ -1,12 +1,31 @@
 # Copyright (C) 2024 aherve4
 # Licensed under the GNU GPL v3.0
 
-from dash import Input, Output, State, ALL, MATCH, ctx, html
+from dash import Input, Output, State, ALL, MATCH, ctx, html, no_update, Patch
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 import urllib.parse
-from hfk.Graphic.layout import get_global_page_layout, get_file_page_layout, create_stats_card, create_card
+from hfk.Graphic.layout import get_global_page_layout, get_file_page_shell, create_stats_card, create_card
+from hfk.Graphic.layout import (FILES_PER_PAGE, DEFAULT_SELECTION, create_file_list_items, get_selected_files,
+                                is_file_selected, page_count, compact_selection)
+from hfk.controller.jobs import progress_reporter
+from hfk.Graphic.page_cache import FilePageCache
 
-def register_callbacks(app, service, visualizer):
+def background_options(job_manager, prefix):
+    """Arguments running a callback as a background job of `job_manager` (see
+    `create_job_manager`), with the progress bar and cancel button `prefix` of
+    `create_job_progress`. Leaving the page cancels the job too. None without manager."""
+    if job_manager is None:
+        return {}
+    return dict(
+        background=True, manager=job_manager,
+        progress=[Output(f'{prefix}-progress', 'value'), Output(f'{prefix}-progress', 'label')],
+        progress_default=[0, ""],
+        running=[(Output(f'{prefix}-job', 'style'), {"display": "flex"}, {"display": "none"})],
+        cancel=[Input(f'{prefix}-cancel', 'n_clicks'), Input('url', 'pathname')]
+    )
+
+def register_callbacks(app, service, visualizer, job_manager=None, page_cache=None):
     
     # --- ROUTING CALLBACK ---
     @app.callback(
@@ -24,10 +43,58 @@ def register_callbacks(app, service, visualizer):
         elif decoded_path.startswith("/file/"):
             # Extract filename from path
             file_path = decoded_path.replace("/file/", "")
-            return get_file_page_layout(service, visualizer, file_path)
+            # The page itself is built by render_file_page
+            return get_file_page_shell(service, file_path)
         else:
             return dbc.Container(html.H1("404: Not found", className="text-danger"))
 
+    # --- FILE PAGE CALLBACKS ---
+
+    # Serve the file page from the page cache, in the server process; on a miss, build it
+    # here, or in a background job when job managers are available
+    if page_cache is None:
+        page_cache = FilePageCache(service, visualizer)
+
+    @app.callback(
+        [Output('file-page-content', 'children'),
+         Output('file-page-job', 'data')],
+        Input('file-page-request', 'data')
+    )
+    def serve_file_page(view_key):
+        if job_manager is not None:
+            page = page_cache.lookup(view_key[0])
+            return (page, no_update) if page is not None else (no_update, view_key)
+        return page_cache.get(view_key[0]), no_update
+
+    if job_manager is not None:
+        @app.callback(
+            Output('file-page-content', 'children', allow_duplicate=True),
+            Input('file-page-job', 'data'),
+            prevent_initial_call=True,
+            **background_options(job_manager, "file-page")
+        )
+        def render_file_page(set_progress, view_key):
+            # Stored in the shared cache too, where the server's page cache finds it
+            return page_cache.render(view_key[0], progress=progress_reporter(set_progress))
+
+    # Full resolution for the zoomed time window of the altitude profile
+    @app.callback(
+        Output({'type': 'file-alt-profile', 'index': MATCH}, 'figure'),
+        Input({'type': 'file-alt-profile', 'index': MATCH}, 'relayoutData'),
+        State({'type': 'file-alt-profile', 'index': MATCH}, 'id'),
+        prevent_initial_call=True
+    )
+    def update_altitude_profile_detail(relayout_data, graph_id):
+        if not relayout_data:
+            raise PreventUpdate
+        if 'xaxis.range[0]' in relayout_data:
+            window = (relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]'])
+        elif relayout_data.get('xaxis.autorange'):
+            window = None
+        else:
+            raise PreventUpdate
+        return visualizer.get_altitude_profile_figure(graph_id['index'], window=window)
+
     # --- GLOBAL PAGE CALLBACKS ---
     
     # Navigate to file detail when "Analyze" button is clicked
@@ -41,6 +108,9 @@ def register_callbacks(app, service, visualizer):
     def navigate_to_file(n_clicks):
         if not ctx.triggered:
             return "/"
+        # A new page of the file list renders unclicked buttons
+        if not any(n_clicks):
+            raise PreventUpdate
             
         # Get the ID of the button that was clicked
         button_id = ctx.triggered_id
@@ -52,48 +122,79 @@ def register_callbacks(app, service, visualizer):
         safe_path = urllib.parse.quote(file_path)
         return f"/file/{safe_path}"
 
-    # Update Global Map, Graphs & Stats when Checkboxes change, Focus clicked, or Tab changes
+    # File list: one page at a time, searched, filtered and sorted by the server
+    @app.callback(
+        [Output('file-list', 'children'),
+         Output('file-list-page', 'max_value'),
+         Output('file-list-page', 'active_page'),
+         Output('file-list-count', 'children')],
+        [Input('file-search', 'value'),
+         Input('file-type-filter', 'value'),
+         Input('file-sort', 'value'),
+         Input('file-date-filter', 'start_date'),
+         Input('file-date-filter', 'end_date'),
+         Input('file-min-dplus', 'value'),
+         Input('file-list-page', 'active_page')],
+        State('file-selection-store', 'data'),
+        prevent_initial_call=True
+    )
+    def update_file_list(search, trace_type, sort, date_from, date_to, min_d_plus, page, selection):
+        paths = service.find_files(search=search, trace_type=trace_type, date_from=date_from, date_to=date_to,
+                                   min_d_plus=min_d_plus, sort_by=(sort or "date").lstrip("-"),
+                                   descending=(sort or "").startswith("-"))
+        # Back to the first page when the query changes
+        if ctx.triggered_id != 'file-list-page' or not page:
+            page = 1
+        page = min(page, page_count(len(paths)))
+        items = create_file_list_items(service, paths[(page - 1) * FILES_PER_PAGE:page * FILES_PER_PAGE], selection)
+        return items, page_count(len(paths)), page, f"{len(paths)} files"
+
+    # Checkboxes of the current page and All/None update the compact selection state
     @app.callback(
-        [Output('global-map-graph', 'figure'),
-         Output('global-stats-container', 'children')],
+        [Output('file-selection-store', 'data'),
+         Output({'type': 'file-check', 'index': ALL}, 'value')],
         [Input({'type': 'file-check', 'index': ALL}, 'value'),
-         Input({'type': 'file-focus-btn', 'index': ALL}, 'n_clicks'),
-         Input('global-view-tabs', 'active_tab')],
-        State({'type': 'file-check', 'index': ALL}, 'id')
+         Input('file-select-all', 'n_clicks'),
+         Input('file-select-none', 'n_clicks')],
+        [State({'type': 'file-check', 'index': ALL}, 'id'),
+         State('file-selection-store', 'data')],
+        prevent_initial_call=True
     )
-    def update_global_dashboard(checked_values, focus_clicks, active_tab, checked_ids):
-        # Determine which files are checked
-        selected_files = []
+    def update_file_selection(checked_values, select_all, select_none, checked_ids, selection):
+        if ctx.triggered_id in ('file-select-all', 'file-select-none'):
+            bAll = ctx.triggered_id == 'file-select-all'
+            return {"all": bAll, "toggled": []}, [bAll] * len(checked_ids)
+
+        selection = selection or DEFAULT_SELECTION
+        toggled = set(selection["toggled"])
         for val, id_dict in zip(checked_values, checked_ids):
-            if val:
-                 selected_files.append(id_dict['index'])
-        
-        # Determine focus
-        focus_gps = None
-        if ctx.triggered_id and 'type' in ctx.triggered_id and ctx.triggered_id['type'] == 'file-focus-btn':
-             focus_gps = ctx.triggered_id['index']
-             
+            if bool(val) != is_file_selected(service, selection, id_dict['index']):
+                toggled ^= {service.file_ids[id_dict['index']]}
+        if toggled == set(selection["toggled"]):
+            # Only a new page of checkboxes being rendered
+            raise PreventUpdate
+        return compact_selection(service, selection["all"], toggled), [no_update] * len(checked_ids)
+
+    # Stats of the Summary or Detailed tab, from the dashboard bundle of the selection
+    def dashboard_content(bundle, active_tab):
         # Prepare summary stats for trace classification (used in both modes)
-        summary_stats = service.get_summary_stats(files_filter=selected_files)
+        summary_stats = bundle["summary"]
         from hfk.Graphic.layout import create_trace_type_cards
 
-        # Map is always updated
-        fig_map = visualizer.get_map_figure(focus_gps=focus_gps, files_filter=selected_files, color_phases=False)
-
         if active_tab == 'summary':
             from hfk.Graphic.layout import create_summary_content
             content = create_summary_content(summary_stats)
         else:
             # Detailed Mode
-            # Generate Performance Landscapes
-            fig_f_climb = visualizer.get_performance_landscape_figure(files_filter=selected_files, phase_type='flight', metric_type='climb')
-            fig_f_desc = visualizer.get_performance_landscape_figure(files_filter=selected_files, phase_type='flight', metric_type='descent')
+            # Performance Landscapes
+            fig_f_climb = bundle["landscapes"][('flight', 'climb')]
+            fig_f_desc = bundle["landscapes"][('flight', 'descent')]
             
-            fig_w_climb = visualizer.get_performance_landscape_figure(files_filter=selected_files, phase_type='walk', metric_type='climb')
-            fig_w_desc = visualizer.get_performance_landscape_figure(files_filter=selected_files, phase_type='walk', metric_type='descent')
+            fig_w_climb = bundle["landscapes"][('walk', 'climb')]
+            fig_w_desc = bundle["landscapes"][('walk', 'descent')]
             
             from hfk.Graphic.layout import create_distance_card
-            detailed_stats = service.get_collection_stats(files_filter=selected_files)
+            detailed_stats = bundle["collection"]
             
             # Build the Detailed Layout
             from dash import dcc
@@ -144,4 +245,156 @@ def register_callbacks(app, service, visualizer):
                 ], className="mb-4"),
             ])
         
-        return fig_map, content
\ No newline at end of file
+        return content
+
+    # Update the Stats when the selection or Tab changes; the map is handled in the browser.
+    # Bundles are cached, so switching tabs is served here; with a job manager, a missing
+    # bundle is built by a background job
+    @app.callback(
+        [Output('global-stats-container', 'children'),
+         Output('dashboard-job', 'data')],
+        [Input('file-selection-store', 'data'),
+         Input('global-view-tabs', 'active_tab')]
+    )
+    def update_global_dashboard(selection, active_tab):
+        selected_files = get_selected_files(service, selection)
+        if job_manager is None:
+            return dashboard_content(visualizer.get_dashboard_bundle(files_filter=selected_files), active_tab), no_update
+        bundle = visualizer.lookup_dashboard_bundle(files_filter=selected_files)
+        if bundle is None:
+            return no_update, {"selection": selection, "active_tab": active_tab}
+        return dashboard_content(bundle, active_tab), no_update
+
+    if job_manager is not None:
+        @app.callback(
+            Output('global-stats-container', 'children', allow_duplicate=True),
+            Input('dashboard-job', 'data'),
+            prevent_initial_call=True,
+            **background_options(job_manager, "global-stats")
+        )
+        def build_dashboard(set_progress, job):
+            # Stored in the shared cache too, where the server finds it on the next tab switch
+            bundle = visualizer.get_dashboard_bundle(files_filter=get_selected_files(service, job["selection"]),
+                                                     progress=progress_reporter(set_progress))
+            return dashboard_content(bundle, job["active_tab"])
+
+    # Show the points of the selected files only, in the browser: the global map holds
+    # every loaded file (see DashVisualizer.get_global_map_figure)
+    app.clientside_callback(
+        """
+        function(selection, mapView, figure) {
+            if (!figure || !figure.layout || !figure.layout.meta || !selection) {
+                return window.dash_clientside.no_update;
+            }
+            const toggled = new Set(selection.toggled);
+            const isSelected = fileId => Boolean(selection.all) !== toggled.has(fileId);
+            const saved = window.hfkMapPoints = window.hfkMapPoints || {};
+            // Forget the points of the traces of previous figures (other uids)
+            const uids = new Set(figure.data.map(trace => trace.uid));
+            Object.keys(saved).filter(uid => !uids.has(uid)).forEach(uid => delete saved[uid]);
+            const data = figure.data.map(trace => {
+                const meta = trace.meta || {};
+                if (meta.focus !== undefined) {
+                    return Object.assign({}, trace, {visible: meta.focus === null || isSelected(meta.focus)});
+                }
+                if (!meta.files) {
+                    return trace;
+                }
+                if (meta.files.length === 1) {
+                    return Object.assign({}, trace, {visible: isSelected(meta.files[0][0])});
+                }
+                // Merged trace: blank the points of the unchecked files
+                if (!saved[trace.uid]) {
+                    saved[trace.uid] = {lat: Array.from(trace.lat), lon: Array.from(trace.lon)};
+                }
+                const lat = saved[trace.uid].lat.slice();
+                const lon = saved[trace.uid].lon.slice();
+                meta.files.forEach(([fileId, start, stop]) => {
+                    if (!isSelected(fileId)) {
+                        lat.fill(null, start, stop);
+                        lon.fill(null, start, stop);
+                    }
+                });
+                return Object.assign({}, trace, {lat: lat, lon: lon});
+            });
+
+            const layout = Object.assign({}, figure.layout);
+            const triggered = window.dash_clientside.callback_context.triggered.map(t => t.prop_id).join();
+            const extents = layout.meta.extents.filter(([fileId, bbox]) => bbox && isSelected(fileId));
+            if (triggered.includes('file-selection-store') && extents.length) {
+                // Centre on the selected files, at the current zoom
+                const lats = extents.flatMap(([fileId, bbox]) => bbox.slice(0, 2));
+                const lons = extents.flatMap(([fileId, bbox]) => bbox.slice(2));
+                const center = {lat: (Math.min(...lats) + Math.max(...lats)) / 2, lon: (Math.min(...lons) + Math.max(...lons)) / 2};
+                layout.mapbox = Object.assign({}, layout.mapbox, {center: center, zoom: (mapView || {}).zoom || layout.mapbox.zoom});
+                layout.uirevision = 'selection-' + Date.now();
+            }
+            return {data: data, layout: layout};
+        }
+        """,
+        Output('global-map-graph', 'figure', allow_duplicate=True),
+        [Input('file-selection-store', 'data'),
+         Input('map-view-store', 'data')],
+        State('global-map-graph', 'figure'),
+        prevent_initial_call=True
+    )
+
+    # Add the files not loaded yet (lazily indexed) to the map, after the page shows
+    @app.callback(
+        [Output('global-map-graph', 'figure', allow_duplicate=True),
+         Output('map-view-store', 'data', allow_duplicate=True)],
+        Input('map-view-store', 'data'),
+        prevent_initial_call='initial_duplicate'
+    )
+    def complete_global_map(map_view):
+        if not map_view or map_view.get('complete'):
+            raise PreventUpdate
+        fig_map = visualizer.get_global_map_figure(focus_gps=map_view['focus'])
+        mapbox = fig_map["layout"]["mapbox"]
+        return fig_map, dict(map_view, zoom=mapbox["zoom"], center=mapbox["center"], focus_trace=len(fig_map["data"]) - 1, complete=True)
+
+    # Focus: centre on a file and draw it in full detail, as a partial update of the map
+    @app.callback(
+        [Output('global-map-graph', 'figure', allow_duplicate=True),
+         Output('map-view-store', 'data', allow_duplicate=True)],
+        Input({'type': 'file-focus-btn', 'index': ALL}, 'n_clicks'),
+        State('map-view-store', 'data'),
+        prevent_initial_call=True
+    )
+    def focus_map_file(focus_clicks, map_view):
+        if not ctx.triggered_id or not any(focus_clicks) or not map_view:
+            raise PreventUpdate
+        focus_gps = ctx.triggered_id['index']
+        focus_trace = visualizer.get_focus_trace(focus_gps)
+        center = visualizer.get_focus_center(focus_gps)
+        if focus_trace is None or center is None:
+            raise PreventUpdate
+
+        patch = Patch()
+        patch["data"][map_view["focus_trace"]] = focus_trace
+        patch["layout"]["mapbox"]["center"] = center
+        patch["layout"]["mapbox"]["zoom"] = 13
+        patch["layout"]["uirevision"] = f"focus-{focus_gps}"
+        return patch, dict(map_view, focus=focus_gps, zoom=13, center=center)
+
+    # Redraw the map at another level of detail when zooming changes its tolerance
+    @app.callback(
+        [Output('global-map-graph', 'figure', allow_duplicate=True),
+         Output('map-view-store', 'data', allow_duplicate=True)],
+        Input('global-map-graph', 'relayoutData'),
+        State('map-view-store', 'data'),
+        prevent_initial_call=True
+    )
+    def update_map_detail(relayout_data, map_view):
+        if not relayout_data or 'mapbox.zoom' not in relayout_data or not map_view:
+            raise PreventUpdate
+
+        zoom = relayout_data['mapbox.zoom']
+        center = relayout_data.get('mapbox.center', map_view['center'])
+        new_view = dict(map_view, zoom=zoom, center=center)
+        if visualizer.map_tolerance(zoom, center['lat']) == visualizer.map_tolerance(map_view['zoom'], map_view['center']['lat']):
+            return no_update, new_view
+
+        # The new figure has every file: storing the view has the browser hide the unchecked ones again
+        fig_map = visualizer.get_global_map_figure(focus_gps=map_view['focus'], zoom=zoom, center=center)
+        return fig_map, dict(new_view, focus_trace=len(fig_map["data"]) - 1, complete=True)
\ No newline at end of file
@@ -0,0 +1,32 @@
+# Copyright (C) 2024 aherve4
+# Licensed under the GNU GPL v3.0
+
+import logging
+import os
+import tempfile
+
+def create_job_manager(jobs_dir=None, expire=7 * 24 * 3600):
+    """Background callback manager for the heavy views, on a local disk cache.
+
+    Jobs run in their own process, so they do not block the Dash workers. Their results
+    are kept in `jobs_dir` (a temporary directory by default), whose cache (`handle`) is
+    also where jobs store the file pages and dashboard bundles they build for the server
+    process (see `FilePageCache.shared` and `DashVisualizer.shared`). Job results not
+    read for `expire` seconds are dropped.
+
+    Returns None, and heavy views run in the request, without `dash[diskcache]`.
+    """
+    try:
+        import diskcache
+        from dash import DiskcacheManager
+        return DiskcacheManager(diskcache.Cache(jobs_dir or os.path.join(tempfile.gettempdir(), "hfk-jobs")), expire=expire)
+    except ImportError as e:
+        logging.warning(f"Background callbacks disabled, heavy views run in the request ({e}); "
+                        "install them with: pip install \"dash[diskcache]\"")
+        return None
+
+def progress_reporter(set_progress):
+    """Adapts a background callback's `set_progress` to `progress(done, total)` calls."""
+    if set_progress is None:
+        return None
+    return lambda done, total: set_progress((round(100 * done / total) if total else 100, f"{done}/{total}"))
@@ -2,122 +2,295 @@
 # Licensed under the GNU GPL v3.0
 
 import logging
-import pyproj
+import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 from .models import Track, Phase, LogicalPhase
+from .distance import get_distance_backend
+
+def _sweep_track(columns: dict, file_path: str, grid: list) -> list:
+    """Worker for parallel sweeps: evaluates every parameter set on one track."""
+    return AnalysisEngine.sweep_track(Track.from_columns(columns, file_path=file_path), grid)
 
 class AnalysisEngine:
     """Core domain service for analyzing tracks and detecting phases."""
     
     THRESHOLD_CHANGE_STATE = 10 # confirmation window in samples
     ALTITUDE_HYSTERESIS_MARGIN = 10 # meters
+    FLIGHT_SPEED_THRESHOLD = 15 # km/h
+    FLIGHT_RATE_THRESHOLD = 1000 # m/h
+    DEFAULT_RESAMPLE_INTERVAL = "1min"
+    DISTANCE_BACKEND = "geodesic"
+    SWEEP_METRICS = ["phases", "walk_phases", "flight_phases", "walk_distance", "flight_distance",
+                     "walk_hours", "flight_hours", "walk_d_plus", "flight_d_plus"]
+    PHASE_TABLE_COLUMNS = ["is_flight", "direction", "height", "duration", "distance", "rate",
+                           "min_alt", "max_alt", "start_time", "end_time"]
     
     @staticmethod
-    def split_into_phases(track: Track, resample_interval: str = "1min") -> list:
-        """Segments a track into activity phases (Walk/Flight, Up/Down)."""
-        geod = pyproj.Geod(ellps="WGS84")
+    def parameters(resample_interval: str = None, threshold_change_state: int = None,
+                   altitude_hysteresis_margin: float = None, flight_speed_kmh: float = None,
+                   flight_rate_mh: float = None, distance_backend: str = None) -> dict:
+        """Parameters that determine the output of `split_into_phases` (used as cache keys).
+
+        Unset values take the class defaults.
+        """
+        def default(value, fallback):
+            return fallback if value is None else value
+
+        return {
+            "resample_interval": resample_interval or AnalysisEngine.DEFAULT_RESAMPLE_INTERVAL,
+            "threshold_change_state": default(threshold_change_state, AnalysisEngine.THRESHOLD_CHANGE_STATE),
+            "altitude_hysteresis_margin": default(altitude_hysteresis_margin, AnalysisEngine.ALTITUDE_HYSTERESIS_MARGIN),
+            "flight_speed_kmh": default(flight_speed_kmh, AnalysisEngine.FLIGHT_SPEED_THRESHOLD),
+            "flight_rate_mh": default(flight_rate_mh, AnalysisEngine.FLIGHT_RATE_THRESHOLD),
+            "distance_backend": get_distance_backend(distance_backend or AnalysisEngine.DISTANCE_BACKEND).name,
+        }
+
+    @staticmethod
+    def compute_speed_and_rate(df_resampled: pd.DataFrame, altitude_col: str = "Alt_gps", distance_backend=None):
+        """Ground speed (km/h) and vertical rate (m/h) between each pair of consecutive samples.
+
+        Computed in one batch: one distance backend call over all consecutive pairs, then array
+        arithmetic.
+        """
+        if len(df_resampled) < 2:
+            return np.zeros(0), np.zeros(0)
+
+        backend = get_distance_backend(distance_backend or AnalysisEngine.DISTANCE_BACKEND)
+        lat = df_resampled["Lat"].to_numpy(dtype=float)
+        lon = df_resampled["Long"].to_numpy(dtype=float)
+        alt = df_resampled[altitude_col].to_numpy(dtype=float)
+
+        # Ground Speed
+        dist = backend.steps(lat, lon)
+        dt = (df_resampled.index[1:] - df_resampled.index[:-1]).total_seconds().to_numpy() / 3600.0
+        moving = dt > 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            speed = np.where(moving, (np.asarray(dist) / 1000.0) / dt, 0)
+
+            # Vertical Rate
+            rate = np.where(moving, (alt[1:] - alt[:-1]) / dt, 0)
+        return speed, rate
+
+    @staticmethod
+    def activity_from(speed: np.ndarray, rate: np.ndarray, flight_speed_kmh: float = None,
+                      flight_rate_mh: float = None) -> np.ndarray:
+        """Flight trigger for each sample from the output of `compute_speed_and_rate`.
+
+        The first sample has no predecessor and is never a flight trigger.
+        """
+        params = AnalysisEngine.parameters(flight_speed_kmh=flight_speed_kmh, flight_rate_mh=flight_rate_mh)
+        lActivity = np.zeros(len(speed) + 1, dtype=bool)
+        # Flight criteria: Speed > 15 km/h OR |rate| > 1000 m/h
+        lActivity[1:] = (speed > params["flight_speed_kmh"]) | (np.abs(rate) > params["flight_rate_mh"])
+        return lActivity
+
+    @staticmethod
+    def compute_activity(df_resampled: pd.DataFrame, altitude_col: str = "Alt_gps", flight_speed_kmh: float = None,
+                         flight_rate_mh: float = None, distance_backend=None) -> np.ndarray:
+        """Flight trigger for each sample, from the speed and vertical rate since the previous one."""
+        if len(df_resampled) < 2:
+            return np.zeros(len(df_resampled), dtype=bool)
+        speed, rate = AnalysisEngine.compute_speed_and_rate(df_resampled, altitude_col, distance_backend)
+        return AnalysisEngine.activity_from(speed, rate, flight_speed_kmh, flight_rate_mh)
+
+    @staticmethod
+    def split_into_phases(track: Track, resample_interval: str = DEFAULT_RESAMPLE_INTERVAL,
+                          threshold_change_state: int = None, altitude_hysteresis_margin: float = None,
+                          flight_speed_kmh: float = None, flight_rate_mh: float = None,
+                          distance_backend: str = None) -> list:
+        """Segments a track into activity phases (Walk/Flight, Up/Down).
+
+        Parameters left unset take the class defaults (see `parameters`).
+        """
         altitude_col = "Alt_gps"
+        params = AnalysisEngine.parameters(resample_interval, threshold_change_state, altitude_hysteresis_margin,
+                                           flight_speed_kmh, flight_rate_mh, distance_backend)
         
-        df_resampled = track.get_resampled(resample_interval)
+        df_resampled = track.get_resampled(params["resample_interval"], ["Lat", "Long", altitude_col])
         if df_resampled.empty:
             return []
-            
-        df_full = track.dataframe
+
 
         # 1. Pre-calculate activity triggers (Speed & Vertical Rate)
-        lActivity = [] # True for Flight, False for Walk
-        for k in range(len(df_resampled)):
-            if k == 0:
-                lActivity.append(False)
-                continue
-                
-            p1 = df_resampled.iloc[k-1]
-            p2 = df_resampled.iloc[k]
-            
-            # Ground Speed
-            _, _, dist = geod.inv(p1["Long"], p1["Lat"], p2["Long"], p2["Lat"])
-            dt = (df_resampled.index[k] - df_resampled.index[k-1]).total_seconds() / 3600.0
-            speed = (dist / 1000.0) / dt if dt > 0 else 0
-            
-            # Vertical Rate
-            rate = (p2[altitude_col] - p1[altitude_col]) / dt if dt > 0 else 0
-            
-            # Flight criteria: Speed > 15 km/h OR |rate| > 1000 m/h
-            is_f = (speed > 15) or (abs(rate) > 1000)
-            lActivity.append(is_f)
+        lActivity = AnalysisEngine.compute_activity(df_resampled, altitude_col, params["flight_speed_kmh"],
+                                                    params["flight_rate_mh"], params["distance_backend"]) # True for Flight, False for Walk
+        lAltitude = df_resampled[altitude_col].to_numpy(dtype=float)
 
         # 2. Main splitting logic: Direction + Activity Trigger
-        if len(df_resampled) >= 2:
-            bUp = df_resampled[altitude_col].iloc[1] >= df_resampled[altitude_col].iloc[0]
-        else:
-            bUp = True
-            
-        bFlight = lActivity[0]
-        
+        lBounds = AnalysisEngine._run_state_machine(df_resampled.index, lAltitude, lActivity, params)
+
         phases = []
-        current_phase_time = []
-        change_state_time = []
-        extreme_altitude = df_resampled[altitude_col].iloc[0]
-        it_change_state = 0
-        
-        for k, time_idx in enumerate(df_resampled.index):
-            current_alt = df_resampled[altitude_col][time_idx]
-            current_is_f = lActivity[k]
-            
-            activity_aligned = (current_is_f == bFlight)
-            
-            direction_aligned = False
-            if bUp:
-                if current_alt >= extreme_altitude - AnalysisEngine.ALTITUDE_HYSTERESIS_MARGIN:
-                    direction_aligned = True
-                    if current_alt > extreme_altitude: extreme_altitude = current_alt
-            else:
-                if current_alt <= extreme_altitude + AnalysisEngine.ALTITUDE_HYSTERESIS_MARGIN:
-                    direction_aligned = True
-                    if current_alt < extreme_altitude: extreme_altitude = current_alt
-            
-            if activity_aligned and direction_aligned:
-                if it_change_state > 0:
-                    current_phase_time += change_state_time
-                    change_state_time = []
-                    it_change_state = 0
-                current_phase_time.append(time_idx)
-            else:
-                it_change_state += 1
-                change_state_time.append(time_idx)
-                
-                if it_change_state >= AnalysisEngine.THRESHOLD_CHANGE_STATE:
-                    # Finalize phase
-                    if current_phase_time:
-                         start_t = current_phase_time[0]
-                         end_t = current_phase_time[-1]
-                         phase_slice = df_full.loc[start_t:end_t].copy()
-                         if not phase_slice.empty:
-                             p = Phase(phase_slice, bUp)
-                             p.compute_distance()
-                             phases.append(p)
-                    
-                    # Reset state
-                    current_phase_time = change_state_time
-                    change_state_time = []
-                    it_change_state = 0
-                    bUp = not bUp if not direction_aligned else bUp
-                    bFlight = current_is_f
-                    extreme_altitude = current_alt
-                    
-        # Add last remaining phase
-        if current_phase_time:
-             current_phase_time += change_state_time
-             start_t = current_phase_time[0]
-             end_t = current_phase_time[-1]
-             phase_slice = df_full.loc[start_t:end_t].copy()
-             if not phase_slice.empty:
-                 p = Phase(phase_slice, bUp)
-                 p.compute_distance()
-                 phases.append(p)
-            
+        for start_t, end_t, bUp in lBounds:
+            p = AnalysisEngine._make_phase(track, start_t, end_t, bUp, params)
+            if p is not None:
+                phases.append(p)
         return phases
 
+    @staticmethod
+    def _run_state_machine(lTime, lAltitude: np.ndarray, lActivity: np.ndarray, params: dict) -> list:
+        machine = PhaseStateMachine(params["threshold_change_state"], params["altitude_hysteresis_margin"])
+        lBounds = []
+        for time_idx, current_alt, current_is_f in zip(lTime, lAltitude, lActivity):
+            lBounds += machine.push(time_idx, current_alt, bool(current_is_f))
+        lBounds += machine.finish()
+        return lBounds
+
+    @staticmethod
+    def _make_phase(track: Track, start_t, end_t, bUp: bool, params: dict = None):
+        """Builds the phase covering the full-resolution fixes between two resampled timestamps."""
+        params = params or AnalysisEngine.parameters()
+        start = track.searchsorted(start_t, side="left")
+        stop = track.searchsorted(end_t, side="right")
+        if stop <= start:
+            return None
+        p = Phase(track, bUp, int(start), int(stop))
+        p.compute_distance(flight_speed_kmh=params["flight_speed_kmh"], flight_rate_mh=params["flight_rate_mh"],
+                           distance_backend=params["distance_backend"])
+        return p
+
+    @staticmethod
+    def parameter_grid(**values) -> list:
+        """Every combination of the given parameter values, e.g.
+        `parameter_grid(threshold_change_state=[5, 10], resample_interval=["30s", "1min"])`."""
+        grid = [{}]
+        for name, options in values.items():
+            grid = [dict(params, **{name: option}) for params in grid for option in options]
+        return grid
+
+    @staticmethod
+    def sweep(tracks, grid: list, workers: int = None, baseline: int = 0) -> pd.DataFrame:
+        """Segments every track with every parameter set of `grid` and tabulates the results.
+
+        `tracks` maps file paths to tracks (or is a list of tracks). The table has one row
+        per file and parameter set: the full parameters, the phase counts and the walk and
+        flight totals, plus a `<metric>_diff` column per metric giving the difference with
+        the same file under `grid[baseline]`. With `workers` > 1, files are spread over a
+        process pool.
+        """
+        if not isinstance(tracks, dict):
+            tracks = {track.file_path or str(i): track for i, track in enumerate(tracks)}
+        grid = [AnalysisEngine.parameters(**params) for params in grid]
+
+        rows = []
+        if workers is not None and workers > 1 and len(tracks) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(_sweep_track, track.to_columns(), path, grid) for path, track in tracks.items()]
+                for path, future in zip(tracks, futures):
+                    rows += [dict(file_path=path, **row) for row in future.result()]
+        else:
+            for path, track in tracks.items():
+                rows += [dict(file_path=path, **row) for row in AnalysisEngine.sweep_track(track, grid)]
+
+        columns = ["file_path", "params_id"] + list(AnalysisEngine.parameters()) + AnalysisEngine.SWEEP_METRICS
+        table = pd.DataFrame(rows, columns=columns)
+        reference = table[table["params_id"] == baseline].set_index("file_path")[AnalysisEngine.SWEEP_METRICS]
+        for metric in AnalysisEngine.SWEEP_METRICS:
+            table[f"{metric}_diff"] = table[metric] - table["file_path"].map(reference[metric])
+        return table
+
+    @staticmethod
+    def sweep_track(track: Track, grid: list) -> list:
+        """Sweep results of one track, one dict per parameter set.
+
+        Resampling, speeds and rates are computed once per interval and distance backend,
+        and flight triggers once per pair of flight thresholds; only the state machine and the phase metrics
+        run for every parameter set. The phases are the ones `split_into_phases` returns.
+        """
+        altitude_col = "Alt_gps"
+        ticks = track.time_ticks()
+        alt = track.column(altitude_col)
+        alt = alt.astype(np.int64 if alt.dtype.kind in "iu" else np.float64)
+        per_second = np.timedelta64(1, "s") / np.timedelta64(1, track.time_unit)
+
+        resampled = {}
+        activities = {}
+        rows = []
+        for params_id, params in enumerate(grid):
+            params = AnalysisEngine.parameters(**params)
+            interval = params["resample_interval"]
+            backend = params["distance_backend"]
+            if (interval, backend) not in resampled:
+                df_resampled = track.get_resampled(interval, ["Lat", "Long", altitude_col])
+                lTime = df_resampled.index.as_unit(track.time_unit).asi8 if len(df_resampled) else np.zeros(0, dtype=np.int64)
+                resampled[(interval, backend)] = (df_resampled, lTime, df_resampled[altitude_col].to_numpy(dtype=float),
+                                                  AnalysisEngine.compute_speed_and_rate(df_resampled, altitude_col, backend))
+
+            df_resampled, lTime, lAltitude, (speed, rate) = resampled[(interval, backend)]
+            bounds = []
+            if len(df_resampled):
+                key = (interval, backend, params["flight_speed_kmh"], params["flight_rate_mh"])
+                if key not in activities:
+                    activities[key] = AnalysisEngine.activity_from(speed, rate, params["flight_speed_kmh"],
+                                                                   params["flight_rate_mh"])
+                bounds = AnalysisEngine._run_state_machine(range(len(lTime)), lAltitude, activities[key], params)
+
+            row = {"params_id": params_id, **params}
+            row.update(AnalysisEngine._phase_totals(track, ticks, alt, per_second, lTime, bounds, params))
+            rows.append(row)
+        return rows
+
+    @staticmethod
+    def _phase_totals(track: Track, ticks: np.ndarray, alt: np.ndarray, per_second: float, lTime: np.ndarray,
+                      bounds: list, params: dict) -> dict:
+        """Counts and walk/flight totals of the phases given by state machine bounds, computed
+        with the same arithmetic as `Phase` without building the phase objects."""
+        totals = dict.fromkeys(AnalysisEngine.SWEEP_METRICS, 0)
+        if not bounds:
+            return totals
+
+        first, last, bUp = (np.array(values) for values in zip(*bounds))
+        start = np.searchsorted(ticks, lTime[first], side="left")
+        stop = np.searchsorted(ticks, lTime[last], side="right")
+        keep = stop > start
+        start, stop, bUp = start[keep], stop[keep], bUp[keep].astype(bool)
+        if not len(start):
+            return totals
+
+        # Phases do not overlap, so [start0, stop0, start1, stop1, ...] is sorted
+        edges = np.column_stack((start, stop)).ravel()
+        padded = np.append(alt, alt[-1])
+        # fmax/fmin skip missing altitudes, as Phase does
+        height = np.fmax.reduceat(padded, edges)[::2] - np.fmin.reduceat(padded, edges)[::2]
+        height = np.where(bUp, height, -height)
+
+        hours = (ticks[stop - 1] - ticks[start]) / per_second / 3600.0
+        cumulative = track.cumulative_distance_for(params["distance_backend"])
+        missing = track.missing_steps_for(params["distance_backend"])
+        distance = np.where(missing[stop - 1] != missing[start], np.nan, cumulative[stop - 1] - cumulative[start])
+        distance = np.where(stop - start >= 2, distance, 0.0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rate = np.where(hours != 0, height / hours, 0)
+            speed = np.where(hours > 0, (distance / 1000.0) / hours, 0)
+        is_flight = (speed > params["flight_speed_kmh"]) | (np.abs(rate) > params["flight_rate_mh"])
+
+        for label, mask in (("walk", ~is_flight), ("flight", is_flight)):
+            totals[f"{label}_phases"] = int(mask.sum())
+            totals[f"{label}_distance"] = float(distance[mask].sum())
+            totals[f"{label}_hours"] = float(hours[mask].sum())
+            totals[f"{label}_d_plus"] = float(height[mask & (height > 0)].sum())
+        totals["phases"] = len(start)
+        return totals
+
+    @staticmethod
+    def phase_table(phases: list) -> pd.DataFrame:
+        """One row per phase with its metrics (`PHASE_TABLE_COLUMNS`, duration in seconds).
+
+        Heights and altitudes keep the dtype of the track (integers for IGC files).
+        """
+        return pd.DataFrame({
+            "is_flight": np.array([p.is_flight for p in phases], dtype=bool),
+            "direction": np.array([p.direction for p in phases], dtype=bool),
+            "height": np.array([p.height for p in phases]),
+            "duration": np.array([p.duration.total_seconds() for p in phases], dtype=float),
+            "distance": np.array([p.distance for p in phases], dtype=float),
+            "rate": np.array([p.rate_metersperhour for p in phases], dtype=float),
+            "min_alt": np.array([p.min_alt for p in phases]),
+            "max_alt": np.array([p.max_alt for p in phases]),
+            "start_time": [p.first_time for p in phases],
+            "end_time": [p.last_time for p in phases],
+        }, columns=AnalysisEngine.PHASE_TABLE_COLUMNS)
+
     @staticmethod
     def get_logical_phases(phases: list) -> list:
         """Groups consecutive phases of the same activity type."""
@@ -141,3 +314,113 @@ class AnalysisEngine:
             logical_phases.append(LogicalPhase(current_group))
             
         return logical_phases
+
+class PhaseStateMachine:
+    """Direction/activity hysteresis of `split_into_phases`, fed one resampled sample at a time.
+
+    Only the boundaries of the current phase and of the pending change of state are kept,
+    so the state does not grow with the track. `push` and `finish` return the phases they
+    finalize as (first sample time, last sample time, bUp) tuples.
+    """
+
+    def __init__(self, threshold_change_state: int = None, hysteresis_margin: float = None):
+        self.threshold_change_state = AnalysisEngine.THRESHOLD_CHANGE_STATE if threshold_change_state is None else threshold_change_state
+        self.hysteresis_margin = AnalysisEngine.ALTITUDE_HYSTERESIS_MARGIN if hysteresis_margin is None else hysteresis_margin
+        # The initial direction needs the second sample: the first one is held until then
+        self._first_sample = None
+        self._started = False
+        self.bUp = True
+        self.bFlight = False
+        self.extreme_altitude = None
+        self.phase_start = self.phase_end = None
+        self.change_start = self.change_end = None
+        self.it_change_state = 0
+
+    @property
+    def pending_start(self):
+        """Time of the earliest sample that may still belong to a phase not returned yet."""
+        if self._first_sample is not None:
+            return self._first_sample[0]
+        return self.phase_start if self.phase_start is not None else self.change_start
+
+    def push(self, time_idx, current_alt: float, current_is_f: bool) -> list:
+        if self._started:
+            return self._step(time_idx, current_alt, current_is_f)
+        if self._first_sample is None:
+            self._first_sample = (time_idx, current_alt, current_is_f)
+            return []
+
+        first = self._first_sample
+        self._first_sample = None
+        self._start(first, bool(current_alt >= first[1]))
+        return self._step(*first) + self._step(time_idx, current_alt, current_is_f)
+
+    def finish(self) -> list:
+        """Flushes the last phase; the machine must not be fed afterwards."""
+        lBounds = []
+        if self._first_sample is not None:
+            first = self._first_sample
+            self._first_sample = None
+            self._start(first, True)
+            lBounds += self._step(*first)
+
+        # Add last remaining phase
+        if self.phase_start is not None:
+            end = self.change_end if self.it_change_state > 0 else self.phase_end
+            lBounds.append((self.phase_start, end, self.bUp))
+            self.phase_start = self.phase_end = None
+            self.change_start = self.change_end = None
+            self.it_change_state = 0
+        return lBounds
+
+    def _start(self, first_sample, bUp: bool):
+        self._started = True
+        self.bUp = bUp
+        self.bFlight = bool(first_sample[2])
+        self.extreme_altitude = first_sample[1]
+
+    def _step(self, time_idx, current_alt: float, current_is_f: bool) -> list:
+        activity_aligned = (current_is_f == self.bFlight)
+
+        direction_aligned = False
+        if self.bUp:
+            if current_alt >= self.extreme_altitude - self.hysteresis_margin:
+                direction_aligned = True
+                if current_alt > self.extreme_altitude: self.extreme_altitude = current_alt
+        else:
+            if current_alt <= self.extreme_altitude + self.hysteresis_margin:
+                direction_aligned = True
+                if current_alt < self.extreme_altitude: self.extreme_altitude = current_alt
+
+        if activity_aligned and direction_aligned:
+            if self.it_change_state > 0:
+                # The pending samples join the current phase
+                if self.phase_start is None:
+                    self.phase_start = self.change_start
+                self.change_start = self.change_end = None
+                self.it_change_state = 0
+            if self.phase_start is None:
+                self.phase_start = time_idx
+            self.phase_end = time_idx
+            return []
+
+        self.it_change_state += 1
+        if self.change_start is None:
+            self.change_start = time_idx
+        self.change_end = time_idx
+        if self.it_change_state < self.threshold_change_state:
+            return []
+
+        # Finalize phase
+        lBounds = []
+        if self.phase_start is not None:
+            lBounds.append((self.phase_start, self.phase_end, self.bUp))
+
+        # Reset state: the pending samples start the next phase
+        self.phase_start, self.phase_end = self.change_start, self.change_end
+        self.change_start = self.change_end = None
+        self.it_change_state = 0
+        self.bUp = not self.bUp if not direction_aligned else self.bUp
+        self.bFlight = current_is_f
+        self.extreme_altitude = current_alt
+        return lBounds
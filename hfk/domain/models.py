@@ -1,10 +1,145 @@
 # Copyright (C) 2024 aherve4
 # Licensed under the GNU GPL v3.0
 
+import numpy as np
 import pandas as pd
 import datetime
 import logging
-import pyproj
+from .distance import get_distance_backend
+
+# Mean Earth radius (m), for local projections
+_EARTH_RADIUS = 6371008.8
+
+def cumulative_distance(lat, lon, backend=None) -> tuple:
+    """Cumulative distance (m) along a sequence of fixes, starting at 0, and cumulative
+    count of the steps whose distance is unknown (a fix with a missing coordinate).
+
+    Unknown steps add 0 to the distance, so they do not propagate past their range: a
+    range [i, j] with `missing[j] != missing[i]` has an unknown (NaN) distance.
+    `backend` is a distance backend or its name (geodesic by default).
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    cumulative = np.zeros(len(lat))
+    missing = np.zeros(len(lat), dtype=np.int64)
+    if len(lat) >= 2:
+        steps = get_distance_backend(backend).steps(lat, lon)
+        unknown = np.isnan(steps)
+        np.cumsum(np.where(unknown, 0.0, steps), out=cumulative[1:])
+        np.cumsum(unknown, out=missing[1:])
+    return cumulative, missing
+
+def nan_extrema(values) -> tuple:
+    """(min, max) of `values` with NaN skipped, as pandas does; NaN for both if no value is known."""
+    values = np.asarray(values)
+    if values.dtype.kind == "f":
+        known = values[~np.isnan(values)]
+        if not len(known):
+            return np.nan, np.nan
+        values = known
+    return values.min(), values.max()
+
+def binned_means(values, bounds) -> np.ndarray:
+    """Mean of each group of consecutive rows [bounds[i], bounds[i + 1]), NaN skipped.
+
+    `values` is one column or a 2-D array of columns. Sums are accumulated row after row
+    with `np.bincount`; the streaming segmenter adds fixes in the same order so both
+    give identical means.
+    """
+    bounds = np.asarray(bounds, dtype=np.int64)
+    counts = np.diff(bounds)
+    codes = np.repeat(np.arange(len(counts)), counts)
+    values = np.asarray(values, dtype=float)[bounds[0]:bounds[-1]]
+    one_column = values.ndim == 1
+    values = values.reshape(len(values), -1)
+
+    means = np.empty((len(counts), values.shape[1]))
+    for i in range(values.shape[1]):
+        column = values[:, i]
+        missing = np.isnan(column)
+        if missing.any():
+            sums = np.bincount(codes[~missing], weights=column[~missing], minlength=len(counts))
+            valid_counts = np.bincount(codes[~missing], minlength=len(counts))
+        else:
+            sums = np.bincount(codes, weights=column, minlength=len(counts))
+            valid_counts = counts
+        with np.errstate(divide="ignore", invalid="ignore"):
+            means[:, i] = np.where(valid_counts > 0, sums / valid_counts, np.nan)
+    return means[:, 0] if one_column else means
+
+def douglas_peucker_significance(lat, lon, min_tolerance: float = 0.0) -> np.ndarray:
+    """Largest Douglas-Peucker tolerance (m) at which each fix is still kept.
+
+    The fixes kept by a simplification with tolerance t are those with a significance
+    above t (the end points are infinite), so one pass serves every tolerance. Fixes are
+    projected on a local equirectangular plane and compared with the segment between the
+    two fixes bounding them. Splitting stops at `min_tolerance`: fixes dropped at that
+    tolerance get 0.
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    n = len(lat)
+    significance = np.zeros(n)
+    if n == 0:
+        return significance
+    significance[[0, -1]] = np.inf
+
+    lat_0 = np.nanmean(lat)
+    x = np.radians(lon - np.nanmean(lon)) * _EARTH_RADIUS * np.cos(np.radians(lat_0))
+    y = np.radians(lat - lat_0) * _EARTH_RADIUS
+
+    stack = [(0, n - 1, np.inf)]
+    while stack:
+        first, last, parent = stack.pop()
+        if last - first < 2:
+            continue
+        dx, dy = x[last] - x[first], y[last] - y[first]
+        px, py = x[first + 1:last] - x[first], y[first + 1:last] - y[first]
+        length2 = dx * dx + dy * dy
+        t = np.clip((px * dx + py * dy) / length2, 0, 1) if length2 > 0 else 0.0
+        dist = np.hypot(px - t * dx, py - t * dy)
+        i = int(np.argmax(dist))
+        if not dist[i] > min_tolerance:
+            continue
+        i += first + 1
+        # A fix is only kept when the fixes splitting the segments above it are kept too,
+        # so its significance is capped by theirs
+        significance[i] = min(dist[i - first - 1], parent)
+        stack.append((first, i, significance[i]))
+        stack.append((i, last, significance[i]))
+    return significance
+
+def lttb_indices(x, y, n_out: int) -> np.ndarray:
+    """Rows kept by Largest-Triangle-Three-Buckets downsampling to `n_out` points.
+
+    The first and last points are kept; the others are split into `n_out - 2` buckets and
+    each bucket keeps the point forming the largest triangle with the point kept in the
+    previous bucket and the mean of the next one. Bucket means are computed at once and
+    each bucket's areas in one vectorized step, so peaks and turning points survive.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = (np.arange(n_out - 1) * ((n - 2) / (n_out - 2))).astype(np.int64) + 1
+    edges[-1] = n - 1
+    starts, stops = edges[:-1], edges[1:]
+    counts = stops - starts
+    # Mean of the next bucket; the last point follows the last bucket
+    next_x = np.append(np.add.reduceat(x[:n - 1], starts)[1:] / counts[1:], x[-1])
+    next_y = np.append(np.add.reduceat(y[:n - 1], starts)[1:] / counts[1:], y[-1])
+
+    rows = np.empty(n_out, dtype=np.int64)
+    rows[0], rows[-1] = 0, n - 1
+    a = 0
+    for i, (start, stop) in enumerate(zip(starts.tolist(), stops.tolist())):
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - next_x[i]) * (y[start:stop] - ay) - (ax - x[start:stop]) * (next_y[i] - ay))
+        a = start + int(np.argmax(area))
+        rows[i + 1] = a
+    return rows
 
 class Point:
     """Value object representing a single recording point."""
@@ -16,34 +151,440 @@ class Point:
         self.alt_pressure = alt_pressure
 
 class Track:
-    """Entity representing a full recording."""
-    def __init__(self, dataframe: pd.DataFrame, file_path: str = None):
-        self.dataframe = dataframe
+    """Entity representing a full recording.
+
+    Fixes are stored column-wise in one contiguous buffer: time as an offset from the
+    first fix (int32 seconds when possible), integer columns in the narrowest integer
+    type that holds them, and coordinates as float64 or, with
+    `coordinate_encoding="microdegrees"`, as fixed-point int32. `dataframe` decodes the
+    buffer into a new DataFrame on each access, for existing callers.
+    """
+    COORDINATE_COLUMNS = ("Lat", "Long")
+    MICRODEGREES = 1e6
+    _ALIGNMENT = 8
+    RESAMPLE_PYRAMID = ("10s", "30s", "1min", "5min")
+    MAX_RESAMPLE_LEVELS = 8
+
+    def __init__(self, dataframe: pd.DataFrame, file_path: str = None, coordinate_encoding: str = "float64"):
         self.file_path = file_path
         self.file_name = pd.io.common.os.path.basename(file_path) if file_path else "Unknown"
+        self._cumulative_distances = {}
+        self._resample_levels = {}
+        self._simplification = None
+        self._downsampled = {}
+        self._bbox = None
+        self._buffer, self._layout = self._encode(dataframe, coordinate_encoding)
+        self._bind_columns()
+
+    @classmethod
+    def _encode(cls, dataframe: pd.DataFrame, coordinate_encoding: str):
+        if coordinate_encoding not in ("float64", "microdegrees"):
+            raise ValueError(f"Unknown coordinate encoding: {coordinate_encoding}")
+
+        index = pd.DatetimeIndex(dataframe.index)
+        tz = index.tz
+        if tz is not None:
+            index = index.tz_convert("UTC")
+        unit = index.unit
+        ticks = index.asi8
+        base = int(ticks[0]) if len(ticks) else 0
+        offsets = ticks - base
+        per_second = int(np.timedelta64(1, "s") / np.timedelta64(1, unit))
+        if len(offsets) == 0 or (not (offsets % per_second).any() and
+                                 np.abs(offsets // per_second).max() <= np.iinfo(np.int32).max):
+            time_values, time_scale = (offsets // per_second).astype(np.int32), per_second
+        else:
+            time_values, time_scale = offsets, 1
+
+        columns = [("__time__", time_values, None)]
+        for name in dataframe.columns:
+            values = dataframe[name].to_numpy()
+            encoding = None
+            if name in cls.COORDINATE_COLUMNS and coordinate_encoding == "microdegrees":
+                values = np.round(values.astype(float) * cls.MICRODEGREES).astype(np.int32)
+                encoding = "microdegrees"
+            elif values.dtype.kind in "iu":
+                values = values.astype(cls._narrowest_int(values))
+            elif values.dtype.kind == "f":
+                values = values.astype(np.float64)
+            elif values.dtype.kind != "b":
+                raise TypeError(f"Column {name} has unsupported dtype {values.dtype}")
+            columns.append((name, values, encoding))
+
+        layout = {
+            "rows": len(index),
+            "source_bytes": int(dataframe.memory_usage(index=True, deep=True).sum()),
+            "index_name": dataframe.index.name,
+            "time_unit": unit,
+            "time_tz": str(tz) if tz is not None else None,
+            "time_base": base,
+            "time_scale": time_scale,
+            "columns": [],
+        }
+        offset = 0
+        for name, values, encoding in columns:
+            layout["columns"].append({"name": name, "dtype": values.dtype.str, "offset": offset, "encoding": encoding})
+            offset += -(-values.nbytes // cls._ALIGNMENT) * cls._ALIGNMENT
+
+        buffer = np.zeros(offset, dtype=np.uint8)
+        for (name, values, encoding), column in zip(columns, layout["columns"]):
+            buffer[column["offset"]:column["offset"] + values.nbytes] = np.ascontiguousarray(values).view(np.uint8)
+        return buffer, layout
+
+    @staticmethod
+    def _narrowest_int(values: np.ndarray):
+        if len(values) == 0:
+            return np.int16
+        low, high = values.min(), values.max()
+        for dtype in (np.int16, np.int32):
+            info = np.iinfo(dtype)
+            if info.min <= low and high <= info.max:
+                return dtype
+        return np.int64
+
+    def _bind_columns(self):
+        rows = self._layout["rows"]
+        self._columns = {}
+        for column in self._layout["columns"]:
+            dtype = np.dtype(column["dtype"])
+            raw = self._buffer[column["offset"]:column["offset"] + rows * dtype.itemsize].view(dtype)
+            self._columns[column["name"]] = (raw, column["encoding"])
+
+    def __len__(self):
+        return self._layout["rows"]
+
+    @property
+    def columns(self) -> list:
+        return [c["name"] for c in self._layout["columns"][1:]]
+
+    def column(self, name: str) -> np.ndarray:
+        """Values of one column; a view on the buffer unless it is fixed-point encoded."""
+        raw, encoding = self._columns[name]
+        if encoding == "microdegrees":
+            return raw / self.MICRODEGREES
+        return raw
+
+    @property
+    def empty(self) -> bool:
+        return len(self) == 0
+
+    @property
+    def time_unit(self) -> str:
+        """Unit of the ticks returned by `time_ticks` ("s", "ms", "us" or "ns")."""
+        return self._layout["time_unit"]
+
+    def time_ticks(self, rows=slice(None)) -> np.ndarray:
+        """Timestamps as int64 ticks of the original time unit."""
+        raw, _ = self._columns["__time__"]
+        return raw[rows].astype(np.int64) * self._layout["time_scale"] + self._layout["time_base"]
+
+    def _to_ticks(self, timestamp) -> int:
+        timestamp = pd.Timestamp(timestamp)
+        if timestamp.tz is not None:
+            timestamp = timestamp.tz_convert("UTC").tz_localize(None)
+        return int(timestamp.to_datetime64().astype(f"datetime64[{self._layout['time_unit']}]").astype(np.int64))
+
+    def _index(self, ticks: np.ndarray) -> pd.DatetimeIndex:
+        index = pd.DatetimeIndex(ticks.view(f"datetime64[{self._layout['time_unit']}]"), name=self._layout["index_name"])
+        if self._layout["time_tz"] is not None:
+            index = index.tz_localize("UTC").tz_convert(self._layout["time_tz"])
+        return index
+
+    def timestamp(self, row: int) -> pd.Timestamp:
+        return self._index(self.time_ticks(slice(row, row + 1)))[0]
+
+    def searchsorted(self, timestamp, side: str = "left") -> int:
+        """Row position of a timestamp in the (sorted) track."""
+        raw, _ = self._columns["__time__"]
+        target = (self._to_ticks(timestamp) - self._layout["time_base"]) / self._layout["time_scale"]
+        return int(np.searchsorted(raw, target, side=side))
+
+    def to_dataframe(self, rows=slice(None), columns: list = None) -> pd.DataFrame:
+        """DataFrame of the selected rows (a slice or an array of positions) and columns
+        (all by default)."""
+        columns = self.columns if columns is None else list(columns)
+        data = {name: self.column(name)[rows] for name in columns}
+        return pd.DataFrame(data, index=self._index(self.time_ticks(rows)), columns=columns)
+
+    @property
+    def dataframe(self) -> pd.DataFrame:
+        """The whole track as a new DataFrame, decoded from the buffer on every access:
+        prefer `column` or `to_dataframe` on a selection of rows and columns."""
+        return self.to_dataframe()
+
+    @property
+    def bbox(self) -> tuple:
+        """Extents of the fixes (lat_min, lat_max, lon_min, lon_max), computed once; None
+        for an empty track."""
+        if self._bbox is None and not self.empty:
+            lat, lon = self.column("Lat"), self.column("Long")
+            self._bbox = (float(np.nanmin(lat)), float(np.nanmax(lat)), float(np.nanmin(lon)), float(np.nanmax(lon)))
+        return self._bbox
+
+    def memory_footprint(self) -> dict:
+        """Resident size of the compact buffer compared with the DataFrame it was built from."""
+        compact = int(self._buffer.nbytes)
+        source = self._layout["source_bytes"]
+        return {
+            "rows": len(self),
+            "compact_bytes": compact,
+            "dataframe_bytes": source,
+            "saved_bytes": source - compact,
+            "ratio": round(compact / source, 3) if source else 0,
+        }
+
+    @property
+    def cumulative_distance(self) -> np.ndarray:
+        """Geodesic distance (m) from the first fix to each fix, computed once per track."""
+        return self.cumulative_distance_for(None)
+
+    def cumulative_distance_for(self, backend=None) -> np.ndarray:
+        """Distance (m) from the first fix to each fix with a given distance backend,
+        computed once per track and backend. Steps of unknown distance count as 0 (see
+        `missing_steps_for`)."""
+        return self._cumulative(backend)[0]
+
+    def missing_steps_for(self, backend=None) -> np.ndarray:
+        """Number of steps of unknown distance from the first fix to each fix."""
+        return self._cumulative(backend)[1]
+
+    def _cumulative(self, backend) -> tuple:
+        backend = get_distance_backend(backend)
+        if backend.name not in self._cumulative_distances:
+            self._cumulative_distances[backend.name] = cumulative_distance(self.column("Lat"), self.column("Long"), backend)
+        return self._cumulative_distances[backend.name]
+
+    def distance_between(self, start: int, stop: int, backend=None) -> float:
+        """Distance (m) covered by the fixes in the row range [start, stop), NaN if a
+        fix of the range has a missing coordinate."""
+        if stop - start < 2:
+            return 0.0
+        cumulative, missing = self._cumulative(backend)
+        if missing[stop - 1] != missing[start]:
+            return float("nan")
+        return float(cumulative[stop - 1] - cumulative[start])
+
+    def simplified_rows(self, tolerance: float) -> np.ndarray:
+        """Rows kept by a Douglas-Peucker simplification with `tolerance` metres (all rows
+        for a tolerance of 0).
+
+        The significance of the fixes is computed once, down to the smallest tolerance
+        requested so far, and the rows of each tolerance are kept (see
+        `build_simplification_levels`).
+        """
+        if tolerance <= 0 or len(self) < 3:
+            return np.arange(len(self))
+        if self._simplification is None or self._simplification["min_tolerance"] > tolerance:
+            self._simplification = {
+                "min_tolerance": tolerance,
+                "significance": douglas_peucker_significance(self.column("Lat"), self.column("Long"), tolerance),
+                "rows": {},
+            }
+        rows = self._simplification["rows"]
+        if tolerance not in rows:
+            rows[tolerance] = np.flatnonzero(self._simplification["significance"] > tolerance)
+        return rows[tolerance]
+
+    def downsampled_rows(self, n_points: int, column: str = "Alt_gps", rows=slice(None)) -> np.ndarray:
+        """Rows kept by LTTB downsampling of `column` against time to `n_points` points.
 
-    def get_resampled(self, interval: str):
+        Computed once per column and point count for the whole track; a range of `rows`
+        (a slice) is downsampled on its own and not cached.
+        """
+        start, stop, _ = rows.indices(len(self))
+        if stop - start <= n_points:
+            return np.arange(start, stop)
+        whole = (start, stop) == (0, len(self))
+        key = (column, n_points)
+        if whole and key in self._downsampled:
+            return self._downsampled[key]
+        time = self.time_ticks(rows).astype(float)
+        selected = lttb_indices(time, self.column(column)[rows], n_points) + start
+        if whole:
+            self._downsampled[key] = selected
+        return selected
+
+    def build_simplification_levels(self, tolerances):
+        """Precomputes the simplified rows of several tolerances in a single pass."""
+        tolerances = sorted(t for t in tolerances if t > 0)
+        for tolerance in tolerances:
+            self.simplified_rows(tolerance)
+
+    def to_columns(self) -> dict:
+        """Compact, picklable representation of the track: the buffer and its layout."""
+        return {"buffer": self._buffer, "layout": self._layout}
+
+    @classmethod
+    def from_columns(cls, columns: dict, file_path: str = None) -> "Track":
+        """Rebuilds a track from the output of `to_columns` without re-encoding it."""
+        track = cls.__new__(cls)
+        track.file_path = file_path
+        track.file_name = pd.io.common.os.path.basename(file_path) if file_path else "Unknown"
+        track._cumulative_distances = {}
+        track._resample_levels = {}
+        track._simplification = None
+        track._downsampled = {}
+        track._bbox = None
+        track._buffer = np.asarray(columns["buffer"], dtype=np.uint8)
+        track._layout = columns["layout"]
+        track._bind_columns()
+        return track
+
+    def get_resampled(self, interval: str, columns: list = None) -> pd.DataFrame:
+        """Mean of the selected columns (all by default) over time bins aligned on the
+        start of the day, like `dataframe.resample(interval).mean()`.
+
+        Bins are computed once per interval and kept in a small pyramid of levels, and
+        the means of a column are computed the first time it is requested.
+        """
+        columns = self.columns if columns is None else list(columns)
         if not interval:
-            return self.dataframe
-        return self.dataframe.resample(interval).mean()
+            return self.to_dataframe(columns=columns)
+
+        level = self._resample_level(interval)
+        if level is None:
+            return self.to_dataframe(columns=columns).resample(interval).mean()
+
+        bins = level["bins"]
+        first = int(bins[0])
+        ticks = level["origin"] + (first + np.arange(int(bins[-1]) - first + 1)) * level["step"]
+        missing = [name for name in columns if name not in level["means"]]
+        if missing:
+            means = binned_means(np.column_stack([self.column(name) for name in missing]), level["bounds"])
+            for i, name in enumerate(missing):
+                level["means"][name] = means[:, i]
+
+        data = {}
+        for name in columns:
+            values = np.full(len(ticks), np.nan)
+            values[bins - first] = level["means"][name]
+            data[name] = values
+        return pd.DataFrame(data, index=self._index(ticks), columns=columns)
+
+    def build_resample_pyramid(self, intervals=RESAMPLE_PYRAMID):
+        """Computes the bins of several intervals, finest first so each level is derived
+        from the previous one."""
+        steps = sorted((pd.Timedelta(interval), interval) for interval in intervals)
+        for _, interval in steps:
+            self._resample_level(interval)
+
+    def _resample_level(self, interval: str):
+        """Bins of one interval: the ids of the non-empty bins and their row bounds.
+
+        Returns None when the bins cannot be computed here (empty, unsorted or
+        timezone-aware tracks, calendar intervals); the caller then uses pandas.
+        """
+        try:
+            offset = pd.tseries.frequencies.to_offset(interval)
+            step = pd.Timedelta(offset)
+        except (ValueError, TypeError):
+            return None
+        if not isinstance(offset, pd.offsets.Tick) or step <= pd.Timedelta(0):
+            return None
+        step = int(step / np.timedelta64(1, self._layout["time_unit"]))
+
+        levels = self._resample_levels
+        if step in levels:
+            # Most recently used last
+            levels[step] = levels.pop(step)
+            return levels[step]
+
+        if len(self) == 0 or self._layout["time_tz"] is not None:
+            return None
+
+        finer = [s for s in levels if step % s == 0]
+        if finer:
+            # Coarser bins are unions of consecutive finer bins
+            source = levels[max(finer)]
+            bins = source["bins"] // (step // source["step"])
+            first_bins = np.flatnonzero(np.diff(bins, prepend=bins[0] - 1))
+            bounds = np.append(source["bounds"][first_bins], len(self))
+            bins = bins[first_bins]
+            origin = source["origin"]
+        else:
+            ticks = self.time_ticks()
+            if (np.diff(ticks) < 0).any():
+                return None
+            day = int(np.timedelta64(1, "D") / np.timedelta64(1, self._layout["time_unit"]))
+            origin = int(ticks[0]) - int(ticks[0]) % day
+            row_bins = (ticks - origin) // step
+            first_rows = np.flatnonzero(np.diff(row_bins, prepend=row_bins[0] - 1))
+            bounds = np.append(first_rows, len(self))
+            bins = row_bins[first_rows]
+
+        level = {"step": step, "origin": origin, "bins": bins, "bounds": bounds, "means": {}}
+        levels[step] = level
+        while len(levels) > self.MAX_RESAMPLE_LEVELS:
+            levels.pop(next(iter(levels)))
+        return level
+
+class TrackHeader:
+    """Lightweight description of a track file, available without parsing every fix."""
+    def __init__(self, file_path: str, date: datetime.date = None, pilot: str = None, glider: str = None,
+                 start_time: datetime.datetime = None, end_time: datetime.datetime = None, bbox: tuple = None):
+        self.file_path = file_path
+        self.file_name = pd.io.common.os.path.basename(file_path) if file_path else "Unknown"
+        self.date = date
+        self.pilot = pilot
+        self.glider = glider
+        self.start_time = start_time
+        self.end_time = end_time
+        self.bbox = bbox # (lat_min, lat_max, lon_min, lon_max)
+
+    @classmethod
+    def from_track(cls, track: Track, pilot: str = None, glider: str = None) -> "TrackHeader":
+        if track.empty:
+            return cls(track.file_path, pilot=pilot, glider=glider)
+        start_time = track.timestamp(0).to_pydatetime()
+        return cls(
+            track.file_path, date=start_time.date(), pilot=pilot, glider=glider,
+            start_time=start_time, end_time=track.timestamp(len(track) - 1).to_pydatetime(),
+            bbox=track.bbox
+        )
 
 class Phase:
-    """Results of track segmentation (Walk/Flight)."""
-    def __init__(self, df: pd.DataFrame, bUp: bool):
-        self.dataframe = df
+    """Results of track segmentation (Walk/Flight).
+
+    A phase is a view on the rows [start, stop) of its parent track. Its metrics are
+    computed once at creation; the DataFrame is only sliced when `dataframe` is read.
+    """
+    __slots__ = ("track", "start", "stop", "direction", "distance", "height", "duration", "durationHours",
+                 "rate_metersperhour", "is_flight", "speed_kmh", "min_alt", "max_alt", "first_time", "last_time")
+
+    def __init__(self, track, bUp: bool, start: int = 0, stop: int = None):
+        if isinstance(track, pd.DataFrame):
+            track = Track(track)
+        self.track = track
+        self.start = start
+        self.stop = len(track) if stop is None else stop
         self.direction = bUp
         self.distance = 0
-        
-        if self.dataframe.empty:
+        # Determine if it is a flight phase based on heuristics
+        # These will be updated by the AnalysisEngine after calling compute_distance
+        self.is_flight = False
+        self.speed_kmh = 0
+
+        if self.stop <= self.start:
             self.height = 0
             self.duration = datetime.timedelta(0)
             self.durationHours = 0
             self.rate_metersperhour = 0
-            self.is_flight = False
+            self.min_alt = self.max_alt = np.nan
+            self.first_time = self.last_time = None
             return
 
-        self.height = (-1 * (not bUp) + 1 * bUp) * (self.dataframe["Alt_gps"].max() - self.dataframe["Alt_gps"].min())
-        self.duration = self.dataframe.index.max() - self.dataframe.index.min()
+        alt = track.column("Alt_gps")[self.start:self.stop]
+        # Widen compact integer storage before doing arithmetic on it
+        wide = np.int64 if alt.dtype.kind in "iu" else np.float64
+        min_alt, max_alt = nan_extrema(alt)
+        self.min_alt = wide(min_alt)
+        self.max_alt = wide(max_alt)
+        self.height = (-1 * (not bUp) + 1 * bUp) * (self.max_alt - self.min_alt)
+
+        # Track rows are sorted by time
+        self.first_time = track.timestamp(self.start)
+        self.last_time = track.timestamp(self.stop - 1)
+        self.duration = self.last_time - self.first_time
         
         if isinstance(self.duration, datetime.timedelta):
             self.durationHours = self.duration.total_seconds()/3600.0
@@ -51,68 +592,92 @@ class Phase:
             self.durationHours = 0
             
         self.rate_metersperhour = self.height/self.durationHours if self.durationHours != 0 else 0
-        
-        # Determine if it is a flight phase based on heuristics
-        # These will be updated by the AnalysisEngine after calling compute_distance
-        self.is_flight = False 
-        self.speed_kmh = 0
 
-    def compute_distance(self):
-        self.distance = 0
-        fLat = None
-        fLong = None
-        
-        lLat = self.dataframe["Lat"].tolist()
-        lLong = self.dataframe["Long"].tolist()
-        
-        for lat, lon in zip(lLat, lLong):
-            if fLat is not None and fLong is not None:
-                geod = pyproj.Geod(ellps="WGS84")
-                _, _, distance = geod.inv(fLong, fLat, lon, lat)
-                self.distance += distance
-            fLat = lat
-            fLong = lon
+    @property
+    def dataframe(self) -> pd.DataFrame:
+        return self.track.to_dataframe(slice(self.start, self.stop))
+
+    def __len__(self):
+        return max(self.stop - self.start, 0)
+
+    def compute_distance(self, distance: float = None, flight_speed_kmh: float = 15, flight_rate_mh: float = 1000,
+                         distance_backend=None):
+        """Sets the distance and derived speed/activity type.
+
+        By default the distance is a prefix-sum difference over the parent track's
+        cumulative distance, computed with `distance_backend` (geodesic by default).
+        """
+        if distance is None:
+            distance = self.track.distance_between(self.start, self.stop, distance_backend)
+        self.distance = distance
         
         # Calculate horizontal speed in km/h
         self.speed_kmh = (self.distance / 1000.0) / self.durationHours if self.durationHours > 0 else 0
         
         # Determine activity type
         # speed > 15 km/h OR |vertical rate| > 1000 m/h
-        self.is_flight = (self.speed_kmh > 15) or \
-                         (abs(self.rate_metersperhour) > 1000)
+        self.is_flight = (self.speed_kmh > flight_speed_kmh) or \
+                         (abs(self.rate_metersperhour) > flight_rate_mh)
+
+    def to_summary(self) -> dict:
+        """Phase boundaries (row offsets into the parent track) and computed metrics."""
+        return {
+            "start": int(self.start),
+            "stop": int(self.stop),
+            "direction": bool(self.direction),
+            "distance": float(self.distance),
+            "speed_kmh": float(self.speed_kmh),
+            "is_flight": bool(self.is_flight),
+        }
+
+    @classmethod
+    def from_summary(cls, track: Track, summary: dict) -> "Phase":
+        """Restores a phase produced by `to_summary` without recomputing its distance."""
+        phase = cls(track, summary["direction"], summary["start"], summary["stop"])
+        phase.distance = summary["distance"]
+        phase.speed_kmh = summary["speed_kmh"]
+        phase.is_flight = summary["is_flight"]
+        return phase
 
     def __str__(self):
         dir_str = "UP" if self.direction else "DOWN"
-        if self.dataframe.empty:
+        if not len(self):
             return f"Phase {dir_str} : [EMPTY]"
-        return f"Phase {dir_str} : {self.dataframe.index[0]} -> {self.dataframe.index[-1]} | Height: {self.height}m"
+        return f"Phase {dir_str} : {self.first_time} -> {self.last_time} | Height: {self.height}m"
 
 class LogicalPhase:
-    """Aggregated segments of the same activity type."""
+    """Aggregated segments of the same activity type.
+
+    Stats are derived from the per-phase metrics; the merged DataFrame is only built
+    when `dataframe` is read.
+    """
+    __slots__ = ("phases", "is_flight", "distance", "duration", "durationHours", "d_plus", "d_minus",
+                 "min_alt", "max_alt", "start_time", "end_time", "climb_rate_val", "descent_rate_val",
+                 "climb_rate", "descent_rate", "icon", "type_label")
+
     def __init__(self, phases: list):
         if not phases:
             raise ValueError("LogicalPhase requires at least one phase")
             
         self.phases = phases
         self.is_flight = getattr(phases[0], 'is_flight', False)
-        
-        # Merge dataframes
-        self.dataframe = pd.concat([p.dataframe for p in phases])
-        self.dataframe = self.dataframe[~self.dataframe.index.duplicated(keep='first')].sort_index()
+        non_empty = [p for p in phases if len(p)]
         
         # Combined stats
         self.distance = sum(p.distance for p in phases)
-        self.duration = self.dataframe.index.max() - self.dataframe.index.min()
+        first_time = min(p.first_time for p in non_empty)
+        last_time = max(p.last_time for p in non_empty)
+        self.duration = last_time - first_time
         self.durationHours = self.duration.total_seconds() / 3600.0 if self.duration.total_seconds() > 0 else 0
         
         self.d_plus = sum(p.height for p in phases if p.height > 0)
         self.d_minus = sum(abs(p.height) for p in phases if p.height < 0)
         
-        self.min_alt = round(self.dataframe["Alt_gps"].min(), 1)
-        self.max_alt = round(self.dataframe["Alt_gps"].max(), 1)
+        self.min_alt = round(nan_extrema([p.min_alt for p in non_empty])[0], 1)
+        self.max_alt = round(nan_extrema([p.max_alt for p in non_empty])[1], 1)
         
-        self.start_time = self.dataframe.index.min().strftime("%H:%M:%S")
-        self.end_time = self.dataframe.index.max().strftime("%H:%M:%S")
+        self.start_time = first_time.strftime("%H:%M:%S")
+        self.end_time = last_time.strftime("%H:%M:%S")
         
         # Rate stats
         climb_rates = [p.rate_metersperhour for p in phases if p.rate_metersperhour > 0]
@@ -134,3 +699,37 @@ class LogicalPhase:
         # Icon/Title for UI
         self.icon = "fas fa-paper-plane" if self.is_flight else "fas fa-walking"
         self.type_label = "Flight" if self.is_flight else "Walk"
+
+    def track_rows(self, rows=None):
+        """Rows of the parent track covered by the phases, restricted to `rows` when
+        given. None when the phases belong to different tracks."""
+        track = self.phases[0].track
+        if any(p.track is not track for p in self.phases):
+            return None
+        ranges = [(p.start, p.stop) for p in self.phases if len(p)]
+        if rows is None:
+            return np.unique(np.concatenate([np.arange(start, stop) for start, stop in ranges]))
+        rows = np.asarray(rows)
+        keep = np.zeros(len(rows), dtype=bool)
+        for start, stop in ranges:
+            keep |= (rows >= start) & (rows < stop)
+        return rows[keep]
+
+    @property
+    def dataframe(self) -> pd.DataFrame:
+        track = self.phases[0].track
+        if any(p.track is not track for p in self.phases):
+            # Phases emitted by a streaming segmenter each have their own track
+            df = pd.concat([p.dataframe for p in self.phases if len(p)]).sort_index(kind="stable")
+            return df[~df.index.duplicated(keep='first')]
+
+        ranges = sorted((p.start, p.stop) for p in self.phases if len(p))
+        if all(prev_stop >= start for (_, prev_stop), (start, _) in zip(ranges, ranges[1:])):
+            df = track.to_dataframe(slice(ranges[0][0], max(stop for _, stop in ranges)))
+        else:
+            rows = np.unique(np.concatenate([np.arange(start, stop) for start, stop in ranges]))
+            df = track.to_dataframe(rows)
+        # Repeated timestamps are kept once, as in a merge on the time index
+        if not df.index.is_unique:
+            df = df[~df.index.duplicated(keep='first')]
+        return df
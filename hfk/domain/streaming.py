@@ -0,0 +1,278 @@
+# Copyright (C) 2024 aherve4
+# Licensed under the GNU GPL v3.0
+
+import bisect
+import logging
+import numpy as np
+import pandas as pd
+from .models import Track, Phase
+from .analysis_engine import AnalysisEngine, PhaseStateMachine
+from .distance import get_distance_backend
+
+_DAY_NS = 86400 * 10**9
+
+class StreamingSegmenter:
+    """Incremental counterpart of `AnalysisEngine.split_into_phases` for live tracks.
+
+    Fixes are pushed one at a time (`push`) or in batches (`push_many`). They are
+    averaged into resampling bins as they arrive (bins aligned on the start of the day
+    and summed in time order, as `Track.get_resampled` does), and each completed bin
+    goes through the same `PhaseStateMachine` as the batch segmentation. Confirmed phases
+    are returned as soon as they are known and `finish` flushes the last one, so
+    replaying a complete track yields the batch phases.
+
+    Fixes may arrive out of order (IGC files have some). A bin is complete once the
+    newest fix is `max_delay` past its end: fixes arriving up to `max_delay` late are
+    averaged as in the batch resampling, at the cost of phases being returned that much
+    later. Later fixes are still added to the phase being built, without changing its
+    resampled samples, unless their phase was already returned: those are dropped and
+    counted in `dropped_count`.
+
+    Only the fixes that may still belong to an unconfirmed phase are kept; every emitted
+    phase is a view on its own small `Track`.
+    """
+
+    RESAMPLED_COLUMNS = ("Lat", "Long", "Alt_gps")
+
+    def __init__(self, resample_interval: str = AnalysisEngine.DEFAULT_RESAMPLE_INTERVAL, file_path: str = None,
+                 threshold_change_state: int = None, altitude_hysteresis_margin: float = None,
+                 flight_speed_kmh: float = None, flight_rate_mh: float = None, distance_backend: str = None,
+                 max_delay: str = None):
+        self.params = AnalysisEngine.parameters(resample_interval, threshold_change_state, altitude_hysteresis_margin,
+                                                flight_speed_kmh, flight_rate_mh, distance_backend)
+        self._backend = get_distance_backend(self.params["distance_backend"])
+        if self._backend.per_track:
+            raise ValueError(f"The {self._backend.name} distance backend needs the whole track")
+        interval = pd.Timedelta(self.params["resample_interval"])
+        if interval <= pd.Timedelta(0):
+            raise ValueError(f"Invalid resample interval: {self.params['resample_interval']}")
+        delay = pd.Timedelta(max_delay or 0)
+        if delay < pd.Timedelta(0):
+            raise ValueError(f"Invalid maximum delay: {max_delay}")
+        self.file_path = file_path
+        self._delay = delay.value
+        self._step = interval.value
+        self._dt_hours = interval.total_seconds() / 3600.0
+        self._machine = PhaseStateMachine(self.params["threshold_change_state"], self.params["altitude_hysteresis_margin"])
+        self._tz = None
+        self._origin = None
+        # Next bin to feed to the state machine, and [sum, count] per resampled column of
+        # the bins from there on that have fixes
+        self._next_bin = None
+        self._bins = {}
+        self._previous = None
+        self._last_fix = None
+        self.fix_count = 0
+        self.dropped_count = 0
+        self.finished = False
+
+        # Full-resolution fixes that may still belong to a phase, with the cumulative
+        # (distance, unknown steps) at each
+        self._times = []
+        self._alt_gps = []
+        self._alt_pressure = []
+        self._lat = []
+        self._lon = []
+        self._cumulative = []
+
+    def push(self, time, lat: float, lon: float, alt_gps: float, alt_pressure: float = None) -> list:
+        """Adds one fix and returns the phases it confirms (usually none)."""
+        if self.finished:
+            raise ValueError("Segmenter already finished")
+
+        oTime = pd.Timestamp(time)
+        if self._origin is None:
+            self._tz = oTime.tz
+        if oTime.tz is not None:
+            oTime = oTime.tz_convert(self._tz).tz_localize(None)
+        iTime = oTime.value
+
+        if self._origin is None:
+            self._origin = iTime - iTime % _DAY_NS
+            self._next_bin = (iTime - self._origin) // self._step
+        iBin = (iTime - self._origin) // self._step
+
+        if self._last_fix is not None and iTime < self._last_fix[0]:
+            self._insert_late(iTime, iBin, lat, lon, alt_gps, alt_pressure)
+            return []
+
+        for sums, value in zip(self._bin_sums(iBin), (lat, lon, alt_gps)):
+            self._accumulate(sums, value)
+
+        if self._last_fix is None:
+            tCumulative = (0.0, 0)
+        else:
+            _, prev_lat, prev_lon, prev_cumulative = self._last_fix
+            tCumulative = self._add_step(prev_cumulative, self._distance(prev_lat, prev_lon, lat, lon))
+        self._last_fix = (iTime, lat, lon, tCumulative)
+
+        self._times.append(iTime)
+        self._lat.append(lat)
+        self._lon.append(lon)
+        self._alt_gps.append(alt_gps)
+        self._alt_pressure.append(alt_pressure)
+        self._cumulative.append(tCumulative)
+        self.fix_count += 1
+        return self._close_bins((iTime - self._delay - self._origin) // self._step)
+
+    def _insert_late(self, iTime: int, iBin: int, lat: float, lon: float, alt_gps: float, alt_pressure: float):
+        """Places a fix older than the newest one among the kept fixes, in time order."""
+        if iBin < self._next_bin and self._previous is None:
+            # No bin fed yet: the resampling starts earlier
+            self._next_bin = iBin
+        elif iBin < self._next_bin and iTime < self._times[0]:
+            self.dropped_count += 1
+            logging.warning(f"Fix at {pd.Timestamp(iTime)} dropped: its phase was already returned")
+            return
+
+        i = bisect.bisect_right(self._times, iTime)
+        for lValues, value in zip((self._times, self._lat, self._lon, self._alt_gps, self._alt_pressure),
+                                  (iTime, lat, lon, alt_gps, alt_pressure)):
+            lValues.insert(i, value)
+        # Cumulative distances after the inserted fix, added one by one as in a replay in
+        # time order (the newest fix is always kept, so the list is not empty)
+        start = max(i - 1, 0)
+        self._cumulative.insert(i, self._cumulative[start])
+        tCumulative = self._cumulative[start]
+        for j, step in enumerate(self._backend.steps(self._lat[start:], self._lon[start:]).tolist(), start=start + 1):
+            tCumulative = self._add_step(tCumulative, step)
+            self._cumulative[j] = tCumulative
+        self._last_fix = self._last_fix[:3] + (self._cumulative[-1],)
+        self.fix_count += 1
+
+        if iBin >= self._next_bin:
+            # Sums of the bin again, in time order
+            self._bins[iBin] = sums = self._empty_sums()
+            start = bisect.bisect_left(self._times, self._label(iBin))
+            stop = bisect.bisect_left(self._times, self._label(iBin + 1))
+            for lValues, column_sums in zip((self._lat, self._lon, self._alt_gps), sums):
+                for value in lValues[start:stop]:
+                    self._accumulate(column_sums, value)
+
+    def push_many(self, fixes) -> list:
+        """Adds a batch of fixes: a track DataFrame (time index, Lat, Long, Alt_gps and
+        optionally Alt_pressure) or an iterable of (time, lat, lon, alt_gps[, alt_pressure])."""
+        if isinstance(fixes, pd.DataFrame):
+            alt_pressure = fixes["Alt_pressure"].tolist() if "Alt_pressure" in fixes else [None] * len(fixes)
+            fixes = zip(fixes.index, fixes["Lat"].tolist(), fixes["Long"].tolist(), fixes["Alt_gps"].tolist(),
+                        alt_pressure)
+        phases = []
+        for fix in fixes:
+            phases += self.push(*fix)
+        return phases
+
+    def finish(self) -> list:
+        """Closes the last bin and returns the remaining phases."""
+        if self.finished:
+            return []
+        phases = []
+        if self._bins:
+            phases = self._close_bins(max(self._bins) + 1)
+        phases += self._build_phases(self._machine.finish())
+        self.finished = True
+        self._trim(None)
+        return phases
+
+    def _empty_sums(self) -> list:
+        return [[0.0, 0] for _ in self.RESAMPLED_COLUMNS]
+
+    def _bin_sums(self, iBin: int) -> list:
+        sums = self._bins.get(iBin)
+        if sums is None:
+            sums = self._bins[iBin] = self._empty_sums()
+        return sums
+
+    @staticmethod
+    def _accumulate(sums: list, value):
+        if value is None or value != value:
+            return
+        sums[0] += float(value)
+        sums[1] += 1
+
+    @staticmethod
+    def _means(sums: list) -> tuple:
+        return tuple(s[0] / s[1] if s[1] else np.nan for s in sums)
+
+    def _close_bins(self, iUntil: int) -> list:
+        """Feeds the bins before `iUntil` to the state machine."""
+        if iUntil <= self._next_bin:
+            return []
+        phases = []
+        for iBin in range(self._next_bin, iUntil):
+            # Bins without fixes are NaN samples, as in the batch resampling
+            sums = self._bins.pop(iBin, None)
+            phases += self._feed(iBin, self._means(sums) if sums else (np.nan,) * len(self.RESAMPLED_COLUMNS))
+        self._next_bin = iUntil
+        self._trim(self._label(iUntil))
+        return phases
+
+    def _label(self, iBin: int) -> int:
+        return self._origin + iBin * self._step
+
+    def _feed(self, iBin: int, means: tuple) -> list:
+        fLat, fLong, fAlt = means
+        bFlight = False
+        if self._previous is not None:
+            prev_lat, prev_lon, prev_alt = self._previous
+            dist = self._distance(prev_lat, prev_lon, fLat, fLong)
+            # Same criteria as AnalysisEngine.compute_activity
+            speed = (dist / 1000.0) / self._dt_hours
+            rate = (fAlt - prev_alt) / self._dt_hours
+            bFlight = bool((speed > self.params["flight_speed_kmh"]) or (abs(rate) > self.params["flight_rate_mh"]))
+        self._previous = means
+        return self._build_phases(self._machine.push(self._label(iBin), fAlt, bFlight))
+
+    def _distance(self, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+        return float(self._backend.pairwise(lat1, lon1, lat2, lon2))
+
+    @staticmethod
+    def _add_step(cumulative: tuple, step: float) -> tuple:
+        """(distance, unknown steps) after a step, as `models.cumulative_distance` counts them."""
+        fDistance, iMissing = cumulative
+        if step != step:
+            return fDistance, iMissing + 1
+        return fDistance + step, iMissing
+
+    def _build_phases(self, lBounds: list) -> list:
+        phases = []
+        for start_t, end_t, bUp in lBounds:
+            start = bisect.bisect_left(self._times, start_t)
+            stop = bisect.bisect_right(self._times, end_t)
+            if stop <= start:
+                continue
+            track = Track(self._fixes_dataframe(start, stop), file_path=self.file_path)
+            p = Phase(track, bUp)
+            (fEnd, iEndMissing), (fStart, iStartMissing) = self._cumulative[stop - 1], self._cumulative[start]
+            if stop - start < 2:
+                distance = 0.0
+            else:
+                distance = float(fEnd - fStart) if iEndMissing == iStartMissing else np.nan
+            p.compute_distance(distance, self.params["flight_speed_kmh"], self.params["flight_rate_mh"],
+                               self._backend)
+            phases.append(p)
+        return phases
+
+    def _fixes_dataframe(self, start: int, stop: int) -> pd.DataFrame:
+        index = pd.DatetimeIndex(np.array(self._times[start:stop], dtype="datetime64[ns]"), name="time")
+        if self._tz is not None:
+            index = index.tz_localize(self._tz)
+        data = {"Alt_gps": self._alt_gps[start:stop]}
+        alt_pressure = self._alt_pressure[start:stop]
+        if all(a is not None for a in alt_pressure):
+            data["Alt_pressure"] = alt_pressure
+        data["Lat"] = self._lat[start:stop]
+        data["Long"] = self._lon[start:stop]
+        return pd.DataFrame(data, index=index)
+
+    def _trim(self, iCurrentLabel):
+        """Drops the fixes that can no longer be part of a phase."""
+        keep_from = self._machine.pending_start
+        if keep_from is None:
+            keep_from = iCurrentLabel
+        if keep_from is None:
+            drop = len(self._times)
+        else:
+            drop = bisect.bisect_left(self._times, keep_from)
+        if drop:
+            for lValues in (self._times, self._lat, self._lon, self._alt_gps, self._alt_pressure, self._cumulative):
+                del lValues[:drop]
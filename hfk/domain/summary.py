@@ -0,0 +1,232 @@
+# Copyright (C) 2024 aherve4
+# Licensed under the GNU GPL v3.0
+
+import numpy as np
+import pandas as pd
+
+class RunningStats:
+    """Count, sum, min and max of a set of values; two of them merge into the stats of the union."""
+    __slots__ = ("count", "total", "min", "max")
+
+    def __init__(self, values=()):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.add(values)
+
+    def add(self, values):
+        values = np.asarray(values)
+        if not len(values):
+            return
+        self._combine(len(values), values.sum().item(), values.min().item(), values.max().item())
+
+    def merge(self, other: "RunningStats"):
+        if other.count:
+            self._combine(other.count, other.total, other.min, other.max)
+
+    def _combine(self, count: int, total, vmin, vmax):
+        self.count += count
+        self.total += total
+        self.min = vmin if self.min is None else min(self.min, vmin)
+        self.max = vmax if self.max is None else max(self.max, vmax)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def describe(self, digits: int = 2) -> dict:
+        if not self.count:
+            return {"min": 0, "avg": 0, "max": 0}
+        return {"min": round(self.min, digits), "avg": round(self.mean, digits), "max": round(self.max, digits)}
+
+class QuantileSketch:
+    """Mergeable quantile summary in the style of KLL, in O(k log(n / k)) memory.
+
+    Values enter level 0 with weight 1. When a level holds `k` values it is sorted and
+    every other value moves up one level with twice the weight; the starting offset
+    alternates between compactions so they do not all lean the same way. Merging two
+    sketches concatenates their levels and compacts again.
+
+    Each compaction at level h moves the rank of any value by at most 2^h. The sum over
+    all compactions, `rank_error`, is therefore a guaranteed bound: the value returned
+    for quantile q has a rank within `rank_error` of q * count. The sketch is exact
+    (`rank_error` 0) until a level first fills up, and in the worst case the relative
+    bound `rank_error / count` grows like log2(n / k) / k.
+    """
+    __slots__ = ("k", "count", "rank_error", "levels", "_offsets")
+
+    def __init__(self, values=(), k: int = 128):
+        self.k = k
+        self.count = 0
+        self.rank_error = 0
+        self.levels = [[]]
+        self._offsets = [0]
+        self.add(values)
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        self.count += len(values)
+        self.levels[0].extend(values.tolist())
+        self._compress()
+
+    def merge(self, other: "QuantileSketch"):
+        if not other.count:
+            return
+        for h, items in enumerate(other.levels):
+            self._level(h).extend(items)
+        self.count += other.count
+        self.rank_error += other.rank_error
+        self._compress()
+
+    def _level(self, h: int) -> list:
+        while len(self.levels) <= h:
+            self.levels.append([])
+            self._offsets.append(0)
+        return self.levels[h]
+
+    def _compress(self):
+        h = 0
+        while h < len(self.levels):
+            items = self.levels[h]
+            if len(items) >= self.k:
+                items.sort()
+                # An odd value out stays at this level
+                kept = [items.pop()] if len(items) % 2 else []
+                offset = self._offsets[h]
+                self._offsets[h] ^= 1
+                self._level(h + 1).extend(items[offset::2])
+                self.levels[h] = kept
+                self.rank_error += 2 ** h
+            h += 1
+
+    @property
+    def relative_error(self) -> float:
+        """`rank_error` as a fraction of the number of values."""
+        return self.rank_error / self.count if self.count else 0.0
+
+    def quantile(self, q: float):
+        """Estimated q-quantile (0 <= q <= 1), None when the sketch is empty."""
+        if not self.count:
+            return None
+        values = np.concatenate([np.asarray(items, dtype=float) for items in self.levels])
+        weights = np.concatenate([np.full(len(items), 2 ** h) for h, items in enumerate(self.levels)])
+        order = np.argsort(values, kind="stable")
+        cumulative = np.cumsum(weights[order])
+        # Smallest value whose weighted rank reaches q * count (the lower value when exact)
+        idx = np.searchsorted(cumulative, max(q * cumulative[-1], 1), side="left")
+        return values[order][min(idx, len(values) - 1)].item()
+
+    def describe(self, digits: int = 2) -> dict:
+        if not self.count:
+            return {"p10": 0, "median": 0, "p90": 0}
+        return {"p10": round(self.quantile(0.1), digits), "median": round(self.quantile(0.5), digits),
+                "p90": round(self.quantile(0.9), digits)}
+
+class FileSummary:
+    """Contribution of one file (or, once merged, of a selection of files) to the
+    collection statistics.
+
+    `phases` holds the per-phase values of each activity and direction, with a
+    `QuantileSketch` of each in `quantiles`, and `files` one value per file (distances,
+    durations, D+...). Summaries are built once from the file's rows of the phase table,
+    and `merge` combines them without going back to the phases.
+    """
+    CATEGORIES = ("walk", "flight")
+    DIRECTIONS = ("climb", "descent")
+    SUMMARY_METRICS = ["walk_dist", "walk_duration_min", "fly_dist", "walk_climb_rate", "walk_d_plus",
+                       "fly_duration_min", "fly_d_plus", "fly_d_minus"]
+
+    def __init__(self):
+        self.counts = {"total": 0, "hike_and_fly": 0, "fly_only": 0, "walk_only": 0}
+        self.phases = {(cat, direction, metric): RunningStats()
+                       for cat in self.CATEGORIES for direction in self.DIRECTIONS for metric in ("rate", "elevation")}
+        self.quantiles = {key: QuantileSketch() for key in self.phases}
+        self.files = {name: RunningStats() for name in ["walk_distance", "flight_distance"] + self.SUMMARY_METRICS}
+
+    @classmethod
+    def from_phase_table(cls, rows: pd.DataFrame) -> "FileSummary":
+        """Summary of one file from its phases (`AnalysisEngine.phase_table`)."""
+        summary = cls()
+        bFlight = rows["is_flight"].to_numpy()
+        rate = rows["rate"].to_numpy()
+        height = rows["height"].to_numpy()
+        distance = rows["distance"].to_numpy()
+        duration = rows["duration"].to_numpy()
+
+        # Flight rates are shown in m/s, walk rates in m/h
+        display_rate = np.abs(np.where(bFlight, rate / 3600.0, rate))
+        elevation = np.abs(height)
+        bClimb = rate > 0
+        for cat, bCat in (("walk", ~bFlight), ("flight", bFlight)):
+            for direction, bDir in (("climb", bClimb), ("descent", ~bClimb)):
+                for metric, values in (("rate", display_rate[bCat & bDir]), ("elevation", elevation[bCat & bDir])):
+                    summary.phases[(cat, direction, metric)].add(values)
+                    summary.quantiles[(cat, direction, metric)].add(values)
+            summary.files[f"{cat}_distance"].add([distance[bCat].sum() / 1000.0])
+
+        has_f, has_w = bool(bFlight.any()), bool((~bFlight).any())
+        summary.counts["total"] = 1
+        summary.counts["hike_and_fly"] = int(has_f and has_w)
+        summary.counts["fly_only"] = int(has_f and not has_w)
+        summary.counts["walk_only"] = int(has_w and not has_f)
+
+        bUp = height > 0
+        if has_w:
+            summary.files["walk_dist"].add([distance[~bFlight].sum() / 1000.0])
+            summary.files["walk_duration_min"].add([duration[~bFlight].sum() / 60.0])
+            summary.files["walk_d_plus"].add([height[~bFlight & bUp].sum()])
+            walk_up = rate[~bFlight & bUp]
+            if len(walk_up):
+                summary.files["walk_climb_rate"].add([walk_up.mean()])
+        if has_f:
+            summary.files["fly_dist"].add([distance[bFlight].sum() / 1000.0])
+            summary.files["fly_duration_min"].add([duration[bFlight].sum() / 60.0])
+            summary.files["fly_d_plus"].add([height[bFlight & bUp].sum()])
+            summary.files["fly_d_minus"].add([np.abs(height[bFlight & ~bUp]).sum()])
+        return summary
+
+    @property
+    def d_plus(self):
+        """Total climb of the walk and flight phases."""
+        return self.files["walk_d_plus"].total + self.files["fly_d_plus"].total
+
+    @property
+    def trace_type(self):
+        """"hike_and_fly", "fly_only" or "walk_only"; None for a file without phases."""
+        return next((key for key in ("hike_and_fly", "fly_only", "walk_only") if self.counts[key]), None)
+
+    @classmethod
+    def merge(cls, summaries) -> "FileSummary":
+        merged = cls()
+        for summary in summaries:
+            for key in merged.counts:
+                merged.counts[key] += summary.counts[key]
+            for key, stats in merged.phases.items():
+                stats.merge(summary.phases[key])
+                merged.quantiles[key].merge(summary.quantiles[key])
+            for key, stats in merged.files.items():
+                stats.merge(summary.files[key])
+        return merged
+
+    def collection_stats(self) -> dict:
+        """Min/avg/max of the phase rates and elevations, with their p10/median/p90
+        estimates (see `QuantileSketch`), and min/avg/max of the file distances."""
+        stats = {"total_files": self.counts["total"]}
+        for cat in self.CATEGORIES:
+            stats[cat] = {direction: {metric: dict(self.phases[(cat, direction, metric)].describe(),
+                                                   **self.quantiles[(cat, direction, metric)].describe())
+                                      for metric in ("rate", "elevation")}
+                          for direction in self.DIRECTIONS}
+            stats[cat]["distance"] = self.files[f"{cat}_distance"].describe()
+        return stats
+
+    def summary_stats(self) -> dict:
+        """File counts per activity mix and per-file averages."""
+        return {
+            "counts": dict(self.counts),
+            "averages": {k: round(self.files[k].mean, 1) if self.files[k].count else 0 for k in self.SUMMARY_METRICS}
+        }
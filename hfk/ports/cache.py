@@ -0,0 +1,24 @@
+# Copyright (C) 2024 aherve4
+# Licensed under the GNU GPL v3.0
+
+from abc import ABC, abstractmethod
+from typing import List, Optional, Tuple
+from ..domain.models import Track, Phase
+
+class TrackCache(ABC):
+    """Port interface for persisting parsed tracks and their analysis results."""
+
+    @abstractmethod
+    def load(self, file_path: str, params: dict) -> Optional[Tuple[Track, List[Phase]]]:
+        """Returns the cached track and phases, or None if the entry is missing or stale."""
+        pass
+
+    @abstractmethod
+    def store(self, file_path: str, params: dict, track: Track, phases: List[Phase]):
+        """Persists a track and its phases for the given analysis parameters."""
+        pass
+
+    @abstractmethod
+    def invalidate(self, file_path: str = None):
+        """Drops the entries of one file, or the whole cache when no file is given."""
+        pass
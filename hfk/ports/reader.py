@@ -3,7 +3,7 @@
 
 from abc import ABC, abstractmethod
 from typing import List
-from ..domain.models import Track
+from ..domain.models import Track, TrackHeader
 
 class TrackReader(ABC):
     """Port interface for reading track files."""
@@ -17,3 +17,7 @@ class TrackReader(ABC):
     def can_handle(self, file_path: str) -> bool:
         """Returns True if this reader can handle the given file extension."""
         pass
+
+    def read_header(self, file_path: str) -> TrackHeader:
+        """Returns header facts about a file. Readers may override this with a cheaper scan."""
+        return TrackHeader.from_track(self.read(file_path))
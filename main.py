@@ -20,36 +20,72 @@ parser.add_argument("target", nargs='+', help='provide path(s) to igc file(s) or
 # enables the use of 'IGCAnalyser --verbose' (no trailing value provided)
 parser.add_argument("-v", "--verbose", help="increase output verbosity",
                     action="store_true")
+parser.add_argument("-j", "--workers", type=int, default=None,
+                    help="number of worker processes used to load the files")
+parser.add_argument("--cache-dir", default=None,
+                    help="directory used to cache parsed tracks and phases between runs")
+parser.add_argument("--clear-cache", help="empty the cache before loading the files",
+                    action="store_true")
+parser.add_argument("--lazy", help="read file headers only at startup and parse tracks on demand",
+                    action="store_true")
+parser.add_argument("--distance-backend", choices=["geodesic", "haversine", "planar"], default=None,
+                    help="how distances are computed: exact geodesic (default) or a faster approximation")
+parser.add_argument("--jobs-dir", default=None,
+                    help="directory of the background jobs and their memoized results (default: a temporary directory)")
+parser.add_argument("--page-cache-size", type=int, default=32,
+                    help="number of rendered file pages kept in memory, the most recently loaded files being rendered at startup")
+parser.add_argument("--merge-traces-above", type=int, default=None,
+                    help="draw the map with one trace per colour when more files than this are selected (default 50)")
 # parser.add_argument("-c", "--cli", help="cli mode",
 #                     action="store_true")
-args = parser.parse_args()
 
-if args.verbose:
-    logging.basicConfig(level=logging.DEBUG)
-    logging.debug(f"args = {args}")
-    logging.debug(f"args.target = {args.target}")
+def main():
+    """Loads the targets and serves the dashboard."""
+    args = parser.parse_args()
+
+    if args.verbose:
+        logging.basicConfig(level=logging.DEBUG)
+        logging.debug(f"args = {args}")
+        logging.debug(f"args.target = {args.target}")
+
+    if args.target:
+        from hfk import TrackCollection
+        from hfk.adapters.visualizers.dash_visualizer import DashVisualizer
+        from hfk.controller.jobs import create_job_manager
+
+        service = TrackCollection(cache_dir=args.cache_dir, distance_backend=args.distance_backend)
+        if args.clear_cache:
+            service.invalidate_cache()
+        service.load_files(args.target, workers=args.workers, lazy=args.lazy)
+        # Background jobs for the heavy views, sharing the results they build through its cache
+        job_manager = create_job_manager(args.jobs_dir)
+        if job_manager is None and args.jobs_dir is not None:
+            parser.error("--jobs-dir needs the background callbacks: pip install \"dash[diskcache]\"")
+        shared = job_manager.handle if job_manager is not None else None
+        visualizer = DashVisualizer(service, merge_traces_above=args.merge_traces_above, shared=shared)
+
+        logging.debug(f"Files found : {service.file_paths}")
+        logging.debug(f"Track memory : {service.memory_report()['total']}")
 
-if args.target:
-    from hfk import TrackCollection
-    from hfk.adapters.visualizers.dash_visualizer import DashVisualizer
+        from dash import Dash
+        import dash_bootstrap_components as dbc
+        from hfk.Graphic.layout import create_layout
+        from hfk.controller.callbacks import register_callbacks
+        from hfk.Graphic.page_cache import FilePageCache
 
-    service = TrackCollection(args.target)
-    visualizer = DashVisualizer(service)
-    
-    logging.debug(f"Files found : {list(service.tracks.keys())}")
-    
-    from dash import Dash
-    import dash_bootstrap_components as dbc
-    from hfk.Graphic.layout import create_layout
-    from hfk.controller.callbacks import register_callbacks
+        app = Dash(__name__, external_stylesheets=[dbc.themes.LUX, "https://use.fontawesome.com/releases/v5.15.4/css/all.css"], suppress_callback_exceptions=True)
 
-    app = Dash(__name__, external_stylesheets=[dbc.themes.LUX, "https://use.fontawesome.com/releases/v5.15.4/css/all.css"], suppress_callback_exceptions=True)
+        # Initialise dashboard layout
+        app.layout = create_layout(service, visualizer)
 
-    # Initialise dashboard layout
-    app.layout = create_layout(service, visualizer)
+        # Records callbacks
+        page_cache = FilePageCache(service, visualizer, capacity=args.page_cache_size, shared=shared)
+        page_cache.warm_up()
+        register_callbacks(app, service, visualizer, job_manager=job_manager, page_cache=page_cache)
 
-    # Records callbacks
-    register_callbacks(app, service, visualizer)
+        app.run_server(debug=True)
 
-    if __name__ == '__main__':
-        app.run_server(debug=True)
\ No newline at end of file
+# Worker processes (parallel loading, background jobs) may import this module: only
+# the main process parses arguments and loads files
+if __name__ == '__main__':
+    main()
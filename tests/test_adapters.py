@@ -1,7 +1,10 @@
 import pytest
 import os
+import pandas as pd
 from hfk.adapters.readers.igc_reader import IgcReader
 from hfk.domain.models import Track
+from hfk.adapters.visualizers.dash_visualizer import DashVisualizer
+from hfk.application.collection_service import TrackCollectionService
 
 @pytest.fixture
 def reader():
@@ -9,7 +12,7 @@ def reader():
 
 @pytest.fixture
 def test_data_path():
-    return "Tests/Data"
+    return "tests/Data"
 
 def test_reader_can_handle(reader):
     assert reader.can_handle("test.igc") == True
@@ -42,11 +45,322 @@ def test_reader_invalid_file(reader):
         reader.read("non_existent.igc")
 
 def test_reader_empty_file(reader):
-    path = os.path.join("Tests/EdgeCases", "empty.igc")
+    path = os.path.join("tests/EdgeCases", "empty.igc")
     track = reader.read(path)
     assert track.dataframe.empty
 
 def test_reader_headers_only_file(reader):
-    path = os.path.join("Tests/EdgeCases", "headers_only.igc")
+    path = os.path.join("tests/EdgeCases", "headers_only.igc")
     track = reader.read(path)
     assert track.dataframe.empty
+
+@pytest.mark.parametrize("file_name", ["Data/track1.igc", "Data/track2.igc", "EdgeCases/empty.igc", "EdgeCases/headers_only.igc"])
+def test_reader_fast_mode_matches_line_parser(file_name):
+    path = os.path.join("tests", file_name)
+    fast_df = IgcReader(fast=True).read(path).dataframe
+    lines_df = IgcReader(fast=False).read(path).dataframe
+    pd.testing.assert_frame_equal(fast_df, lines_df, check_exact=True)
+
+def test_reader_fast_mode_irregular_records(tmp_path):
+    lines = [
+        "HFDTE:DATE:150724",
+        "B0829264250951S00102881WA-001000930",   # negative pressure altitude
+        "B0829334250954N00102882EA0000000931",
+        "B2560004250954N00102882EA0000000931",   # invalid time
+        "B08293",                                # truncated
+        "B0829394250957N00102884EA00000 0930",   # padded altitude
+        "B0829504250962N00102893EA0000000930",
+    ]
+    path = tmp_path / "irregular.igc"
+    path.write_bytes("\r\n".join(lines).encode("ascii"))
+
+    fast_df = IgcReader(fast=True).read(str(path)).dataframe
+    lines_df = IgcReader(fast=False).read(str(path)).dataframe
+    pd.testing.assert_frame_equal(fast_df, lines_df, check_exact=True)
+    assert len(fast_df) == 4
+    assert fast_df["Lat"].iloc[0] < 0 and fast_df["Long"].iloc[0] < 0
+
+def test_npz_cache_roundtrip(tmp_path):
+    from hfk.adapters.caches.npz_cache import NpzTrackCache
+    from hfk.domain.analysis_engine import AnalysisEngine
+
+    path = os.path.join("tests", "Data", "track1.igc")
+    track = IgcReader().read(path)
+    phases = AnalysisEngine.split_into_phases(track)
+    params = AnalysisEngine.parameters()
+
+    cache = NpzTrackCache(str(tmp_path / "cache"))
+    assert cache.load(path, params) is None
+    cache.store(path, params, track, phases)
+
+    cached_track, cached_phases = cache.load(path, params)
+    pd.testing.assert_frame_equal(cached_track.dataframe, track.dataframe)
+    assert [(p.direction, p.is_flight, p.distance) for p in cached_phases] == \
+           [(p.direction, p.is_flight, p.distance) for p in phases]
+
+    # Other analysis parameters are separate entries
+    assert cache.load(path, AnalysisEngine.parameters("30s")) is None
+
+    cache.invalidate(path)
+    assert cache.load(path, params) is None
+
+def test_npz_cache_eviction(tmp_path):
+    from hfk.adapters.caches.npz_cache import NpzTrackCache
+    from hfk.domain.analysis_engine import AnalysisEngine
+
+    cache = NpzTrackCache(str(tmp_path / "cache"), max_bytes=1)
+    path = os.path.join("tests", "Data", "track1.igc")
+    track = IgcReader().read(path)
+    cache.store(path, AnalysisEngine.parameters(), track, [])
+    assert cache.size() == 0
+
+def test_npz_cache_running_size(tmp_path, monkeypatch):
+    import glob
+    from hfk.adapters.caches.npz_cache import NpzTrackCache
+    from hfk.domain.analysis_engine import AnalysisEngine
+
+    path = os.path.join("tests", "Data", "track1.igc")
+    track = IgcReader().read(path)
+    cache = NpzTrackCache(str(tmp_path / "cache"))
+    cache.store(path, AnalysisEngine.parameters(), track, [])
+
+    # Stores below the limit do not scan the directory
+    scans = []
+    monkeypatch.setattr(glob, "glob", lambda *args, **kwargs: scans.append(args) or [])
+    for threshold in range(3, 6):
+        cache.store(path, AnalysisEngine.parameters(threshold_change_state=threshold), track, [])
+    assert not scans
+    monkeypatch.undo()
+    assert cache._total_bytes == cache.size()
+
+    # Over the limit, the oldest entries are evicted
+    cache.max_bytes = cache.size() // 2
+    cache.store(path, AnalysisEngine.parameters(), track, [])
+    assert cache._total_bytes == cache.size() <= cache.max_bytes
+
+def test_reader_read_header(reader):
+    path = os.path.join("tests", "Data", "track2.igc")
+    header = reader.read_header(path)
+    assert header.date.isoformat() == "2025-08-30"
+    assert header.pilot == "Anonymized Pilot"
+    assert header.glider == "Generic Glider"
+
+    df = reader.read(path).dataframe
+    assert header.start_time == df.index[0]
+    assert header.end_time == df.index[-1]
+    lat_min, lat_max, lon_min, lon_max = header.bbox
+    assert df["Lat"].min() <= lat_min <= lat_max <= df["Lat"].max()
+    assert df["Long"].min() <= lon_min <= lon_max <= df["Long"].max()
+
+def test_reader_read_header_without_fixes(reader):
+    header = reader.read_header(os.path.join("tests", "EdgeCases", "headers_only.igc"))
+    assert header.start_time is None
+    assert header.bbox is None
+
+def test_reader_iter_fixes(reader, test_data_path):
+    file_path = os.path.join(test_data_path, "track1.igc")
+    with open(file_path, "r") as fFile:
+        fixes = list(reader.iter_fixes(fFile))
+    track = reader.read(file_path)
+    assert len(fixes) == len(track)
+    time, lat, lon, alt_gps, alt_pressure = fixes[0]
+    assert time == track.timestamp(0)
+    assert (lat, lon, alt_gps) == (track.column("Lat")[0], track.column("Long")[0], track.column("Alt_gps")[0])
+
+def test_map_level_of_detail(reader, test_data_path):
+    service = TrackCollectionService(readers=[reader])
+    service.load_files(test_data_path)
+    visualizer = DashVisualizer(service)
+    points = lambda fig: [len(trace["lat"]) for trace in fig["data"]]
+    full = [len(service.get_track(path)) for path in service.file_paths]
+
+    assert visualizer.map_tolerance(18, 45) == 0
+    assert visualizer.map_tolerance(10, 45) == 100
+    overview = points(visualizer.get_map_figure())
+    assert all(n < total for n, total in zip(overview, full))
+    assert points(visualizer.get_map_figure(zoom=17, center={"lat": 42.8, "lon": 0.3})) == full
+    # The focused track is drawn in full detail
+    focused = points(visualizer.get_map_figure(focus_gps=service.file_paths[1]))
+    assert focused[1] == full[1]
+
+def test_altitude_profile_downsampling(reader, test_data_path):
+    service = TrackCollectionService(readers=[reader])
+    service.load_files(test_data_path)
+    visualizer = DashVisualizer(service)
+    visualizer.PROFILE_POINTS = 300
+    path = service.file_paths[0]
+    track = service.get_track(path)
+
+    fig = visualizer.get_altitude_profile_figure(path)
+    assert sum(len(trace.x) for trace in fig.data) < 0.5 * len(track)
+    # A zoomed window is drawn at full resolution
+    window = (str(track.timestamp(100)), str(track.timestamp(300)))
+    fig = visualizer.get_altitude_profile_figure(path, window=window)
+    assert sum(len(trace.x) for trace in fig.data) == 201
+
+def test_map_trace_cache(reader, test_data_path):
+    service = TrackCollectionService(readers=[reader])
+    service.load_files(test_data_path)
+    visualizer = DashVisualizer(service)
+    path = service.file_paths[0]
+
+    first = visualizer.get_map_figure()
+    second = visualizer.get_map_figure(files_filter=[path])
+    assert second["data"][0]["lat"] is first["data"][0]["lat"]
+    assert first["layout"]["mapbox"]["center"]["lat"] == pytest.approx(
+        (min(h.bbox[0] for h in service.headers.values()) + max(h.bbox[1] for h in service.headers.values())) / 2)
+
+    phases = visualizer.get_map_traces(path, "phases")
+    assert visualizer.get_map_traces(path, "phases") is phases
+    service.reanalyze(path, threshold_change_state=5)
+    assert visualizer.get_map_traces(path, "phases") is not phases
+
+def test_map_merged_traces(reader, test_data_path):
+    service = TrackCollectionService(readers=[reader])
+    service.load_files(test_data_path)
+    separate = DashVisualizer(service).get_map_figure()
+    merged = DashVisualizer(service, merge_traces_above=1).get_map_figure()
+    assert DashVisualizer(service).get_map_figure(merged=True)["data"][0]["customdata"].tolist() == merged["data"][0]["customdata"].tolist()
+
+    # Two files of different colours in a single trace: their points separated by a gap
+    packed = DashVisualizer._merge_map_traces([separate["data"][0], dict(separate["data"][1], line=separate["data"][0]["line"])])
+    assert len(packed) == 1
+    n = len(separate["data"][0]["lat"])
+    assert pd.isna(packed[0]["lat"][n])
+    assert len(packed[0]["lat"]) == sum(len(trace["lat"]) + 1 for trace in separate["data"])
+    assert packed[0]["customdata"][0] == "track1.igc" and packed[0]["customdata"][n + 1] == "track2.igc"
+
+def test_global_map_figure(reader, test_data_path):
+    service = TrackCollectionService(readers=[reader])
+    service.load_files(test_data_path)
+    paths = service.file_paths
+    for merge_traces_above in (50, 1):
+        fig = DashVisualizer(service, merge_traces_above=merge_traces_above).get_global_map_figure(focus_gps=paths[0])
+        *tracks, focus = fig["data"]
+        # Every file is sent, with the range of its points for the browser to hide it
+        files = [entry for trace in tracks for entry in trace["meta"]["files"]]
+        assert sorted(f[0] for f in files) == sorted(service.file_ids.values())
+        assert all(0 <= start < stop <= len(trace["lat"]) for trace in tracks for _, start, stop in trace["meta"]["files"])
+        assert [e[0] for e in fig["layout"]["meta"]["extents"]] == [service.file_ids[path] for path in paths]
+        assert focus["meta"] == {"focus": service.file_ids[paths[0]]}
+        assert len(focus["lat"]) == len(service.get_track(paths[0]))
+        assert fig["layout"]["mapbox"]["zoom"] == 13
+        assert len({trace["uid"] for trace in fig["data"]}) == len(fig["data"])
+
+def test_dashboard_bundle(reader, test_data_path):
+    service = TrackCollectionService(readers=[reader])
+    service.load_files(test_data_path)
+    visualizer = DashVisualizer(service)
+    selection = service.file_paths[:1]
+
+    bundle = visualizer.get_dashboard_bundle(files_filter=selection)
+    assert bundle["summary"] == service.get_summary_stats(files_filter=selection)
+    assert bundle["collection"] == service.get_collection_stats(files_filter=selection)
+    for (phase_type, metric_type), fig in bundle["landscapes"].items():
+        expected = visualizer.get_performance_landscape_figure(files_filter=selection, phase_type=phase_type, metric_type=metric_type)
+        assert fig == expected.to_dict()
+
+    # Cached per selection, until a selected file is re-analysed
+    assert visualizer.get_dashboard_bundle(files_filter=selection) is bundle
+    assert visualizer.lookup_dashboard_bundle(files_filter=selection) is bundle
+    assert visualizer.lookup_dashboard_bundle() is None
+    assert visualizer.get_dashboard_bundle() is not bundle
+    assert visualizer.get_dashboard_bundle(files_filter=list(selection)) is bundle
+    service.reanalyze(selection[0], threshold_change_state=5)
+    assert visualizer.get_dashboard_bundle(files_filter=selection) is not bundle
+
+def test_file_page_cache(reader, test_data_path):
+    from hfk.Graphic.page_cache import FilePageCache
+    service = TrackCollectionService(readers=[reader])
+    service.load_files(test_data_path, lazy=True)
+    cache = FilePageCache(service, DashVisualizer(service), capacity=1)
+    first, second = service.file_paths[:2]
+
+    # Warm-up loads lazily indexed files
+    cache.warm_up().join()
+    assert cache.stats()["pages"] == 1 and cache.warmed == 1
+    assert cache.hits == cache.misses == 0
+    # Pages already cached are not rendered again
+    cache.warm_up().join()
+    assert cache.warmed == 1
+    page = cache.get(second)
+    assert cache.hits == 1
+    assert page["type"] == "Container"
+
+    # Evicted beyond capacity, rebuilt when the analysis changes
+    assert cache.lookup(first) is None
+    cache.render(first)
+    assert cache.get(first) is not page
+    assert cache.misses == 1 and cache.hits == 2
+    service.reanalyze(threshold_change_state=5)
+    cache.get(first)
+    assert cache.stats() == {"pages": 1, "capacity": 1, "hits": 2, "misses": 2, "warmed": 1, "hit_rate": 0.5}
+
+def test_file_page_cache_shared(reader, test_data_path, tmp_path):
+    import diskcache
+    from hfk.Graphic.page_cache import FilePageCache
+    service = TrackCollectionService(readers=[reader])
+    service.load_files(test_data_path)
+    second = service.file_paths[1]
+
+    # Pages rendered elsewhere (background jobs) are found in the shared store
+    shared = diskcache.Cache(str(tmp_path / "jobs"))
+    other = FilePageCache(service, DashVisualizer(service), shared=shared)
+    FilePageCache(service, DashVisualizer(service), shared=shared).render(second)
+    assert other.lookup(second) is not None and other.hits == 1
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="fork not available")
+def test_locks_released_in_forked_jobs(reader):
+    import threading
+    from hfk.Graphic.page_cache import FilePageCache
+    service = TrackCollectionService(readers=[reader])
+    visualizer = DashVisualizer(service)
+    cache = FilePageCache(service, visualizer)
+
+    # Background jobs may fork while the warm-up thread renders a page
+    held, release = threading.Event(), threading.Event()
+    def render():
+        with visualizer.lock, service._materialize_lock:
+            held.set()
+            release.wait()
+    thread = threading.Thread(target=render)
+    thread.start()
+    held.wait()
+    pid = os.fork()
+    if pid == 0:
+        acquired = all(lock.acquire(timeout=1) for lock in (visualizer.lock, service._materialize_lock, cache._lock))
+        os._exit(0 if acquired else 1)
+    release.set()
+    thread.join()
+    assert os.waitpid(pid, 0)[1] == 0
+
+def test_global_page_lazy(reader, test_data_path):
+    from hfk.Graphic.layout import get_global_page_layout
+    service = TrackCollectionService(readers=[reader])
+    service.load_files(test_data_path, lazy=True)
+    visualizer = DashVisualizer(service)
+
+    # The page is built from the headers; the map starts with the loaded files only
+    get_global_page_layout(service, visualizer)
+    assert len(service.tracks) == 0
+    service.get_track(service.file_paths[0])
+    partial = visualizer.get_global_map_figure(loaded_only=True)
+    assert [e[0] for e in partial["layout"]["meta"]["extents"]] == [service.file_ids[service.file_paths[0]]]
+    assert len(visualizer.get_global_map_figure()["layout"]["meta"]["extents"]) == len(service.file_paths)
+
+def test_compact_selection(reader, test_data_path, tmp_path):
+    from hfk.Graphic.layout import compact_selection, get_selected_files
+    for i in range(4):
+        (tmp_path / f"copy{i}.igc").write_bytes(open(os.path.join(test_data_path, "track2.igc"), "rb").read())
+    service = TrackCollectionService(readers=[reader])
+    service.load_files(str(tmp_path), lazy=True)
+    ids = list(service.file_ids.values())
+
+    # Up to half the files toggled, the state is kept as is
+    selection = compact_selection(service, True, ids[:2])
+    assert selection == {"all": True, "toggled": ids[:2]}
+    # Beyond, the complement is stored instead
+    selection = compact_selection(service, True, ids[:3])
+    assert selection == {"all": False, "toggled": ids[3:]}
+    assert get_selected_files(service, selection) == service.file_paths[3:]
+    assert get_selected_files(service, compact_selection(service, False, ids)) == service.file_paths
@@ -53,3 +53,210 @@ def test_service_get_global_stats(service, test_data_path):
     assert "total_dist" in stats
     assert "flight_phases" in stats
     assert "walk_phases" in stats
+
+def test_service_parallel_load_matches_sequential(service, test_data_path):
+    service.load_files(test_data_path)
+
+    parallel = TrackCollectionService(readers=[IgcReader()])
+    parallel.load_files(test_data_path, workers=2)
+
+    assert list(parallel.tracks) == list(service.tracks)
+    assert parallel.file_colors == service.file_colors
+    for path in service.tracks:
+        pd.testing.assert_frame_equal(parallel.get_track(path).dataframe, service.get_track(path).dataframe)
+        expected = service.get_phases(path)
+        restored = parallel.get_phases(path)
+        assert len(restored) == len(expected)
+        for p1, p2 in zip(restored, expected):
+            assert p1.direction == p2.direction
+            assert p1.is_flight == p2.is_flight
+            assert p1.distance == pytest.approx(p2.distance)
+            pd.testing.assert_frame_equal(p1.dataframe, p2.dataframe)
+
+class FailingReader(IgcReader):
+    def read(self, file_path):
+        raise ValueError("corrupted file")
+
+def test_service_parallel_load_reports_errors(test_data_path, caplog):
+    service = TrackCollectionService(readers=[FailingReader()])
+    service.load_files(test_data_path, workers=2)
+    assert len(service.tracks) == 0
+    assert "Error processing" in caplog.text
+    assert "corrupted file" in caplog.text
+
+def test_service_uses_cache(test_data_path, tmp_path, monkeypatch):
+    from hfk.adapters.caches.npz_cache import NpzTrackCache
+    cache = NpzTrackCache(str(tmp_path / "cache"))
+
+    first = TrackCollectionService(readers=[IgcReader()], cache=cache)
+    first.load_files(test_data_path)
+    assert cache.size() > 0
+
+    # Cached files must not be parsed again
+    monkeypatch.setattr(IgcReader, "read", FailingReader.read)
+    second = TrackCollectionService(readers=[IgcReader()], cache=cache)
+    second.load_files(test_data_path)
+    assert list(second.tracks) == list(first.tracks)
+    for path in first.tracks:
+        assert len(second.get_phases(path)) == len(first.get_phases(path))
+
+    second.invalidate_cache()
+    assert cache.size() == 0
+
+def test_service_parallel_load_partly_cached(service, test_data_path, tmp_path):
+    from hfk.adapters.caches.npz_cache import NpzTrackCache
+    service.load_files(test_data_path)
+    last = service.file_paths[-1]
+
+    # Only the last file is cached: registration order must not depend on it
+    cache = NpzTrackCache(str(tmp_path / "cache"))
+    TrackCollectionService(readers=[IgcReader()], cache=cache).load_files(last)
+    parallel = TrackCollectionService(readers=[IgcReader()], cache=cache)
+    parallel.load_files(test_data_path, workers=2)
+    assert parallel.file_paths == service.file_paths
+    assert parallel.file_ids == service.file_ids
+    assert parallel.file_colors == service.file_colors
+
+def test_service_lazy_load(service, test_data_path):
+    service.load_files(test_data_path, lazy=True)
+    paths = service.file_paths
+    assert len(paths) >= 2
+    assert len(service.tracks) == 0
+    assert service.get_header(paths[0]).date is not None
+
+    # Opening a file materializes only that file, once
+    track = service.get_track(paths[0])
+    assert track is not None and not track.dataframe.empty
+    assert service.get_track(paths[0]) is track
+    assert service.get_phases(paths[0])
+    assert list(service.tracks) == [paths[0]]
+    # Loading replaces the indicative bbox of the header with the extents of the fixes
+    lat, lon = track.column("Lat"), track.column("Long")
+    assert service.get_header(paths[0]).bbox == (lat.min(), lat.max(), lon.min(), lon.max())
+
+    # Collection stats materialize the selection
+    summary = service.get_summary_stats()
+    assert summary["counts"]["total"] == len(paths)
+    assert set(service.tracks) == set(paths)
+
+def test_service_memory_report(service, test_data_path):
+    service.load_files(test_data_path)
+    report = service.memory_report()
+    assert set(report["tracks"]) == set(service.tracks)
+    assert report["total"]["compact_bytes"] == sum(t["compact_bytes"] for t in report["tracks"].values())
+    assert report["total"]["compact_bytes"] < report["total"]["dataframe_bytes"]
+
+def test_service_sweep_parameters(service, test_data_path):
+    service.load_files(test_data_path)
+    grid = [{}, {"threshold_change_state": 5}]
+    table = service.sweep_parameters(grid, workers=2)
+    assert set(table["file_path"]) == set(service.file_paths)
+    defaults = table[table["params_id"] == 0]
+    for _, row in defaults.iterrows():
+        assert row["phases"] == len(service.get_phases(row["file_path"]))
+
+def test_service_analysis_params(test_data_path):
+    exact = TrackCollectionService(readers=[IgcReader()])
+    fast = TrackCollectionService(readers=[IgcReader()], analysis_params={"distance_backend": "haversine"})
+    exact.load_files(test_data_path)
+    fast.load_files(test_data_path, workers=2)
+    assert fast.analysis_params["distance_backend"] == "haversine"
+    for path in exact.file_paths:
+        assert fast.get_global_stats(path)["total_dist"] == pytest.approx(exact.get_global_stats(path)["total_dist"], rel=0.006, abs=0.01)
+
+def test_service_lazy_load_concurrent_reads(service, test_data_path, monkeypatch):
+    import threading
+    import time
+    from hfk.domain.analysis_engine import AnalysisEngine
+    service.load_files(test_data_path, lazy=True)
+    path = service.file_paths[0]
+
+    # Hold the loading thread in the middle of the registration of the file
+    loading, release = threading.Event(), threading.Event()
+    phase_table = AnalysisEngine.phase_table
+    def slow_phase_table(phases):
+        loading.set()
+        release.wait()
+        return phase_table(phases)
+    monkeypatch.setattr(AnalysisEngine, "phase_table", staticmethod(slow_phase_table))
+
+    results = {}
+    def read():
+        results["logical_phases"] = service.get_logical_phases(path)
+        results["summary"] = service.get_summary_stats(files_filter=[path])
+    loader = threading.Thread(target=service.get_track, args=(path,))
+    loader.start()
+    loading.wait()
+    reader = threading.Thread(target=read)
+    reader.start()
+    time.sleep(0.1)
+    release.set()
+    loader.join()
+    reader.join()
+
+    assert results["logical_phases"] and results["logical_phases"] is service.logical_phases[path]
+    assert results["summary"] == service.get_summary_stats(files_filter=[path])
+
+def test_service_logical_phases_cached(service, test_data_path):
+    service.load_files(test_data_path)
+    path = service.file_paths[0]
+    logical = service.get_logical_phases(path)
+    assert logical
+    assert service.get_logical_phases(path) is logical
+
+    service.reanalyze(path, threshold_change_state=5)
+    assert service.analysis_params["threshold_change_state"] == 5
+    relogical = service.get_logical_phases(path)
+    assert relogical is not logical
+    assert sum(len(lp.phases) for lp in relogical) == len(service.get_phases(path))
+
+def test_service_phase_table(service, test_data_path):
+    service.load_files(test_data_path)
+    for path in service.file_paths:
+        rows = service.get_phase_table(path)
+        phases = service.get_phases(path)
+        assert rows["is_flight"].tolist() == [p.is_flight for p in phases]
+        assert rows["distance"].sum() == pytest.approx(sum(p.distance for p in phases))
+
+    # Files filtered out do not count, and stats follow a re-analysis
+    path = service.file_paths[0]
+    walk_dist = sum(p.distance for p in service.get_phases(path) if not p.is_flight) / 1000.0
+    stats = service.get_collection_stats(files_filter=[path])
+    assert stats["total_files"] == 1
+    assert stats["walk"]["distance"]["avg"] == round(walk_dist, 2)
+
+    service.reanalyze(path, threshold_change_state=5)
+    assert len(service.get_phase_table(path)) == len(service.get_phases(path))
+
+def test_service_find_files(service, test_data_path):
+    service.load_files(test_data_path, lazy=True)
+    paths = service.file_paths
+    names = [service.get_header(path).file_name for path in paths]
+
+    assert service.find_files(search=names[0].upper()) == [paths[0]]
+    assert [service.get_header(p).file_name for p in service.find_files(sort_by="name")] == sorted(names, key=str.lower)
+    assert service.find_files(sort_by="date", descending=True) == service.find_files(sort_by="date")[::-1]
+    # Header-only queries leave lazily indexed files alone
+    assert len(service.tracks) == 0
+
+    by_d_plus = service.find_files(sort_by="d_plus", descending=True)
+    d_plus = [service.file_summaries[path].d_plus for path in by_d_plus]
+    assert d_plus == sorted(d_plus, reverse=True)
+    assert service.find_files(min_d_plus=d_plus[0]) == [by_d_plus[0]]
+    for trace_type in ("hike_and_fly", "fly_only", "walk_only"):
+        assert all(service.get_summary_stats([path])["counts"][trace_type] == 1
+                   for path in service.find_files(trace_type=trace_type))
+    with pytest.raises(ValueError):
+        service.find_files(sort_by="size")
+
+def test_service_view_keys(service, test_data_path):
+    service.load_files(test_data_path)
+    path = service.file_paths[0]
+    key, token = service.view_key(path), service.state_token()
+    assert key[0] == path and key[1] == os.path.getmtime(path)
+    assert service.state_token() == token
+
+    # Other analysis parameters, other results
+    service.reanalyze(threshold_change_state=5)
+    assert service.view_key(path) != key
+    assert service.state_token() != token
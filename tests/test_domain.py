@@ -1,8 +1,15 @@
 import pytest
+import os
 import pandas as pd
 import datetime
-from hfk.domain.models import Point, Track, Phase, LogicalPhase
+import pyproj
+import numpy as np
+from hfk.domain.models import Point, Track, Phase, LogicalPhase, douglas_peucker_significance, lttb_indices
 from hfk.domain.analysis_engine import AnalysisEngine
+from hfk.domain.streaming import StreamingSegmenter
+from hfk.domain.distance import benchmark, get_distance_backend
+from hfk.domain.summary import RunningStats, QuantileSketch, FileSummary
+from hfk.adapters.readers.igc_reader import IgcReader
 
 @pytest.fixture
 def sample_track_df():
@@ -44,6 +51,29 @@ def test_track_resampling(sample_track_df):
     res_df = track.get_resampled("1min")
     assert len(res_df) < len(sample_track_df)
 
+@pytest.mark.parametrize("interval", ["10s", "30s", "1min", "7s", "5min", "1h"])
+def test_track_resampling_matches_pandas(interval):
+    track = IgcReader().read(os.path.join("tests", "Data", "track1.igc"))
+    track.build_resample_pyramid()
+    expected = track.dataframe.resample(interval).mean()
+    pd.testing.assert_frame_equal(track.get_resampled(interval), expected, check_freq=False, rtol=1e-12)
+
+def test_track_resample_pyramid(sample_track_df):
+    track = Track(dataframe=sample_track_df)
+    projected = track.get_resampled("30s", ["Lat", "Alt_gps"])
+    assert list(projected.columns) == ["Lat", "Alt_gps"]
+    level = track._resample_level("30s")
+    assert set(level["means"]) == {"Lat", "Alt_gps"}
+
+    # 1min bins are derived from the cached 30s ones and cached in turn
+    minute = track.get_resampled("1min")
+    assert track._resample_level("1min") is track._resample_level("1min")
+    pd.testing.assert_frame_equal(minute, sample_track_df.resample("1min").mean(), check_freq=False, check_dtype=False)
+
+    for seconds in range(1, 20):
+        track.get_resampled(f"{seconds}s", ["Alt_gps"])
+    assert len(track._resample_levels) == Track.MAX_RESAMPLE_LEVELS
+
 def test_phase_logic(sample_track_df):
     # Test a simple climb phase
     climb_df = sample_track_df.iloc[:50]
@@ -84,3 +114,381 @@ def test_logical_phase_aggregation(sample_track_df):
     assert len(flight_phases) > 0
     for lp in flight_phases:
         assert not lp.dataframe.empty
+
+def _reference_activity(df_resampled, altitude_col="Alt_gps"):
+    # Per-row implementation the batched triggers must reproduce
+    geod = pyproj.Geod(ellps="WGS84")
+    lActivity = []
+    for k in range(len(df_resampled)):
+        if k == 0:
+            lActivity.append(False)
+            continue
+        p1 = df_resampled.iloc[k-1]
+        p2 = df_resampled.iloc[k]
+        _, _, dist = geod.inv(p1["Long"], p1["Lat"], p2["Long"], p2["Lat"])
+        dt = (df_resampled.index[k] - df_resampled.index[k-1]).total_seconds() / 3600.0
+        speed = (dist / 1000.0) / dt if dt > 0 else 0
+        rate = (p2[altitude_col] - p1[altitude_col]) / dt if dt > 0 else 0
+        lActivity.append((speed > 15) or (abs(rate) > 1000))
+    return lActivity
+
+@pytest.mark.parametrize("interval", ["10s", "1min", "5min"])
+def test_compute_activity_matches_per_row(sample_track_df, interval):
+    tracks = [Track(dataframe=sample_track_df)]
+    for name in ["track1.igc", "track2.igc"]:
+        tracks.append(IgcReader().read(os.path.join("tests", "Data", name)))
+
+    for track in tracks:
+        df_resampled = track.get_resampled(interval)
+        expected = _reference_activity(df_resampled)
+        assert AnalysisEngine.compute_activity(df_resampled).tolist() == expected
+
+def test_compute_activity_with_gaps(sample_track_df):
+    # Empty resampling bins give NaN rows, which never trigger a flight
+    df = pd.concat([sample_track_df.iloc[:20], sample_track_df.iloc[60:]])
+    df_resampled = Track(dataframe=df).get_resampled("10s")
+    assert df_resampled["Lat"].isna().any()
+    assert AnalysisEngine.compute_activity(df_resampled).tolist() == _reference_activity(df_resampled)
+
+@pytest.mark.parametrize("backend", ["haversine", "planar"])
+def test_compute_activity_with_gaps_backends(sample_track_df, backend):
+    df = pd.concat([sample_track_df.iloc[:20], sample_track_df.iloc[60:]])
+    df_resampled = Track(dataframe=df).get_resampled("10s")
+    expected = AnalysisEngine.compute_activity(df_resampled)
+    assert AnalysisEngine.compute_activity(df_resampled, distance_backend=backend).tolist() == expected.tolist()
+
+    track = IgcReader().read(os.path.join("tests", "Data", "track1.igc"))
+    df_resampled = track.get_resampled("10s")
+    assert df_resampled["Lat"].isna().any()
+    geodesic = AnalysisEngine.compute_activity(df_resampled)
+    assert (AnalysisEngine.compute_activity(df_resampled, distance_backend=backend) == geodesic).all()
+    phases = AnalysisEngine.split_into_phases(track, resample_interval="10s", distance_backend=backend)
+    assert len(phases) == len(AnalysisEngine.split_into_phases(track, resample_interval="10s"))
+
+def test_planar_distance_with_missing_fixes():
+    planar = get_distance_backend("planar")
+    steps = planar.steps([42.0, np.nan, 42.001, 42.002], [1.0, np.nan, 1.0, 1.0])
+    assert np.isnan(steps[:2]).all()
+    assert steps[2] == pytest.approx(111.07, abs=0.01)
+    assert np.isfinite(planar.error_bound([np.nan, 42.0, 42.1], [np.nan, 1.0, 1.2]))
+
+def test_track_cumulative_distance(sample_track_df):
+    track = Track(dataframe=sample_track_df)
+    cumulative = track.cumulative_distance
+    assert len(cumulative) == len(sample_track_df)
+    assert cumulative[0] == 0
+    assert track.cumulative_distance is cumulative
+
+    geod = pyproj.Geod(ellps="WGS84")
+    expected = 0
+    for k in range(1, 50):
+        _, _, d = geod.inv(sample_track_df["Long"].iloc[k-1], sample_track_df["Lat"].iloc[k-1],
+                           sample_track_df["Long"].iloc[k], sample_track_df["Lat"].iloc[k])
+        expected += d
+    assert track.distance_between(0, 50) == pytest.approx(expected)
+    assert track.distance_between(10, 11) == 0
+
+def test_phase_distance_with_missing_fix(sample_track_df):
+    # A fix without coordinates only makes the distance of its own phase unknown
+    df = sample_track_df.copy()
+    df.iloc[10, df.columns.get_loc("Lat")] = np.nan
+    track = Track(dataframe=df)
+    assert np.isfinite(track.cumulative_distance).all()
+    phases = AnalysisEngine.split_into_phases(track, resample_interval="10s")
+    clean = AnalysisEngine.split_into_phases(Track(dataframe=sample_track_df), resample_interval="10s")
+    assert [(p.start, p.stop) for p in phases] == [(p.start, p.stop) for p in clean]
+
+    for p, expected in zip(phases, clean):
+        if p.start <= 10 < p.stop:
+            assert np.isnan(p.distance)
+        else:
+            assert p.distance == expected.distance
+
+    table = AnalysisEngine.sweep({"track": track}, [AnalysisEngine.parameters("10s")])
+    assert np.isnan(table["flight_distance"].iloc[0])
+
+def test_phase_with_missing_altitude(sample_track_df):
+    df = sample_track_df.iloc[:6].copy()
+    df["Alt_gps"] = [100.0, 110.0, np.nan, 130.0, 140.0, 150.0]
+    phase = Phase(df, bUp=True)
+    assert (phase.height, phase.min_alt, phase.max_alt) == (50, 100, 150)
+    logical = LogicalPhase([phase, Phase(Track(df), False, 4, 6)])
+    assert (logical.d_plus, logical.min_alt, logical.max_alt) == (50, 100, 150)
+
+    df["Alt_gps"] = np.nan
+    phase = Phase(df, bUp=True)
+    assert np.isnan(phase.height) and np.isnan(phase.min_alt) and np.isnan(phase.max_alt)
+
+def test_phase_distance_from_track_prefix_sums(sample_track_df):
+    track = Track(dataframe=sample_track_df)
+    phases = AnalysisEngine.split_into_phases(track, resample_interval="10s")
+    for p in phases:
+        standalone = Phase(p.dataframe, p.direction)
+        standalone.compute_distance()
+        assert p.distance == pytest.approx(standalone.distance)
+        assert p.is_flight == standalone.is_flight
+
+def test_phases_are_views_on_track(sample_track_df):
+    track = Track(dataframe=sample_track_df)
+    phases = AnalysisEngine.split_into_phases(track, resample_interval="10s")
+    for p in phases:
+        assert not hasattr(p, "__dict__")
+        assert p.track is track
+        pd.testing.assert_frame_equal(p.dataframe, sample_track_df.iloc[p.start:p.stop], check_dtype=False)
+        assert p.min_alt == p.dataframe["Alt_gps"].min()
+        assert p.max_alt == p.dataframe["Alt_gps"].max()
+
+def test_logical_phase_dataframe_matches_concatenation(sample_track_df):
+    track = Track(dataframe=sample_track_df)
+    phases = AnalysisEngine.split_into_phases(track, resample_interval="10s")
+    for lp in AnalysisEngine.get_logical_phases(phases):
+        expected = pd.concat([p.dataframe for p in lp.phases])
+        expected = expected[~expected.index.duplicated(keep='first')].sort_index()
+        pd.testing.assert_frame_equal(lp.dataframe, expected)
+        assert lp.min_alt == round(expected["Alt_gps"].min(), 1)
+        assert lp.max_alt == round(expected["Alt_gps"].max(), 1)
+        assert lp.duration == expected.index.max() - expected.index.min()
+
+def test_track_compact_storage(sample_track_df):
+    track = Track(dataframe=sample_track_df)
+    assert len(track) == len(sample_track_df)
+    assert track.column("Alt_gps").dtype == "int16"
+    pd.testing.assert_frame_equal(track.dataframe, sample_track_df, check_dtype=False, check_freq=False)
+
+    footprint = track.memory_footprint()
+    assert footprint["compact_bytes"] < footprint["dataframe_bytes"]
+
+    restored = Track.from_columns(track.to_columns())
+    pd.testing.assert_frame_equal(restored.dataframe, track.dataframe)
+
+def test_track_microdegree_coordinates(sample_track_df):
+    track = Track(dataframe=sample_track_df, coordinate_encoding="microdegrees")
+    assert track.to_columns()["layout"]["columns"][3]["dtype"] == "<i4"
+    assert abs(track.column("Lat") - sample_track_df["Lat"].to_numpy()).max() <= 0.5e-6
+    assert track.memory_footprint()["compact_bytes"] < Track(dataframe=sample_track_df).memory_footprint()["compact_bytes"]
+
+def _phase_key(p):
+    return (p.direction, p.is_flight, p.first_time, p.last_time, len(p), p.distance, p.height, p.speed_kmh)
+
+@pytest.mark.parametrize("file_name,interval", [("track1.igc", "1min"), ("track1.igc", "30s"), ("track2.igc", "1min")])
+def test_streaming_segmenter_replay_matches_batch(file_name, interval):
+    track = IgcReader().read(os.path.join("tests", "Data", file_name))
+    expected = [_phase_key(p) for p in AnalysisEngine.split_into_phases(track, interval)]
+
+    segmenter = StreamingSegmenter(interval)
+    df = track.dataframe
+    phases = []
+    for i in range(0, len(df), 50):
+        phases += segmenter.push_many(df.iloc[i:i + 50])
+    phases += segmenter.finish()
+
+    assert [_phase_key(p) for p in phases] == expected
+    assert segmenter.fix_count == len(track)
+
+def test_streaming_segmenter_emits_confirmed_phases_early(sample_track_df):
+    track = Track(dataframe=sample_track_df)
+    expected = AnalysisEngine.split_into_phases(track, resample_interval="10s")
+
+    segmenter = StreamingSegmenter("10s")
+    emitted_at = []
+    phases = []
+    for row, fix in enumerate(zip(sample_track_df.index, sample_track_df["Lat"], sample_track_df["Long"],
+                                  sample_track_df["Alt_gps"], sample_track_df["Alt_pressure"])):
+        new = segmenter.push(*fix)
+        emitted_at += [row] * len(new)
+        phases += new
+    # A phase is returned once the change of state has lasted THRESHOLD_CHANGE_STATE
+    # samples and the next fix closes the last bin
+    assert emitted_at == [11, 62]
+    # Only the fixes of the unconfirmed phase are still held
+    assert len(segmenter._times) == len(expected[-1])
+    phases += segmenter.finish()
+
+    assert [_phase_key(p) for p in phases] == [_phase_key(p) for p in expected]
+    flight = AnalysisEngine.get_logical_phases(phases)[-1]
+    assert flight.is_flight
+    assert len(flight.dataframe) == len(sample_track_df) - 1
+
+    with pytest.raises(ValueError):
+        segmenter.push(sample_track_df.index[-1], 42.0, 1.0, 500)
+
+@pytest.mark.parametrize("interval", ["1min", "30s"])
+def test_streaming_segmenter_igc_replay_matches_batch(interval):
+    # track1.igc has B records up to about 10 minutes older than the previous one
+    path = os.path.join("tests", "Data", "track1.igc")
+    track = IgcReader().read(path)
+    expected = [_phase_key(p) for p in AnalysisEngine.split_into_phases(track, interval)]
+
+    segmenter = StreamingSegmenter(interval, max_delay="10min")
+    with open(path) as fFile:
+        phases = segmenter.push_many(IgcReader().iter_fixes(fFile))
+    phases += segmenter.finish()
+    assert [_phase_key(p) for p in phases] == expected
+    assert (segmenter.fix_count, segmenter.dropped_count) == (len(track), 0)
+
+    # Without delay, late fixes join the phase being built or are dropped
+    segmenter = StreamingSegmenter(interval)
+    with open(path) as fFile:
+        phases = segmenter.push_many(IgcReader().iter_fixes(fFile))
+    phases += segmenter.finish()
+    assert segmenter.fix_count + segmenter.dropped_count == len(track)
+    assert sum(len(p) for p in phases) <= segmenter.fix_count
+
+def test_streaming_segmenter_out_of_order_fixes(sample_track_df):
+    fixes = list(zip(sample_track_df.index, sample_track_df["Lat"], sample_track_df["Long"],
+                     sample_track_df["Alt_gps"], sample_track_df["Alt_pressure"]))
+    expected = [_phase_key(p) for p in AnalysisEngine.split_into_phases(Track(dataframe=sample_track_df), "30s")]
+
+    # Swapped fixes are averaged in their bins when they arrive within the delay
+    shuffled = fixes[:]
+    for i in range(1, len(fixes) - 1, 7):
+        shuffled[i], shuffled[i + 1] = shuffled[i + 1], shuffled[i]
+    shuffled[0], shuffled[1] = shuffled[1], shuffled[0]
+    segmenter = StreamingSegmenter("30s", max_delay="10s")
+    phases = segmenter.push_many(shuffled) + segmenter.finish()
+    assert [_phase_key(p) for p in phases] == expected
+
+    # A fix whose phase was already returned is dropped
+    segmenter = StreamingSegmenter("30s")
+    phases = segmenter.push_many(fixes)
+    assert phases
+    segmenter.push(*fixes[0])
+    assert (segmenter.fix_count, segmenter.dropped_count) == (len(fixes), 1)
+
+    with pytest.raises(ValueError):
+        StreamingSegmenter("30s", max_delay="-1s")
+
+def test_parameter_sweep_matches_split_into_phases():
+    tracks = {name: IgcReader().read(os.path.join("tests", "Data", name)) for name in ("track1.igc", "track2.igc")}
+    grid = AnalysisEngine.parameter_grid(resample_interval=["30s", "1min"], threshold_change_state=[5, 10],
+                                         altitude_hysteresis_margin=[10, 20], flight_speed_kmh=[10, 15])
+    table = AnalysisEngine.sweep(tracks, grid)
+    assert len(table) == len(tracks) * len(grid)
+
+    for _, row in table.iterrows():
+        params = {name: row[name] for name in AnalysisEngine.parameters()}
+        phases = AnalysisEngine.split_into_phases(tracks[row["file_path"]], **params)
+        flights = [p for p in phases if p.is_flight]
+        walks = [p for p in phases if not p.is_flight]
+        assert row["phases"] == len(phases)
+        assert row["flight_phases"] == len(flights)
+        assert row["flight_distance"] == pytest.approx(sum(p.distance for p in flights))
+        assert row["walk_hours"] == pytest.approx(sum(p.durationHours for p in walks))
+        assert row["walk_d_plus"] == pytest.approx(sum(p.height for p in walks if p.height > 0))
+
+    baseline = table[table["params_id"] == 0]
+    assert (baseline["phases_diff"] == 0).all()
+    other = table[table["params_id"] == 1].set_index("file_path")
+    assert (other["phases_diff"] == other["phases"] - baseline.set_index("file_path")["phases"]).all()
+
+@pytest.mark.parametrize("name", ["geodesic", "haversine", "planar"])
+def test_distance_backend_error_bound(name):
+    track = IgcReader().read(os.path.join("tests", "Data", "track1.igc"))
+    result = benchmark(track.column("Lat"), track.column("Long"), backends=[name], repeat=1)[name]
+    assert result["max_rel_error"] <= result["error_bound"]
+    assert result["error_bound"] < 0.006
+
+def test_distance_backend_selection():
+    track = IgcReader().read(os.path.join("tests", "Data", "track1.igc"))
+    geodesic = AnalysisEngine.split_into_phases(track)
+    haversine = AnalysisEngine.split_into_phases(track, distance_backend="haversine")
+    assert [p.is_flight for p in haversine] == [p.is_flight for p in geodesic]
+    for fast, exact in zip(haversine, geodesic):
+        assert fast.distance == pytest.approx(exact.distance, rel=0.006)
+    assert track.cumulative_distance_for("haversine") is track.cumulative_distance_for("haversine")
+    assert track.cumulative_distance is track.cumulative_distance_for("geodesic")
+
+    with pytest.raises(ValueError):
+        AnalysisEngine.split_into_phases(track, distance_backend="flat")
+    with pytest.raises(ValueError):
+        StreamingSegmenter(distance_backend="planar")
+
+def test_file_summaries_merge():
+    stats = RunningStats([3, 1])
+    stats.merge(RunningStats([]))
+    stats.merge(RunningStats([5.5]))
+    assert (stats.count, stats.min, stats.max, stats.mean) == (3, 1, 5.5, 9.5 / 3)
+    assert RunningStats().describe() == {"min": 0, "avg": 0, "max": 0}
+
+    tables = [AnalysisEngine.phase_table(AnalysisEngine.split_into_phases(IgcReader().read(os.path.join("tests", "Data", name))))
+              for name in ("track1.igc", "track2.igc")]
+    merged = FileSummary.merge(FileSummary.from_phase_table(t) for t in tables)
+    both = pd.concat(tables)
+    walk_climbs = both[~both["is_flight"] & (both["rate"] > 0)]
+    assert merged.counts["total"] == 2
+    assert merged.phases[("walk", "climb", "rate")].count == len(walk_climbs)
+    assert merged.collection_stats()["walk"]["climb"]["elevation"]["max"] == round(walk_climbs["height"].max(), 2)
+    assert merged.files["walk_distance"].total == pytest.approx(both.loc[~both["is_flight"], "distance"].sum() / 1000.0)
+
+def test_quantile_sketch_error_bound():
+    values = np.random.default_rng(0).lognormal(6, 1, 20000)
+    exact = QuantileSketch(values[:100])
+    assert exact.rank_error == 0
+    assert exact.quantile(0.5) == np.sort(values[:100])[49]
+
+    # One small sketch per file, merged
+    sketch = QuantileSketch()
+    for chunk in np.array_split(values, 400):
+        sketch.merge(QuantileSketch(chunk))
+    assert sketch.count == len(values)
+    assert sum(len(level) for level in sketch.levels) < 2000
+    assert 0 < sketch.relative_error < 0.1
+    ordered = np.sort(values)
+    for q in (0.1, 0.5, 0.9):
+        rank = np.searchsorted(ordered, sketch.quantile(q), side="right")
+        assert abs(rank - q * len(values)) <= sketch.rank_error + 1
+
+def test_track_simplification_matches_douglas_peucker():
+    track = IgcReader().read(os.path.join("tests", "Data", "track1.igc"))
+    lat, lon = track.column("Lat"), track.column("Long")
+    lat_0 = lat.mean()
+    x = np.radians(lon - lon.mean()) * 6371008.8 * np.cos(np.radians(lat_0))
+    y = np.radians(lat - lat_0) * 6371008.8
+
+    def reference(first, last, tolerance):
+        # Recursive Douglas-Peucker on the distance to the segment
+        if last - first < 2:
+            return []
+        a, b = np.array([x[first], y[first]]), np.array([x[last], y[last]])
+        p = np.column_stack((x[first + 1:last], y[first + 1:last]))
+        t = np.clip((p - a) @ (b - a) / max((b - a) @ (b - a), 1e-300), 0, 1)
+        dist = np.hypot(*(p - a - np.outer(t, b - a)).T)
+        i = int(np.argmax(dist))
+        if dist[i] <= tolerance:
+            return []
+        i += first + 1
+        return reference(first, i, tolerance) + [i] + reference(i, last, tolerance)
+
+    track.build_simplification_levels([5, 25, 100])
+    for tolerance in (5, 25, 100):
+        rows = track.simplified_rows(tolerance)
+        assert rows.tolist() == [0] + reference(0, len(track) - 1, tolerance) + [len(track) - 1]
+    assert len(track.simplified_rows(100)) < len(track.simplified_rows(5)) < len(track)
+    assert len(track.simplified_rows(0)) == len(track)
+    assert (douglas_peucker_significance(lat, lon) >= douglas_peucker_significance(lat, lon, 5)).all()
+
+def test_lttb_downsampling():
+    rng = np.random.default_rng(1)
+    x = np.arange(5000.0)
+    y = np.cumsum(rng.normal(size=5000))
+    rows = lttb_indices(x, y, 200)
+
+    # Textbook implementation with a fixed bucket size
+    every = (len(x) - 2) / 198
+    expected, a = [0], 0
+    for i in range(198):
+        start, stop = int(i * every) + 1, int((i + 1) * every) + 1
+        nxt = slice(stop, int((i + 2) * every) + 1) if i < 197 else slice(len(x) - 1, len(x))
+        cx, cy = x[nxt].mean(), y[nxt].mean()
+        areas = [abs((x[a] - cx) * (y[j] - y[a]) - (x[a] - x[j]) * (cy - y[a])) for j in range(start, stop)]
+        a = start + int(np.argmax(areas))
+        expected.append(a)
+    assert rows.tolist() == expected + [len(x) - 1]
+    assert len(lttb_indices(x[:50], y[:50], 200)) == 50
+
+def test_track_downsampled_rows():
+    track = IgcReader().read(os.path.join("tests", "Data", "track1.igc"))
+    rows = track.downsampled_rows(100)
+    assert len(rows) == 100 and rows[0] == 0 and rows[-1] == len(track) - 1
+    assert track.downsampled_rows(100) is rows
+    assert track.downsampled_rows(100, rows=slice(200, 250)).tolist() == list(range(200, 250))